@@ -0,0 +1,121 @@
+"""Benchmark the download paths against a local mock CrossFit API server.
+
+Each download runs in a fresh process so its peak memory can be measured.
+Reports pages/s, rows/s and peak RSS of Cfopendata, Bulkdownload and
+Affiliatelist. The server latency, error rate and rate limit can be set to
+compare how the downloads cope.
+
+Example
+-------
+python benchmarks/bench_download.py --npages 500 --latency 0.05
+python benchmarks/bench_download.py --error-rate 0.05 --rate-limit 200
+python benchmarks/bench_download.py --npages 2000 --max-memory 20
+"""
+import argparse
+import multiprocessing
+import resource
+import shutil
+import tempfile
+import time
+
+
+from cfanalytics.core.affiliatelist import Affiliatelist
+from cfanalytics.core.bulk import Bulkdownload
+from cfanalytics.core.cfopendata import Cfopendata
+from cfanalytics.core.retry import Retrypolicy
+from cfanalytics.tests.mockserver import Mockserver
+
+
+def _run(name, url, args, out):
+    """Run one download and put its results on out."""
+    path = tempfile.mkdtemp()
+    retry = Retrypolicy(retries=5, base_delay=0.05, max_delay=2)
+    start_time = time.time()
+    if name.startswith('cfopendata'):
+        year = int(name.split('-')[1])
+        workers = None
+        if name.endswith('workers'):
+            workers = args.workers
+        # The download is what is timed
+        Cfopendata(year, 1, 0, path, retry=retry, workers=workers, url=url,
+                   max_memory=args.max_memory)
+        pages, rows = args.npages, args.npages * args.nrows
+    elif name == 'bulk':
+        b = Bulkdownload([2018], [1, 2], [0, 1], path, retry=retry, url=url,
+                         max_memory=args.max_memory)
+        pages = args.npages * len(b.downloads)
+        rows = pages * args.nrows
+    else:
+        a = Affiliatelist(path, retry=retry, url=url, lastaid=args.lastaid)
+        pages, rows = args.lastaid - 2, len(a.data)
+    seconds = time.time() - start_time
+    shutil.rmtree(path)
+    # ru_maxrss is in kilobytes on Linux
+    out.put({'pages': pages, 'rows': rows, 'seconds': seconds,
+             'peak_mb': resource.getrusage(
+                     resource.RUSAGE_SELF).ru_maxrss / 1024.})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--npages', type=int, default=200,
+                        help='pages of each leaderboard')
+    parser.add_argument('--nrows', type=int, default=50,
+                        help='athletes per page')
+    parser.add_argument('--lastaid', type=int, default=2000,
+                        help='last affiliate id')
+    parser.add_argument('--latency', type=float, default=0.02)
+    parser.add_argument('--jitter', type=float, default=0.01)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--rate-limit', type=float, default=None,
+                        help='requests per second')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='also run Cfopendata with parse processes')
+    parser.add_argument('--max-memory', type=float, default=None,
+                        help='memory budget in MB of each leaderboard')
+    parser.add_argument('--only', nargs='+', default=None,
+                        help='names of the downloads to run')
+    args = parser.parse_args()
+
+    names = ['cfopendata-2017', 'cfopendata-2018', 'bulk', 'affiliatelist']
+    if args.workers is not None:
+        names.insert(2, 'cfopendata-2018-workers')
+    if args.only is not None:
+        names = [n for n in names if n in args.only]
+
+    ctx = multiprocessing.get_context('spawn')
+    with Mockserver(npages=args.npages, nrows=args.nrows,
+                    lastaid=args.lastaid, latency=args.latency,
+                    jitter=args.jitter, error_rate=args.error_rate,
+                    rate_limit=args.rate_limit, seed=0) as server:
+        results = []
+        for name in names:
+            server.requests, server.errors, server.throttled = 0, 0, 0
+            out = ctx.Queue()
+            p = ctx.Process(target=_run, args=(name, server.url, args, out))
+            p.start()
+            p.join()
+            if p.exitcode == 0:
+                result = out.get()
+            else:
+                # e.g. the errors outlasted the retries
+                result = {'pages': 0, 'rows': 0, 'seconds': 1,
+                          'peak_mb': float('nan'), 'failed': True}
+            result.update({'name': name, 'requests': server.requests,
+                           'errors': server.errors + server.throttled})
+            results.append(result)
+
+    print('')
+    print('download'.ljust(24)+'pages/s'.rjust(10)+'rows/s'.rjust(12)+\
+          'peak MB'.rjust(10)+'requests'.rjust(10)+'errors'.rjust(8))
+    for r in results:
+        print(r['name'].ljust(24)+\
+              str(int(r['pages'] / r['seconds'])).rjust(10)+\
+              str(int(r['rows'] / r['seconds'])).rjust(12)+\
+              str(round(r['peak_mb'], 1)).rjust(10)+\
+              str(r['requests']).rjust(10)+str(r['errors']).rjust(8)+\
+              ('  failed' if r.get('failed') else ''))
+
+
+if __name__ == '__main__':
+    main()
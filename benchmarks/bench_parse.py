@@ -0,0 +1,80 @@
+"""Benchmark parsing leaderboard pages into a DataFrame.
+
+Compares the columnar parser used by Cfopendata with the old
+approach of building a one row DataFrame for each athlete and appending it.
+
+Example
+-------
+python benchmarks/bench_parse.py --nathletes 300000
+"""
+import argparse
+import time
+
+
+import pandas as pd
+
+
+from cfanalytics.core.parse import (new_buffers, parse_leaderboard,
+                                    buffers_to_frame)
+from cfanalytics.core.utils import open_wods
+from cfanalytics.tests.synthetic import leaderboard_page
+
+
+def _columns(year):
+    columns = ['User_id', 'Name', 'Height', 'Weight', 'Age', 'Region_id',
+               'Region_name', 'Affiliate_id', 'Overall_rank', 'Overall_score']
+    columns.extend(open_wods(year)['dfheader'].values)
+    return columns
+
+
+def bench_columnar(pages, year, wodscompleted, columns):
+    start_time = time.time()
+    buffers = new_buffers(columns)
+    for page in pages:
+        parse_leaderboard(page, year, wodscompleted, buffers)
+    df = buffers_to_frame(buffers, columns)
+    return time.time() - start_time, len(df)
+
+
+def bench_per_row(pages, year, wodscompleted, columns):
+    """The pre-columnar parser: one DataFrame per athlete."""
+    start_time = time.time()
+    data = pd.DataFrame(columns=columns)
+    buffers = new_buffers(columns)
+    for page in pages:
+        parse_leaderboard(page, year, wodscompleted, buffers)
+        rows = list(zip(*[buffers[c] for c in columns]))
+        buffers = new_buffers(columns)
+        for row in rows:
+            df = pd.DataFrame([row], columns=columns)
+            data = pd.concat([data, df])
+    return time.time() - start_time, len(data)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--nathletes', type=int, default=300000)
+    parser.add_argument('--per-row-nathletes', type=int, default=2000,
+                        help='athletes for the (quadratic) per row parser')
+    parser.add_argument('--nrows', type=int, default=50,
+                        help='athletes per page')
+    args = parser.parse_args()
+
+    for year in [2017, 2018]:
+        wodscompleted = int(open_wods(year)['wodscompleted'].values)
+        columns = _columns(year)
+        npages = max(1, args.nathletes // args.nrows)
+        pages = [leaderboard_page(year, p, npages, args.nrows)
+                 for p in range(1, npages + 1)]
+        t, n = bench_columnar(pages, year, wodscompleted, columns)
+        print(str(year)+' columnar: '+str(n)+' athletes in '+\
+              str(round(t, 2))+' s ('+str(int(n / t))+' athletes/s)')
+
+        npages = max(1, args.per_row_nathletes // args.nrows)
+        t, n = bench_per_row(pages[:npages], year, wodscompleted, columns)
+        print(str(year)+' per row:  '+str(n)+' athletes in '+\
+              str(round(t, 2))+' s ('+str(int(n / t))+' athletes/s)')
+
+
+if __name__ == '__main__':
+    main()
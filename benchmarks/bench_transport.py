@@ -0,0 +1,68 @@
+"""Benchmark the HTTP transports against a local mock CrossFit API server.
+
+Downloads the same leaderboard with Connectionpool (aiohttp, HTTP/1.1) and
+Http2pool (httpx, HTTP/2 without TLS) for each server latency. Reports
+pages/s and the number of connections the server saw. Needs httpx[http2].
+
+Example
+-------
+python benchmarks/bench_transport.py --npages 500 --latency 0.01 0.05 0.2
+"""
+import argparse
+import asyncio
+import shutil
+import tempfile
+import time
+
+
+from cfanalytics.core.cfopendata import Cfopendata
+from cfanalytics.core.session import Connectionpool, Http2pool
+from cfanalytics.tests.mockserver import Mockserver
+
+
+def _run(transport, latency, args):
+    """Download one leaderboard and return its results."""
+    http2 = transport == 'http2'
+    with Mockserver(npages=args.npages, nrows=args.nrows, latency=latency,
+                    jitter=args.jitter, seed=0, http2=http2) as server:
+        asyncio.set_event_loop(asyncio.new_event_loop())
+        if http2:
+            pool = Http2pool(prior_knowledge=True)
+        else:
+            pool = Connectionpool()
+        path = tempfile.mkdtemp()
+        start_time = time.time()
+        Cfopendata(2018, 1, 0, path, url=server.url, pool=pool)
+        seconds = time.time() - start_time
+        asyncio.get_event_loop().run_until_complete(pool.close())
+        shutil.rmtree(path)
+        return {'transport': transport, 'latency': latency,
+                'seconds': seconds, 'connections': server.connections,
+                'requests': server.requests}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--npages', type=int, default=200,
+                        help='pages of the leaderboard')
+    parser.add_argument('--nrows', type=int, default=50,
+                        help='athletes per page')
+    parser.add_argument('--latency', type=float, nargs='+',
+                        default=[0.01, 0.05, 0.2])
+    parser.add_argument('--jitter', type=float, default=0.0)
+    args = parser.parse_args()
+
+    results = [_run(transport, latency, args) for latency in args.latency
+               for transport in ['http1', 'http2']]
+
+    print('')
+    print('transport'.ljust(12)+'latency'.rjust(10)+'pages/s'.rjust(10)+\
+          'connections'.rjust(13)+'requests'.rjust(10))
+    for r in results:
+        print(r['transport'].ljust(12)+str(r['latency']).rjust(10)+\
+              str(int(args.npages / r['seconds'])).rjust(10)+\
+              str(r['connections']).rjust(13)+str(r['requests']).rjust(10))
+
+
+if __name__ == '__main__':
+    main()
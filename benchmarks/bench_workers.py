@@ -0,0 +1,95 @@
+"""Benchmark decoding and parsing leaderboard pages in a process pool.
+
+Each page body is sent to a worker which returns its columnar chunk, as
+Cfopendata does with workers=N. Pages are read from a Responsecache
+directory of recorded responses, or generated if none is given.
+
+Example
+-------
+python benchmarks/bench_workers.py --cache Data/cache --year 2018
+python benchmarks/bench_workers.py --workers 1 2 4 8 16
+"""
+import argparse
+import gzip
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+
+from cfanalytics.core.parse import new_buffers, parse_payload
+from cfanalytics.core.utils import open_wods
+from cfanalytics.tests.synthetic import leaderboard_page
+
+
+def _columns(year):
+    columns = ['User_id', 'Name', 'Height', 'Weight', 'Age', 'Region_id',
+               'Region_name', 'Affiliate_id', 'Overall_rank', 'Overall_score']
+    columns.extend(open_wods(year)['dfheader'].values)
+    return columns
+
+
+def recorded_pages(path, year):
+    """Leaderboard response bodies of a year in a Responsecache directory."""
+    if year == 2018:
+        rows = b'"leaderboardRows"'
+    else:
+        rows = b'"athletes"'
+    pages = []
+    for root, dirs, files in os.walk(path):
+        for file_ in files:
+            if not file_.endswith('.gz'):
+                continue
+            with gzip.open(os.path.join(root, file_), 'rb') as f:
+                payload = f.read()
+            if rows in payload[:200]:
+                pages.append(payload)
+    return pages
+
+
+def bench(pages, year, wodscompleted, columns, workers):
+    start_time = time.time()
+    buffers = new_buffers(columns)
+    n = len(pages)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for chunk in executor.map(parse_payload, pages, [year] * n,
+                                  [wodscompleted] * n, [columns] * n,
+                                  chunksize=4):
+            for c in columns:
+                buffers[c].extend(chunk[c])
+    return time.time() - start_time, len(buffers[columns[0]])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--cache', help='Responsecache directory')
+    parser.add_argument('--year', type=int, default=2018)
+    parser.add_argument('--npages', type=int, default=4000,
+                        help='pages to generate without --cache')
+    parser.add_argument('--nrows', type=int, default=50,
+                        help='athletes per generated page')
+    parser.add_argument('--workers', type=int, nargs='+',
+                        default=[1, 2, 4, 8, 16])
+    args = parser.parse_args()
+
+    wodscompleted = int(open_wods(args.year)['wodscompleted'].values)
+    columns = _columns(args.year)
+    if args.cache is not None:
+        pages = recorded_pages(args.cache, args.year)
+    else:
+        pages = [json.dumps(leaderboard_page(args.year, p, args.npages,
+                                             args.nrows)).encode('utf-8')
+                 for p in range(1, args.npages + 1)]
+    print(str(len(pages))+' pages, '+str(os.cpu_count())+' cores')
+    base = None
+    for workers in args.workers:
+        t, n = bench(pages, args.year, wodscompleted, columns, workers)
+        if base is None:
+            base = t
+        print(str(workers).rjust(2)+' workers: '+str(n)+' athletes in '+\
+              str(round(t, 2))+' s ('+str(int(n / t))+' athletes/s, '+\
+              str(round(base / t, 2))+'x)')
+
+
+if __name__ == '__main__':
+    main()
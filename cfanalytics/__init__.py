@@ -2,4 +2,15 @@ from .core.cfopendata import Cfopendata
 from .core.clean import Clean
 from .core.affiliatelist import Affiliatelist
 from .core.cfplot import Cfplot
-from .core.utils import open_wods
\ No newline at end of file
+from .core.utils import open_wods
+from .core.session import Connectionpool, Http2pool
+from .core.concurrency import Adaptivelimit
+from .core.retry import Retrypolicy
+from .core.cache import Responsecache
+from .core.bulk import Bulkdownload
+from .core.storage import (read_leaderboard, write_leaderboard,
+                           read_affiliates, write_affiliates)
+from .core.ratelimit import Ratelimiter, get_ratelimiter, set_ratelimiter
+from .core.metrics import Downloadmetrics
+from .core.spatial import Gymindex
+from .core.names import Nameindex
\ No newline at end of file
@@ -1,6 +1,5 @@
 import requests # HTTP library
 import asyncio # Asynchronous I/O
-from aiohttp import ClientSession # Asynchronous HTTP Client/Server
 
 
 import pandas as pd
@@ -9,20 +8,66 @@ import numpy as np
 
 import os
 import time
-import shutil
+import json
+
+
+from .session import Connectionpool
+from .concurrency import Adaptivelimit, cancel_tasks
+from .cache import Cachemiss
+from .storage import write_affiliates, read_affiliates
+from .spill import Spill
+from .ratelimit import get_ratelimiter
+from .metrics import Downloadmetrics
+from .retry import Retrypolicy
+from .parse import new_buffers, parse_affiliate, parse_all_affiliates
+from .spatial import Gymindex
+from .names import Nameindex
+from .utils import normalize_values
 
 
 class Affiliatelist(object):
     """An object to download CrossFit affiliate information.
     """
     
-    def __init__(self, path):
+    def __init__(self, path, pool=None, limit=None, retry=None, cache=None,
+                 store=None, url=None, lastaid=21363, ratelimiter=None,
+                 priority=0, metrics=None, download=True):
         """Crossfit affiliate data object.
         
         Parameters
         ----------
         path : str
             Directory where to save data.        
+        pool : Connectionpool or Http2pool, optional
+            Connection pool to download with. By default a Connectionpool
+            is created for this download and closed at the end.
+        limit : Adaptivelimit, optional
+            Limit of requests in flight. By default it starts at 10 and
+            adapts to the server.
+        retry : Retrypolicy, optional
+            Timeouts and retries of failed requests. By default 3 retries
+            with a 30 seconds timeout.
+        cache : Responsecache, optional
+            Cache of the responses. By default nothing is cached.
+        store : str, optional
+            Directory of a Parquet store to save the data in instead of a
+            pickle and CSV file. Needs pyarrow.
+        url : str, optional
+            Address of the affiliate map API, e.g. of a mock server. By
+            default https://map.crossfit.com.
+        lastaid : int
+            Last affiliate id to get.
+        ratelimiter : Ratelimiter, optional
+            Rate limiter of the requests. By default the one shared by the
+            process, see get_ratelimiter().
+        priority : int
+            Priority of the requests in the rate limiter. Lower goes first.
+        metrics : Downloadmetrics, optional
+            Metrics of the requests and parsing. A summary is printed and
+            saved to Affiliate_list_metrics.json at the end.
+        download : bool
+            Download the data straight away. Inside a running event loop,
+            e.g. in Jupyter, set this to False and await fetch() instead.
 
         Returns
         -------
@@ -32,17 +77,42 @@ class Affiliatelist(object):
         Example
         -------
         cfa.Affiliatelist('Data/')
+
+        a = cfa.Affiliatelist('Data/', download=False)
+        await a.fetch()
         """
         # Setup the name of the file to save
         self.dname = 'Affiliate_list'
         self.path = path
+        # Setup the connection pool shared by all batches
+        self._own_pool = pool is None
+        if self._own_pool:
+            pool = Connectionpool()
+        self.pool = pool
+        if retry is None:
+            retry = Retrypolicy()
+        self.retry = retry
+        self.cache = cache
+        self.store = store
+        if ratelimiter is None:
+            ratelimiter = get_ratelimiter()
+        self.ratelimiter = ratelimiter
+        self.priority = priority
+        if metrics is None:
+            metrics = Downloadmetrics()
+        self.metrics = metrics
         # Setup a directory to store the temporary files
         path2 = self.path+'/ind_files'
         self.path2 = path2
         if not os.path.isdir(path2):
             os.makedirs(path2)
+        # Rows of each batch are appended to one spill file. It is emptied
+        # when a download starts
+        self.spill = Spill(self.path2, self.dname)
 
-        self.basepath = 'https://map.crossfit.com'
+        if url is None:
+            url = 'https://map.crossfit.com'
+        self.basepath = url
         self.headers = {'Host': 'map.crossfit.com',
                'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_13_2'+\
                ') AppleWebKit/537.36 (KHTML, like Gecko) Chrome/63.0.3239.13'+\
@@ -52,213 +122,574 @@ class Affiliatelist(object):
         self.columns = ['Affiliate_id', 'Affiliate_name', 'Address', 'City',
                         'State', 'Zip', 'Country', 'Website', 'Phone']
         self.data = pd.DataFrame(columns=self.columns)
-        empty_df = pd.DataFrame(columns=self.columns) # Initiallized DataFrame
+        # Rows of the responses, in the order they arrive
+        self.buffers = new_buffers(self.columns)
+        # Affiliate ids which could not be downloaded and why
+        self.failed = {}
         
         # See https://map.crossfit.com/getAllAffiliates.php for a full list
         # of affiliate information. Column 3 is the Affiliate id
         self.startpage = 3 # First Affiliate id
-        self.aidcount = self.startpage
-        self.endpage = 21363 # Last Affiliate id
+        self.endpage = lastaid # Last Affiliate id
         self.npages = self.endpage - self.startpage + 1
         self.batchpages = 100
+        if limit is None:
+            limit = Adaptivelimit(initial=10)
+        self.limit = limit
         
-        ii = self.startpage
-        while ii <= int(self.npages/self.batchpages):
-            print('getting aids '+str(self.startpage)+'-'+str(self.startpage+\
-                  self.batchpages-1)+' of '+str(self.npages))
-            start_time = time.time()
-            self._ailoop()
-            print("that took " +\
-                  str(round((time.time() - start_time) / 60.0, 2)) +\
-                  " minutes")
-            # Save data after each _ailoop is called
-            self._save_df(ii, empty_df)
-            ii += 1
-            self.startpage = self.startpage + self.batchpages
-            
-        # Check if any pages left
-        if self.startpage <= self.npages:
-            # Update batchpages to however many pages are left     
-            self.batchpages = self.npages - self.startpage + 1
-            print('getting pages '+str(self.startpage)+'-'+str(self.startpage+\
-                  self.batchpages-1)+' of '+str(self.npages))
-            start_time = time.time() # Start time
-            self._ailoop()
-            print("that took " +\
-                  str(round((time.time() - start_time) / 60.0, 2)) +\
-                  " minutes")
-            self._save_df(ii, empty_df)
-            
-        # Append all data files
-        for root, dirs, files in os.walk(path2):
-            for file_ in files:
-                _df = pd.read_pickle(os.path.join(root, file_))
-                self.data = self.data.append(_df).reset_index(drop=True)
-                
-        self.data = self.data.sort_values(by=['Affiliate_id']) 
-        self.data = self.data.reset_index(drop=True)
-        
-        # Add latitude and longitude data
-        self._add_lat_lon()
-                
-        self.data.to_pickle(self.path+'/'+self.dname)
-        self.data.to_csv(path_or_buf=self.path+'/'+self.dname+'.csv')
-        
-        # Remove all files in ddii2
-        shutil.rmtree(self.path2)
+        if download:
+            self._ailoop(self.fetch())
+
+
+    async def fetch(self):
+        """async function that downloads and saves the affiliate list.
+
+        Can be awaited inside a running event loop, e.g. in Jupyter or an
+        aiohttp application, and alongside other tasks. The blocking parts,
+        getting the coordinates and writing the data, run in a thread.
+
+        Returns
+        -------
+        affiliatelist : pd.Dataframe
+            Affiliate data.
+
+        Example
+        -------
+        a = cfa.Affiliatelist('Data/', download=False)
+        df = await a.fetch()
+        """
+        aioloop = asyncio.get_event_loop()
+        self.spill.remove()
+        try:
+            print('getting aids '+str(self.startpage)+'-'+str(self.endpage)+\
+                  ' ('+str(self.npages)+')')
+            await self._fetch(range(self.startpage, self.endpage + 1))
+            print('Settled on a '+self.limit.summary())
+            if self.cache is not None:
+                print(self.cache.summary())
+            if self.ratelimiter.limited(self.basepath):
+                print(self.ratelimiter.summary(self.basepath))
+            print(self.metrics.describe())
+            self.metrics.save(self.path+'/'+self.dname+'_metrics.json')
         
+            self.data = self._read_spill()
         
-    def _ailoop(self):
+            # Add latitude and longitude data and save
+            await aioloop.run_in_executor(None, self._finish)
+        finally:
+            # Close the connection pool
+            if self._own_pool:
+                await self.pool.close()
+        return self.data
+
+
+    def _finish(self):
+        """Add the coordinates to the affiliates and save them.
+
+        Returns
+        -------
+        affiliatelist : pd.Dataframe
+            Affiliate data.
+        """
+        self._add_lat_lon(self._get_all_affiliates())
+        self._save()
+        self._cleanup()
+        return self.data
+
+
+    def _save(self):
+        """Write self.data to the store or to a pickle and CSV file, and the
+        spatial and name indexes of the gyms next to it."""
+        if self.store is not None:
+            write_affiliates(self.data, self.store)
+        else:
+            self.data.to_pickle(self.path+'/'+self.dname)
+            self.data.to_csv(path_or_buf=self.path+'/'+self.dname+'.csv')
+        Gymindex(self.path, self.dname).build(self.data).save()
+        Nameindex(self.path, self.dname).build(self.data).save()
+
+
+    def _cleanup(self):
+        """Remove the temporary files of this download only."""
+        self.spill.remove()
+        if len(os.listdir(self.path2)) == 0:
+            os.rmdir(self.path2)
+
+
+    def refresh(self):
+        """Update the saved affiliate list with the affiliates which are new
+        or changed since it was downloaded. See fetch_changes().
+
+        Returns
+        -------
+        changelog : pd.DataFrame
+            Affiliate_id, Change ('added' or 'changed'), the changed Columns
+            and the time of the refresh.
+
+        Example
+        -------
+        a = cfa.Affiliatelist('Data/', download=False)
+        changelog = a.refresh()
+        """
+        aioloop = asyncio.get_event_loop()
+        return aioloop.run_until_complete(self.fetch_changes())
+
+
+    async def fetch_changes(self):
+        """async function that updates the saved affiliate list with the
+        affiliates which are new or changed since it was downloaded.
+
+        getAllAffiliates.php lists the id, name and location of every
+        affiliate in one response. Details are only requested for the ids
+        which are not in the saved list, whose name or location changed, or
+        which are above the last saved id, so a refresh makes a few hundred
+        requests instead of one for every id. Affiliates missing from
+        getAllAffiliates.php are kept, as affiliates without a location are
+        not in it. The changed rows are appended to
+        Affiliate_list_changelog.csv.
+
+        Returns
+        -------
+        changelog : pd.DataFrame
+            Affiliate_id, Change ('added' or 'changed'), the changed Columns
+            and the time of the refresh.
+
+        Example
+        -------
+        a = cfa.Affiliatelist('Data/', download=False)
+        changelog = await a.fetch_changes()
+        """
+        aioloop = asyncio.get_event_loop()
+        print('Refreshing '+self.dname)
+        self.spill.remove()
+        saved = await aioloop.run_in_executor(None, self._load)
+        try:
+            response = await aioloop.run_in_executor(
+                    None, self._get_all_affiliates)
+            aids = self._changed_aids(saved, response)
+            print('getting '+str(len(aids))+' new or changed affiliates')
+            await self._fetch(aids)
+            print(self.metrics.describe())
+            self.metrics.save(self.path+'/'+self.dname+'_metrics.json')
+            changelog = await aioloop.run_in_executor(
+                    None, self._write_changes, saved, response)
+        finally:
+            if self._own_pool:
+                await self.pool.close()
+        return changelog
+
+
+    def _load(self):
+        """Read the saved affiliate list.
+
+        Returns
+        -------
+        affiliatelist : pd.Dataframe
+            Affiliate data.
+        """
+        if self.store is not None:
+            return read_affiliates(self.store)
+        fname = self.path+'/'+self.dname
+        if not os.path.isfile(fname):
+            raise OSError(fname+' does not exist. Download the data before '+\
+                          'refreshing it')
+        return pd.read_pickle(fname)
+
+
+    def _changed_aids(self, saved, response):
+        """Affiliate ids to get the details of.
+
+        Parameters
+        ----------
+        saved : pd.DataFrame
+            Saved affiliate list.
+        response : dict
+            getAllAffiliates.php response from _get_all_affiliates().
+
+        Returns
+        -------
+        aids : list
+            Ids which are not saved, whose name or location changed, and
+            the ids above the last saved id, in ascending order.
+        """
+        aids = response['Affiliate_id']
+        if len(aids) == 0:
+            return []
+        old = saved.drop_duplicates('Affiliate_id', keep='last')
+        old_aids = old['Affiliate_id'].values.astype(np.int64)
+        ix, known = _join(old_aids, aids)
+        ix = ix[known]
+
+        # Locations are compared as numbers, missing ones as NaN
+        common = aids[known]
+        names = old['Affiliate_name'].values[ix].astype(str)
+        changed = names != response['Affiliate_name'][known].astype(str)
+        for col in ['Latitude', 'Longitude']:
+            if col not in old.columns:
+                changed[:] = True
+                continue
+            before = pd.to_numeric(old[col], errors='coerce').values[ix]
+            changed |= ~np.isclose(before, response[col][known],
+                                  equal_nan=True)
+
+        # Affiliates without a location are not listed. Probe the ids after
+        # the last saved one
+        last = old_aids.max() if len(old) > 0 else self.startpage - 1
+        after = np.arange(last + 1, max(aids.max(), last) + 1)
+        out = set(aids[~known]) | set(common[changed]) | set(after)
+        return sorted(int(aid) for aid in out)
+
+
+    def _write_changes(self, saved, response):
+        """Merge the new and changed affiliates into the saved ones and save
+        them.
+
+        Parameters
+        ----------
+        saved : pd.DataFrame
+            Saved affiliate list.
+        response : dict
+            getAllAffiliates.php response from _get_all_affiliates().
+
+        Returns
+        -------
+        changelog : pd.DataFrame
+            Changed and added rows.
+        """
+        new = self._read_spill()
+        new = new.drop_duplicates('Affiliate_id', keep='last')
+        new = new.set_index(new['Affiliate_id'].astype(int))
+        old = saved.drop_duplicates('Affiliate_id', keep='last')
+        old = old.set_index(old['Affiliate_id'].astype(int))
+
+        cols = [c for c in self.columns if c != 'Affiliate_id']
+        merged = old[self.columns].astype(object)
+        common = new.index.intersection(merged.index)
+        added = new.index.difference(merged.index)
+        merged.loc[common, cols] = new.loc[common, cols].values
+        merged = pd.concat([merged, new.loc[added, self.columns]])
+        self.data = merged.sort_index().reset_index(drop=True)
+        self._add_lat_lon(response)
+
+        # Compare values as they are written out, locations included
+        after = self.data.set_index(self.data['Affiliate_id'].astype(int))
+        cols = [c for c in after.columns if c != 'Affiliate_id' and
+                c in old.columns]
+        common = old.index.intersection(after.index)
+        diff = normalize_values(old.loc[common, cols]) != \
+               normalize_values(after.loc[common, cols])
+        changed = common[diff.any(axis=1).values]
+
+        refreshed = time.strftime('%Y-%m-%dT%H:%M:%S')
+        rows = [[aid, 'changed', ','.join(diff.columns[diff.loc[aid].values]),
+                 refreshed] for aid in changed]
+        rows += [[aid, 'added', '', refreshed] for aid in added]
+        changelog = pd.DataFrame(rows, columns=['Affiliate_id', 'Change',
+                                                'Columns', 'Refreshed'])
+        fname = self.path+'/'+self.dname+'_changelog.csv'
+        changelog.to_csv(path_or_buf=fname, mode='a', index=False,
+                         header=not os.path.isfile(fname))
+        print(self.dname+': '+str(len(changed))+' affiliates changed, '+\
+              str(len(added))+' added')
+        self._save()
+        self._cleanup()
+        return changelog
+
+
+    def _ailoop(self, aicoro):
         """Create a concurrent loop.
         
         See https://www.blog.pythonlibrar\y.org/2016/07/26/python-3-an-intro\
         -to-asyncio/
+        
+        Parameters
+        ----------
+        aicoro : coroutine
+            Coroutine to run.
         """
         aioloop = asyncio.get_event_loop()
-        aifuture = asyncio.ensure_future(self._loop_pages())
+        aifuture = asyncio.ensure_future(aicoro)
         aioloop.run_until_complete(aifuture)
 
         
-    async def _loop_pages(self):
-        """async function that creates semaphores and does http requests
-        by a segmented number of pages.
-        
+    async def _fetch(self, aids):
+        """async function that downloads the affiliate ids. Ids which still
+        fail after their retries are tried again once all the others are
+        downloaded.
+
+        Parameters
+        ----------
+        aids : list
+            Affiliate ids to get.
+        """
+        await self._loop_pages(aids)
+        for i in range(self.retry.requeues):
+            if len(self.failed) == 0:
+                break
+            aids = sorted(self.failed)
+            self.failed = {}
+            await asyncio.sleep(self.retry.delay(self.retry.retries + i))
+            print('retrying '+str(len(aids))+' failed aids')
+            await self._loop_pages(aids)
+        if len(self.failed) > 0:
+            print('Could not get '+str(len(self.failed))+' aids:')
+            for aid in sorted(self.failed):
+                print('aid '+str(aid)+': '+self.failed[aid])
+
+
+    async def _loop_pages(self, aids):
+        """async function that does http requests for the affiliate ids. The
+        number of requests in flight is set by self.limit.
+
+        A fixed number of workers, as many as self.limit allows at most,
+        take the ids in turn so a slow response doesn't hold up the next
+        ones. Each response comes back with the id it was requested with
+        and is parsed as soon as it arrives. The rows are appended to the
+        spill file every self.batchpages responses.
+
+        Parameters
+        ----------
+        aids : list
+            Affiliate ids to get.
+
         Returns
         -------
         Calls ._download_page()
-        Calls ._get_data()
+        Calls parse_affiliate()
         """
-        async_list = []
-        sem = asyncio.Semaphore(self.batchpages) # create asyncio.locks.Semaph\
-        #ore object
-        async with ClientSession() as session:
-            for p in range(self.startpage, self.startpage+self.batchpages):
-                self.p = p
-                self.params={"aid": self.p}
-                task = asyncio.ensure_future(self._download_page(sem, session))            
-                async_list.append(task)
-                results = await asyncio.gather(*async_list)
-
-        # Loop through the batch pages    
-        for page in results:
-            self._get_data(page)
+        aids_left = iter(aids)
+        # Responses waiting to be parsed
+        results = asyncio.Queue(maxsize=self.batchpages)
+
+        async def work():
+            try:
+                for aid in aids_left:
+                    await results.put(await self._download_page(
+                            self.limit, {"aid": aid}))
+            except Exception as e:
+                # Stop the download rather than wait for the missing ids
+                await results.put(e)
 
+        workers = [asyncio.ensure_future(work())
+                   for i in range(min(len(aids), self.limit.maximum))]
+        start_time = time.time()
+        try:
+            for ndone in range(1, len(aids) + 1):
+                result = await results.get()
+                if isinstance(result, Exception):
+                    raise result
+                aid, response = result
+                if response is not None:
+                    parse_time = time.time()
+                    nrows = parse_affiliate(aid, response, self.buffers)
+                    self.metrics.parsed(time.time() - parse_time, nrows)
+                if ndone % self.batchpages == 0 or ndone == len(aids):
+                    # Save data after each batch
+                    self._save_df()
+                    print('got '+str(ndone)+' of '+str(len(aids))+\
+                          ' aids in '+\
+                          str(round((time.time() - start_time) / 60.0, 2))+\
+                          " minutes ("+self.pool.summary()+\
+                          ", in flight limit: "+str(self.limit.limit)+")")
+                    self.pool.new_batch()
+        finally:
+            await cancel_tasks(workers)
             
-    async def _download_page(self, sem, session):
-        """ async function that checks semaphore unlocked before calling the
-        get function.
+    async def _download_page(self, limit, params):
+        """ async function that waits for the concurrency limit before calling
+        the get function and reports the latency and status back to it.
+        Failed requests are retried with a jittered exponential backoff.
         
         Parameters
         ----------
-        sem : int
-            Semaphore.
-        session : aiohttp.client.ClientSession  
+        limit : Adaptivelimit
+            Concurrency limit.
+        params : dict
+            Request parameters.
         
         Returns
         -------
-        Calls ._get_page
+        aid : int
+            Affiliate id of the request.
+        response : dict
+            None if every attempt failed. The id and error are added to
+            self.failed.
         """
-        async with sem:
-            return await self._get_page(session)
+        aid = params['aid']
+        # Cached pages don't count towards the concurrency limit
+        if self.cache is not None:
+            try:
+                payload = self.cache.get(self.basepath+'/getAffiliateInfo',
+                                         params)
+                if payload is not None:
+                    return aid, json.loads(payload)
+            except (Cachemiss, ValueError) as e:
+                # e.g. offline and not cached
+                self.failed[aid] = type(e).__name__+': '+str(e)
+                return aid, None
+        for attempt in range(self.retry.retries + 1):
+            # Requests wait for the rate limiter first so they are served
+            # in priority order, not in the order they got a slot
+            await self.ratelimiter.acquire(self.basepath, self.priority)
+            await limit.acquire()
+            try:
+                start_time = time.time()
+                error = None
+                try:
+                    payload = await self._get_page(params)
+                    response = json.loads(payload)
+                except self.retry.exceptions as e:
+                    error = e
+                latency = time.time() - start_time
+            except BaseException:
+                # Cancelled, or an error which is not retried. Give the slot
+                # back so a shared limit doesn't lose it
+                await limit.cancel()
+                raise
+            if error is None:
+                await limit.release(latency, 200)
+                self.metrics.request(latency, 200, len(payload))
+                # Only cache responses which could be parsed
+                if self.cache is not None:
+                    self.cache.put(self.basepath+'/getAffiliateInfo',
+                                   payload, params)
+                return aid, response
+            await limit.release(latency, self.retry.status(error))
+            self.metrics.request(latency, self.retry.status(error))
+            if self.retry.status(error) == 429:
+                self.ratelimiter.throttled(self.basepath,
+                                           self.retry.retry_after(error))
+            if not self.retry.retryable(error):
+                break
+            if attempt < self.retry.retries:
+                self.metrics.retry()
+                await asyncio.sleep(self.retry.delay(attempt))
+        self.failed[aid] = self.retry.describe(error)
+        return aid, None
         
 
-    async def _get_page(self, session):
-        """ async function that makes HTTP GET requests.
+    async def _get_page(self, params):
+        """ async function that makes HTTP GET requests through self.pool.
     
 
         Parameters
         ----------
-        session : aiohttp.client.ClientSession 
+        params : dict
+            Request parameters.
         
         Returns
         -------        
-        out : JSON response object.
+        payload : bytes
+            JSON response.
         """
-        async with session.get(self.basepath+'/getAffiliateInfo',
-                               params=self.params,
-                               headers=self.headers) as response: 
-            out = await response.json(content_type='text/html')
-            return out
+        response = await self.pool.get(self.basepath+'/getAffiliateInfo',
+                                       params=params, headers=self.headers,
+                                       timeout=self.retry.timeout)
+        return response.body
 
 
-    def _get_data(self, response):
-        """Get data from response.
-        
-        Parameters
-        ----------
-        response : dict
-            Response.
+    def _save_df(self):
+        """Append the rows in the buffers to the spill file.
 
         Returns
         -------
-        data : pd.Dateframe
-            Append data to self.data.
-        """      
-        aid = self.aidcount
-        name = response['name']
-        if name is not None:
-            ad = response['address']
-            c = response['city']
-            s = response['state']  
-            z = response['zip']  
-            co = response['country']  
-            w = response['website']
-            ph = response['phone']
-            row = [[aid, name, ad, c, s, z, co, w, ph]]
-            df = pd.DataFrame(row, columns=self.columns)
-            self.data = self.data.append(df)
-        self.aidcount += 1
-        
-        
-    def _save_df(self, ii, empty_df):
-        """Save pandas.DataFrame.
-        
-        Parameters
-        ----------
-        ii : int
-            Batchpages counter.
-        empty_df : pd.DataFrame.
-            Empty pandas DataFrame with coloumns already added.
+        spill : Spill
+            Appends the rows and empties self.buffers
+        """
+        self.spill.append(len(self.spill.keys()), self.buffers)
+        self.buffers = new_buffers(self.columns)
+        return self
+
+
+    def _read_spill(self):
+        """Read the rows of the spill file in Affiliate_id order.
 
         Returns
         -------
-        data : pd.Dateframe
-            Saves file and make self.data empty
+        affiliatelist : pd.Dataframe
+            Affiliate data.
         """
-        self.data_tmp = self.data.reset_index(drop=True)
-        self.dname_tmp = 'Affiliate_list'+str(ii).zfill(5)
-        self.data_tmp.to_pickle(self.path2+'/'+self.dname_tmp)
-        self.data = empty_df
-        return self
-    
-    
-    def _add_lat_lon(self):
+        df = self.spill.read(self.columns)
+        # Responses arrive in any order
+        order = np.argsort(df['Affiliate_id'].values.astype(int),
+                           kind='stable')
+        return df.iloc[order].reset_index(drop=True)
+
+
+    def _get_all_affiliates(self):
+        """Download getAllAffiliates.php, the location, name and id of every
+        affiliate. The response is decoded as it arrives.
+
+        Returns
+        -------
+        response : dict
+            Affiliate_id, Latitude, Longitude and Affiliate_name arrays, see
+            parse_all_affiliates().
+        """
+        url = self.basepath+'/getAllAffiliates.php'
+        payload = None
+        if self.cache is not None:
+            payload = self.cache.get(url)
+        if payload is not None:
+            return parse_all_affiliates([payload])
+        self.ratelimiter.wait(url)
+        with requests.get(url, headers=self.headers,
+                          timeout=self.retry.timeout, stream=True) as r:
+            r.raise_for_status()
+            if self.cache is None:
+                return parse_all_affiliates(r.iter_content(chunk_size=65536))
+            payload = r.content
+        self.cache.put(url, payload)
+        return parse_all_affiliates([payload])
+
+
+    def _add_lat_lon(self, response):
         """Add latitude and longitude to the Affiliate list data.
         
+        Parameters
+        ----------
+        response : dict
+            getAllAffiliates.php response from _get_all_affiliates().
+
         Returns
         -------
         data : pd.Dateframe
-            Adds a latitude and longitude colomn
+            Adds float Latitude and Longitude columns, NaN for the affiliates
+            without a location.
         """
-        self.data["Latitude"] = ""
-        self.data["Longitude"] = ""
-        
-        response = requests.get(self.basepath+'/getAllAffiliates.php').json()
-        r = np.array(response)
-        ids_with_lat_lon = r[:,3].astype(int)
-        lats = r[:,0].astype(np.float64)
-        lons = r[:,1].astype(np.float64)
-        
-        ids = self.data['Affiliate_id'].values.astype(int)
-        # Find ids in ids_with_lat_lon
-        ix = np.where(np.in1d(ids_with_lat_lon, ids))[0]
-        sub_ids_with_lat_lon = ids_with_lat_lon[ix]
-        sub_lats = lats[ix]
-        sub_lons = lons[ix]        
-
-        datatmp = self.data.set_index('Affiliate_id')
-        datatmp.loc[sub_ids_with_lat_lon,'Latitude'] = sub_lats
-        datatmp.loc[sub_ids_with_lat_lon,'Longitude'] = sub_lons
-        self.data["Latitude"] = datatmp["Latitude"].values
-        self.data["Longitude"] = datatmp["Longitude"].values
-        return self
\ No newline at end of file
+        ids = self.data['Affiliate_id'].values.astype(np.int64)
+        ix, found = _join(response['Affiliate_id'], ids)
+        for col in ['Latitude', 'Longitude']:
+            values = np.full(len(ids), np.nan)
+            values[found] = response[col][ix[found]]
+            self.data[col] = values
+        return self
+
+
+def _join(keys, ids):
+    """Sorted key join: the position in keys of each id.
+
+    Parameters
+    ----------
+    keys : np.ndarray
+        Integer keys. The last of repeated keys is used.
+    ids : np.ndarray
+        Integer ids to find.
+
+    Returns
+    -------
+    ix : np.ndarray
+        Position in keys of each id, only valid where found.
+    found : np.ndarray
+        Whether each id is in keys.
+    """
+    if len(keys) == 0:
+        return np.zeros(len(ids), dtype=np.int64), np.zeros(len(ids), bool)
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+    # Keep the last of each run of a repeated key
+    last = np.append(sorted_keys[1:] != sorted_keys[:-1], True)
+    order, sorted_keys = order[last], sorted_keys[last]
+    pos = np.minimum(np.searchsorted(sorted_keys, ids), len(sorted_keys) - 1)
+    found = sorted_keys[pos] == ids
+    return order[pos], found
@@ -0,0 +1,88 @@
+import zlib
+
+
+from .spill import Recordfile
+
+
+class Rawarchive(Recordfile):
+    """A compressed, append-only archive of the raw responses of a download,
+    indexed by page number.
+    """
+
+    # Extension of the file
+    suffix = '.archive'
+
+    def __init__(self, path, dname, level=6):
+        """Raw response archive object.
+
+        One file per download, e.g. path/Men_Rx_2018_raw.archive. Each
+        record is a page number and the zlib compressed response. The index
+        of the pages is built from the record headers when the file is
+        opened, so a page is read with one seek. A page archived again
+        replaces the earlier record.
+
+        Parameters
+        ----------
+        path : str
+            Directory of the archive.
+        dname : str
+            Name of the download e.g. 'Men_Rx_2018_raw'.
+        level : int
+            zlib compression level (1-9).
+
+        Example
+        -------
+        archive = Rawarchive('Data/archive', 'Men_Rx_2018_raw')
+        archive.append(2, payload)
+        payload = archive.page(2)
+        """
+        super(Rawarchive, self).__init__(path, dname)
+        self.level = level
+
+
+    def append(self, key, payload):
+        """Archive the response of a page.
+
+        Parameters
+        ----------
+        key : int
+            Page number.
+        payload : bytes
+            Response body.
+        """
+        self._write(key, zlib.compress(payload, self.level))
+
+
+    def page(self, key):
+        """Response of a page.
+
+        Parameters
+        ----------
+        key : int
+            Page number.
+
+        Returns
+        -------
+        payload : bytes
+            Response body.
+        """
+        for key, payload in self.chunks([key]):
+            return payload
+
+
+    def chunks(self, keys=None):
+        """Iterate over the responses in page order.
+
+        Parameters
+        ----------
+        keys : list, optional
+            Page numbers to read. By default all pages.
+
+        Yields
+        ------
+        key : int
+        payload : bytes
+            Response body.
+        """
+        for key, payload in self._records(keys):
+            yield key, zlib.decompress(payload)
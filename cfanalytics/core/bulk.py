@@ -0,0 +1,198 @@
+import asyncio # Asynchronous I/O
+from concurrent.futures import ProcessPoolExecutor
+
+
+import time
+
+
+from .cfopendata import Cfopendata
+from .session import Connectionpool
+from .concurrency import Adaptivelimit, cancel_tasks
+from .memory import Memorymonitor
+
+
+class Bulkdownload(object):
+    """An object to download several divisions and years of CrossFit open
+    data in one pass.
+    """
+
+    def __init__(self, years, divisions, scaled, path, pool=None, limit=None,
+                 retry=None, cache=None, store=None, workers=None,
+                 url=None, ratelimiter=None, max_memory=None, metrics=None,
+                 archive=None, download=True):
+        """Bulk Crossfit open data object.
+
+        The number of pages of every download is found concurrently, then
+        all pages go through one connection pool and one concurrency limit.
+        The biggest downloads are started first. Each division is saved to
+        its own file as Cfopendata does.
+
+        Parameters
+        ----------
+        years : list
+            Years to download e.g. [2017, 2018].
+        divisions : list
+            Numerical values of the divisions (1-19). See Cfopendata.
+        scaled : list
+            0 : Rx, 1 : Sc e.g. [0, 1].
+        path : str
+            Directory where to save data.
+        pool : Connectionpool or Http2pool, optional
+            Connection pool shared by all downloads.
+        limit : Adaptivelimit, optional
+            Limit of requests in flight shared by all downloads.
+        retry : Retrypolicy, optional
+            Timeouts and retries of failed pages.
+        cache : Responsecache, optional
+            Cache of the responses.
+        store : str, optional
+            Directory of a Parquet store to save the data in.
+        workers : int, optional
+            Number of processes shared by all downloads to parse pages in.
+        url : str, optional
+            Address of the CrossFit Games API, e.g. of a mock server.
+        ratelimiter : Ratelimiter, optional
+            Rate limiter of the requests. By default the one shared by the
+            process. Requests of the divisions with the fewest pages left go
+            first.
+        max_memory : float, optional
+            Memory budget in MB of each download, see Cfopendata.
+        metrics : Downloadmetrics, optional
+            Metrics shared by all downloads. By default each download has its
+            own.
+        archive : str, optional
+            Directory of the archive of the raw responses, see Cfopendata.
+        download : bool
+            Download the data straight away. Inside a running event loop,
+            e.g. in Jupyter, set this to False and await fetch() instead.
+
+        Returns
+        -------
+        downloads : list
+            Cfopendata of each year, division and scaled.
+
+        Example
+        -------
+        cfa.Bulkdownload([2018], range(1, 20), [0, 1], 'Data/')
+        """
+        self.path = path
+        self._own_pool = pool is None
+        if self._own_pool:
+            pool = Connectionpool()
+        self.pool = pool
+        if limit is None:
+            limit = Adaptivelimit(initial=30)
+        self.limit = limit
+
+        self.downloads = [Cfopendata(y, d, s, self.path, pool=self.pool,
+                                     limit=self.limit, retry=retry,
+                                     cache=cache, store=store, url=url,
+                                     ratelimiter=ratelimiter,
+                                     max_memory=max_memory,
+                                     metrics=metrics, archive=archive,
+                                     download=False)
+                          for y in years for d in divisions for s in scaled]
+        self.executor = None
+        if workers is not None:
+            self.executor = ProcessPoolExecutor(max_workers=workers)
+            for download in self.downloads:
+                download.workers = workers
+                download._executor = self.executor
+
+        # Peak memory of each phase of the bulk download
+        self.memory = Memorymonitor()
+        if download:
+            asyncio.get_event_loop().run_until_complete(self.fetch())
+
+
+    async def fetch(self):
+        """async function that downloads and saves every division.
+
+        Can be awaited inside a running event loop, e.g. in Jupyter, and
+        alongside other tasks. Saving the data runs in a thread.
+
+        Returns
+        -------
+        downloads : list
+            Cfopendata of each year, division and scaled.
+
+        Example
+        -------
+        b = cfa.Bulkdownload([2018], [1, 2], [0, 1], 'Data/', download=False)
+        await b.fetch()
+        """
+        aioloop = asyncio.get_event_loop()
+        start_time = time.time()
+        try:
+            with self.memory.phase('plan'):
+                plan = await self._plan()
+            with self.memory.phase('download'):
+                await self._fetch(plan)
+            with self.memory.phase('write'):
+                for download in self.downloads:
+                    await aioloop.run_in_executor(None, download._finish)
+        finally:
+            # Also when a phase failed
+            if self._own_pool:
+                await self.pool.close()
+            if self.executor is not None:
+                await aioloop.run_in_executor(None, self.executor.shutdown)
+        download = self.downloads[0]
+        if download.ratelimiter.limited(download.basepath):
+            print(download.ratelimiter.summary(download.basepath))
+        print("Bulk download took " +\
+              str(round((time.time() - start_time) / 60.0, 2)) + " minutes ("+\
+              self.memory.summary()+")")
+        return self.downloads
+
+
+    async def _plan(self):
+        """async function that finds the number of pages of every download
+        concurrently and which pages are left to get.
+
+        Returns
+        -------
+        plan : list
+            Tuples of Cfopendata and pages. Largest first.
+        """
+        aioloop = asyncio.get_event_loop()
+        npages = await asyncio.gather(*[
+                aioloop.run_in_executor(None, download._get_npages)
+                for download in self.downloads])
+        plan = []
+        for download, n in zip(self.downloads, npages):
+            pages = download._plan(n)
+            # Small divisions get their requests through first
+            download.priority = len(pages)
+            plan.append((download, pages))
+        plan = sorted(plan, key=lambda dp: len(dp[1]), reverse=True)
+        print('Downloading '+str(sum(len(dp[1]) for dp in plan))+\
+              ' pages of '+str(len(plan))+' divisions')
+        for download, pages in plan:
+            print(download.dname+': '+str(len(pages))+' of '+\
+                  str(download.npages)+' pages')
+        return plan
+
+
+    async def _fetch(self, plan):
+        """async function that downloads all the pages of the plan. An error
+        in one download cancels the others and is raised.
+
+        Parameters
+        ----------
+        plan : list
+            Tuples of Cfopendata and pages.
+        """
+        tasks = [asyncio.ensure_future(download._fetch(pages))
+                 for download, pages in plan]
+        if len(tasks) == 0:
+            return
+        try:
+            done, pending = await asyncio.wait(
+                    tasks, return_when=asyncio.FIRST_EXCEPTION)
+        finally:
+            await cancel_tasks(tasks)
+        failed = [t for t in done if not t.cancelled() and
+                  t.exception() is not None]
+        if len(failed) > 0:
+            raise failed[0].exception()
@@ -0,0 +1,193 @@
+import gzip
+import hashlib
+import json
+import os
+import time
+
+
+class Cachemiss(LookupError):
+    """A response is not in the cache and the cache is offline.
+    """
+
+
+class Responsecache(object):
+    """An on-disk cache of HTTP responses.
+    """
+
+    def __init__(self, path, ttl=None, max_size=None, offline=False):
+        """HTTP response cache object.
+
+        Responses are stored gzip compressed in a file named after the
+        sha256 of the URL and the request parameters. Entries older than ttl
+        are treated as missing. When the cache is bigger than max_size the
+        least recently used entries are removed. An offline cache never
+        lets a request go to the network: a missing entry raises Cachemiss.
+
+        Parameters
+        ----------
+        path : str
+            Directory of the cache.
+        ttl : float, optional
+            Seconds an entry is valid for. By default entries never expire
+            which is fine for a finished Open.
+        max_size : int, optional
+            Maximum size of the cache in bytes (compressed).
+        offline : bool
+            Only replay the cache.
+
+        Example
+        -------
+        cache = Responsecache('Data/cache')
+        cfa.Cfopendata(2017, 1, 0, 'Data/', cache=cache)
+        # Later, without a network connection
+        cfa.Cfopendata(2017, 1, 0, 'Data/',
+        ...            cache=Responsecache('Data/cache', offline=True))
+        """
+        self.path = path
+        self.ttl = ttl
+        self.max_size = max_size
+        self.offline = offline
+        self.hits = 0
+        self.misses = 0
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+        self._scan()
+
+
+    def _scan(self):
+        """Index the entries already on disk.
+
+        Returns
+        -------
+        self._index : dict
+            Key with size in bytes and last access time.
+        """
+        self._index = {}
+        self.size = 0
+        for root, dirs, files in os.walk(self.path):
+            for file_ in files:
+                if not file_.endswith('.gz'):
+                    continue
+                st = os.stat(os.path.join(root, file_))
+                self._index[file_[:-3]] = [st.st_size, st.st_atime]
+                self.size += st.st_size
+        return self
+
+
+    def key(self, url, params=None):
+        """Key of a request.
+
+        Parameters
+        ----------
+        url : str
+        params : dict, optional
+            Request parameters.
+
+        Returns
+        -------
+        key : str
+            Hex sha256 of the request.
+        """
+        if params is None:
+            params = {}
+        request = json.dumps([url, sorted((str(k), str(v))
+                                          for k, v in params.items())])
+        return hashlib.sha256(request.encode('utf-8')).hexdigest()
+
+
+    def _fname(self, key):
+        return os.path.join(self.path, key[:2], key+'.gz')
+
+
+    def get(self, url, params=None):
+        """Get a response from the cache.
+
+        Parameters
+        ----------
+        url : str
+        params : dict, optional
+            Request parameters.
+
+        Returns
+        -------
+        payload : bytes or None
+            Response body. None if it is not cached or has expired.
+        """
+        key = self.key(url, params)
+        fname = self._fname(key)
+        if key in self._index:
+            mtime = os.path.getmtime(fname)
+            if self.ttl is None or time.time() - mtime < self.ttl:
+                with gzip.open(fname, 'rb') as f:
+                    payload = f.read()
+                # Record the access for the LRU eviction
+                now = time.time()
+                os.utime(fname, (now, mtime))
+                self._index[key][1] = now
+                self.hits += 1
+                return payload
+            self._remove(key)
+        self.misses += 1
+        if self.offline:
+            raise Cachemiss(url+' '+str(params)+' is not in the cache')
+        return None
+
+
+    def put(self, url, payload, params=None):
+        """Add a response to the cache.
+
+        Parameters
+        ----------
+        url : str
+        payload : bytes
+            Response body.
+        params : dict, optional
+            Request parameters.
+        """
+        key = self.key(url, params)
+        fname = self._fname(key)
+        if not os.path.isdir(os.path.dirname(fname)):
+            os.makedirs(os.path.dirname(fname))
+        if key in self._index:
+            self._remove(key)
+        tmp = fname+'.tmp'
+        with gzip.open(tmp, 'wb') as f:
+            f.write(payload)
+        os.replace(tmp, fname)
+        size = os.path.getsize(fname)
+        self._index[key] = [size, time.time()]
+        self.size += size
+        self._evict()
+
+
+    def _remove(self, key):
+        """Remove an entry."""
+        size = self._index.pop(key)[0]
+        self.size -= size
+        fname = self._fname(key)
+        if os.path.isfile(fname):
+            os.remove(fname)
+
+
+    def _evict(self):
+        """Remove the least recently used entries until the cache fits in
+        max_size.
+        """
+        if self.max_size is None or self.size <= self.max_size:
+            return self
+        lru = sorted(self._index, key=lambda k: self._index[k][1])
+        for key in lru:
+            if self.size <= self.max_size:
+                break
+            self._remove(key)
+        return self
+
+
+    def summary(self):
+        """Summary of the cache.
+
+        Returns
+        -------
+        out : str
+        """
+        return 'cache hits: '+str(self.hits)+', misses: '+str(self.misses)
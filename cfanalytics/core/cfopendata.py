@@ -1,6 +1,6 @@
 import requests # HTTP library
 import asyncio # Asynchronous I/O
-from aiohttp import ClientSession # Asynchronous HTTP Client/Server
+from concurrent.futures import ProcessPoolExecutor
 
 
 import pandas as pd
@@ -8,10 +8,24 @@ import pandas as pd
 
 import os
 import time
-import shutil
+import json
 
 
-from .utils import open_wods
+from .utils import open_wods, normalize_values
+from .parse import parse_payload, new_buffers, buffers_to_frame
+from .session import Connectionpool
+from .checkpoint import Manifest, Pagestate
+from .spill import Spill
+from .archive import Rawarchive
+from .dedup import Userindex
+from .concurrency import Adaptivelimit, cancel_tasks
+from .retry import Retrypolicy
+from .cache import Cachemiss
+from .storage import (read_leaderboard, write_leaderboard,
+                      write_leaderboard_chunks)
+from .ratelimit import get_ratelimiter
+from .memory import Memorymonitor, deep_size
+from .metrics import Downloadmetrics
 
 
 class Cfopendata(object):
@@ -19,7 +33,11 @@ class Cfopendata(object):
     """
     
     
-    def __init__(self, year, division, scaled, path):
+    def __init__(self, year, division, scaled, path, pool=None,
+                 limit=None, retry=None, cache=None, store=None,
+                 workers=None, url=None, ratelimiter=None, priority=0,
+                 max_memory=None, metrics=None, archive=None,
+                 download=True):
         """Crossfit open data object.
         
         Parameters
@@ -53,6 +71,48 @@ class Cfopendata(object):
             1 : Sc
         path : str
             Directory where to save data.
+        pool : Connectionpool or Http2pool, optional
+            Connection pool to download with. By default a Connectionpool
+            is created for this download and closed at the end.
+        limit : Adaptivelimit, optional
+            Limit of requests in flight. By default it starts at the batch
+            size and adapts to the server.
+        retry : Retrypolicy, optional
+            Timeouts and retries of failed pages.
+        cache : Responsecache, optional
+            Cache of the responses. By default nothing is cached.
+        store : str, optional
+            Directory of a Parquet store to save the data in instead of a
+            pickle and CSV file. Needs pyarrow.
+        workers : int, optional
+            Number of processes to decode and parse pages in. Worth it for
+            big downloads at a high concurrency. By default pages are parsed
+            in a worker thread.
+        url : str, optional
+            Address of the CrossFit Games API, e.g. of a mock server. By
+            default https://games.crossfit.com.
+        ratelimiter : Ratelimiter, optional
+            Rate limiter of the requests. By default the one shared by the
+            process, see get_ratelimiter().
+        priority : int
+            Priority of the requests in the rate limiter. Lower goes first.
+        max_memory : float, optional
+            Memory budget in MB of the downloaded pages. Parsed pages are
+            spilled to disk when they take half of it. A download which
+            doesn't fit in it is written to the CSV file, or the store, a
+            few pages at a time: no pickle is written and self.data stays
+            empty. refresh() still reads the whole leaderboard. By default
+            there is no budget.
+        metrics : Downloadmetrics, optional
+            Metrics of the requests and parsing. A summary is printed and
+            saved to dname_metrics.json at the end.
+        archive : str, optional
+            Directory of a compressed archive of the raw responses, one file
+            per division and year. reparse() rebuilds the data from it
+            without downloading.
+        download : bool
+            Download the data straight away. Inside a running event loop,
+            e.g. in Jupyter, set this to False and await fetch() instead.
 
         Returns
         -------
@@ -62,6 +122,9 @@ class Cfopendata(object):
         Example
         -------
         cfa.Cfopendata(2018, 1, 0, 'Data/')
+        
+        c = cfa.Cfopendata(2018, 1, 0, 'Data/', download=False)
+        await c.fetch()
         """
 
         self.year = year
@@ -71,6 +134,33 @@ class Cfopendata(object):
         self.scaled = scaled
         self.path = path
         
+        # Setup the connection pool shared by all batches
+        self._own_pool = pool is None
+        if self._own_pool:
+            pool = Connectionpool()
+        self.pool = pool
+        self.limit = limit
+        if retry is None:
+            retry = Retrypolicy()
+        self.retry = retry
+        self.cache = cache
+        self.store = store
+        if ratelimiter is None:
+            ratelimiter = get_ratelimiter()
+        self.ratelimiter = ratelimiter
+        self.priority = priority
+        self.max_memory = max_memory
+        # Peak memory of each phase of the download
+        self.memory = Memorymonitor()
+        if metrics is None:
+            metrics = Downloadmetrics()
+        self.metrics = metrics
+        
+        # Setup the processes which parse the pages
+        self.workers = workers
+        self._own_executor = workers is not None
+        self._executor = None
+        
         # Setup a directory to store the temporary files
         path2 = self.path+'/ind_files'
         self.path2 = path2
@@ -81,8 +171,10 @@ class Cfopendata(object):
         self.dname = self._div_to_name()+'_'+self._scaled_to_name()+'_'+\
                      str(self.year)+'_raw'
                      
-        self.basepath = 'https://games.crossfit.com/competitions/api/v1/comp'+\
-                        'etitions/open/'+str(self.year)+'/leaderboards?'
+        if url is None:
+            url = 'https://games.crossfit.com'
+        self.basepath = url+'/competitions/api/v1/competitions/open/'+\
+                        str(self.year)+'/leaderboards?'
                         
         self.headers = {'Host': 'games.crossfit.com',
                'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_13_2'+\
@@ -98,12 +190,75 @@ class Cfopendata(object):
                         'Overall_rank', 'Overall_score']
         self.columns.extend(score_cols)
         self.data = pd.DataFrame(columns=self.columns)
-        empty_df = pd.DataFrame(columns=self.columns) # Initiallized DataFrame
+        # Column buffers of each parsed page until they are spilled
+        self.chunks = {}
+        self._chunk_bytes = 0
+        # Raw responses to parse again when the parser changes
+        self.archive = None
+        if archive is not None:
+            self.archive = Rawarchive(archive, self.dname)
+        # Hash and validators of each page to find the ones which changed
+        self.pagestate = Pagestate(self.path, self.dname)
+        self._refreshing = False
+        # Page of each athlete, to drop athletes who moved between pages
+        self.users = Userindex()
+        self._refetching = False
+        
+        if download:
+            self._ailoop(self.fetch())
+        
 
-        print('Downloading '+str(self.dname))
+    async def fetch(self):
+        """async function that downloads and saves the data.
+        
+        Can be awaited inside a running event loop, e.g. in Jupyter or an
+        aiohttp application, and alongside other tasks. The blocking parts,
+        finding the number of pages and writing the data, run in a thread.
         
+        Returns
+        -------
+        cfopendata : pd.Dataframe
+            Crossfit open data.
+            
+        Example
+        -------
+        c = cfa.Cfopendata(2018, 1, 0, 'Data/', download=False)
+        df = await c.fetch()
+        """
+        aioloop = asyncio.get_event_loop()
+        print('Downloading '+str(self.dname))
         # Find out how pages of results there are
-        self.npages = self._get_npages()
+        with self.memory.phase('plan'):
+            npages = await aioloop.run_in_executor(None, self._get_npages)
+            pages = self._plan(npages)
+        try:
+            with self.memory.phase('download'):
+                await self._fetch(pages)
+            with self.memory.phase('write'):
+                await aioloop.run_in_executor(None, self._finish)
+        finally:
+            # Also when the download failed
+            await self._close()
+        print(self.dname+': '+self.memory.summary())
+        return self.data
+
+
+    def _plan(self, npages, name=None):
+        """Plan the download of npages.
+        
+        Parameters
+        ----------
+        npages : int
+            Number of pages of results.
+        name : str, optional
+            Name of the manifest. By default self.dname.
+        
+        Returns
+        -------
+        pages : list
+            Pages which have not been downloaded by a previous run.
+        """
+        self.npages = npages
         
         # Workout how many pages to get at once based on the number of pages
         if self.npages < 10:
@@ -112,61 +267,472 @@ class Cfopendata(object):
             self.batchpages = 10
         else:
             self.batchpages = 30
+        # The number of pages in flight starts at batchpages and adapts
+        if self.limit is None:
+            self.limit = Adaptivelimit(initial=self.batchpages)
+        if self._own_executor and self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
             
-        # Loop over the batch pages
-        self.startpage = 1
-        ii = 1
-        while ii <= int(self.npages/self.batchpages):
-            print('getting pages '+str(self.startpage)+'-'+str(self.startpage+\
-                  self.batchpages-1)+' of '+str(self.npages)) 
-
-            start_time = time.time()
-            self._ailoop()
-            print("that took " +\
-                  str(round((time.time() - start_time) / 60.0, 2)) +\
-                  " minutes")
-
-            # Save data after each _ailoop is called
-            self._save_df(ii, empty_df)
-                            
-            ii += 1
-            self.startpage = self.startpage + self.batchpages
+        # Find out which pages are left from a previous run
+        if name is None:
+            name = self.dname
+        self.manifest = Manifest(self.path2, name, self.npages)
+        # Rows of the finished pages are appended to one spill file
+        self.spill = Spill(self.path2, name)
+        if len(self.manifest.pages) == 0:
+            self.spill.remove()
+        self.users = Userindex()
+        for page, chunk in self.spill.chunks():
+            self.users.add(page, chunk['User_id'], chunk['Overall_rank'])
+        pages = self.manifest.missing()
+        if len(pages) < self.npages:
+            print(name+': resuming, '+str(self.npages - len(pages))+\
+                  ' of '+str(self.npages)+' pages already downloaded')
+        return pages
+    
+    
+    async def _fetch(self, pages):
+        """async function that downloads pages. Pages which fail go to the
+        dead-letter queue self.failed and are retried at the end.
+        
+        Parameters
+        ----------
+        pages : list
+            Page numbers.
+        """
+        self.failed = {}
+        await self._fetch_pages(pages)
+        for i in range(self.retry.requeues):
+            if len(self.failed) == 0:
+                break
+            pages = sorted(self.failed)
+            self.failed = {}
+            await asyncio.sleep(self.retry.delay(self.retry.retries + i))
+            print(self.dname+': retrying '+str(len(pages))+' failed pages')
+            await self._fetch_pages(pages)
+        if self._refreshing:
+            return
+        
+        # Athletes who moved up or down while the pages were downloaded
+        # leave gaps in the ranks. Get the pages around them again
+        for i in range(self.retry.requeues):
+            pages = [p for p in self.users.gaps() if p not in self.failed]
+            if len(pages) == 0:
+                break
+            print(self.dname+': ranks missing around '+str(len(pages))+\
+                  ' pages, getting them again')
+            self._refetching = True
+            try:
+                await self._fetch_pages(pages)
+            finally:
+                self._refetching = False
             
-        # Check if any pages left
-        if self.startpage <= self.npages:
-            # Update batchpages to however many pages are left     
-            self.batchpages = self.npages - self.startpage + 1
-            print('getting pages '+str(self.startpage)+'-'+str(self.startpage+\
-                  self.batchpages-1)+' of '+str(self.npages))
-            start_time = time.time() # Start time
-            self._ailoop()
-            print("that took " +\
-                  str(round((time.time() - start_time) / 60.0, 2)) +\
-                  " minutes")
             
-            # Save data after each _ailoop is called
-            self._save_df(ii, empty_df)                
+    def _finish(self):
+        """Merge the downloaded pages and save the data.
+        
+        Returns
+        -------
+        cfopendata : pd.Dataframe
+            Crossfit open data.
+        """
+        print(self.dname+': settled on a '+self.limit.summary())
+        if self.cache is not None:
+            print(self.cache.summary())
+        if self.ratelimiter.limited(self.basepath):
+            print(self.ratelimiter.summary(self.basepath))
+        print(self.dname+': '+self.metrics.describe())
+        self.metrics.save(self.path+'/'+self.dname+'_metrics.json')
             
-        # Append all data files
-        for root, dirs, files in os.walk(path2):
-            for file_ in files:
-                _df = pd.read_pickle(os.path.join(root, file_))
-                self.data = self.data.append(_df).reset_index(drop=True)
-                
-        # For unknown reasons it puts the batch pages ~100 onwards at the start
-        # Sort data by 'Overallrank' coloumn
-        self.data['Overall_rank'] = self.data['Overall_rank'].astype(int)
-        self.data = self.data.sort_values(by=['Overall_rank'])        
-        # This doesn't quite match the leaderboard but it shouldn't matter
-        # As everyone who is ranked the same overall will have similar stats
+        self._write_data()
+        if self.users.duplicates() > 0:
+            print(self.dname+': '+str(self.users.duplicates())+\
+                  ' athletes were on two pages, kept the copy fetched last')
+        
+        # Report the pages which could not be downloaded. Keep the temporary
+        # files so running again only gets these pages
+        if len(self.failed) > 0:
+            print('Could not download '+str(len(self.failed))+' of '+\
+                  str(self.npages)+' pages of '+self.dname+\
+                  '. Run again to get them:')
+            for p in sorted(self.failed):
+                print('page '+str(p)+': '+self.failed[p])
+        else:
+            # Remove the temporary files of this download only. Other
+            # downloads may be using the same directory
+            self.manifest.remove()
+            self.spill.remove()
+            if len(os.listdir(self.path2)) == 0:
+                os.rmdir(self.path2)
+        return self.data
+        
+
+    def _write_data(self):
+        """Save the pages of the spill.
+        
+        Returns
+        -------
+        cfopendata : pd.Dataframe
+            Crossfit open data. Empty if it did not fit in self.max_memory.
+        """
+        # The spill gives the rows in page order, i.e. by overall rank
+        if self.max_memory is None or self._fits():
+            buffers = new_buffers(self.columns)
+            for page, chunk in self._chunks():
+                for c in self.columns:
+                    buffers[c].extend(chunk[c])
+            self.data = buffers_to_frame(buffers, self.columns)
+            self._save()
+        else:
+            self._stream()
+        return self.data
+
+
+    def reparse(self):
+        """Rebuild the data from the archive of the raw responses without
+        downloading, e.g. after a change of the parser.
+        
+        Pages are parsed in self.workers processes if set.
+        
+        Returns
+        -------
+        cfopendata : pd.Dataframe
+            Crossfit open data.
+            
+        Example
+        -------
+        c = cfa.Cfopendata(2018, 1, 0, 'Data/', archive='Data/archive',
+        ...                download=False)
+        c.reparse()
+        """
+        if self.archive is None or len(self.archive.keys()) == 0:
+            raise OSError('There is no archive of '+self.dname+' to reparse')
+        print('Reparsing '+self.dname+' from '+self.archive.fname)
+        pages = self.archive.keys()
+        self.npages = len(pages)
+        self.failed = {}
+        self.spill = Spill(self.path2, self.dname+'_reparse')
+        self.spill.remove()
+        self.users = Userindex()
+        executor = self._executor
+        if executor is None and self.workers is not None:
+            executor = ProcessPoolExecutor(max_workers=self.workers)
+        try:
+            # A batch of pages at a time so the responses are not all held
+            for i in range(0, len(pages), 100):
+                batch = list(self.archive.chunks(pages[i:i+100]))
+                args = ([payload for page, payload in batch],
+                        [self.year] * len(batch),
+                        [self.wodscompleted] * len(batch),
+                        [self.columns] * len(batch))
+                if executor is None:
+                    results = map(_parse_page, *args)
+                else:
+                    results = executor.map(_parse_page, *args, chunksize=10)
+                for (page, payload), (buffers, error) in zip(batch, results):
+                    if error is None:
+                        self.spill.append(page, buffers)
+                        self.users.add(page, buffers['User_id'],
+                                       buffers['Overall_rank'])
+                    else:
+                        self.failed[page] = error
+        finally:
+            if executor is not None and executor is not self._executor:
+                executor.shutdown()
+        self._write_data()
+        
+        if len(self.failed) > 0:
+            print('Could not parse '+str(len(self.failed))+' of '+\
+                  str(self.npages)+' pages of '+self.dname+':')
+            for p in sorted(self.failed):
+                print('page '+str(p)+': '+self.failed[p])
+        self.spill.remove()
+        if len(os.listdir(self.path2)) == 0:
+            os.rmdir(self.path2)
+        return self.data
+
+
+    def _save(self):
+        """Save self.data and the page state.
+        
+        Returns
+        -------
+        cfopendata : pd.Dataframe
+            Crossfit open data.
+        """
         self.data['Overall_rank'] = self.data['Overall_rank'].astype(str)
         self.data = self.data.reset_index(drop=True)
-        self.data.to_pickle(self.path+'/'+self.dname)
-        self.data.to_csv(path_or_buf=self.path+'/'+self.dname+'.csv')
+        if self.store is not None:
+            write_leaderboard(self.data, self.store, self.dname)
+        else:
+            self.data.to_pickle(self.path+'/'+self.dname)
+            self.data.to_csv(path_or_buf=self.path+'/'+self.dname+'.csv')
+        self.pagestate.save()
+        return self.data
+
+
+    def _chunks(self):
+        """Iterate over the column buffers of the spill in page order,
+        without the stale copies of athletes who moved between pages.
         
-        # Remove all files in ddii2
-        shutil.rmtree(self.path2)
+        Yields
+        ------
+        page : int
+        buffers : dict
+        """
+        for page, chunk in self.spill.chunks():
+            keep = self.users.keep(page, chunk['User_id'])
+            if not all(keep):
+                chunk = {c: [v for v, k in zip(chunk[c], keep) if k]
+                         for c in self.columns}
+            yield page, chunk
+
+
+    def _fits(self):
+        """Check if the download fits in self.max_memory when it is read at
+        once. Estimated from the first page of the spill.
         
+        Returns
+        -------
+        fits : bool
+        """
+        chunks = self.spill.chunks()
+        first = next(chunks, None)
+        chunks.close()
+        if first is None:
+            return True
+        page, chunk = first
+        ratio = deep_size(chunk) / float(self.spill.size(page))
+        # The buffers and the DataFrame made of them
+        return 2 * ratio * self.spill.size() < self.max_memory * 1024. ** 2
+
+
+    def _frames(self):
+        """DataFrames of the spill in page order, each taking up to a
+        quarter of self.max_memory.
+        
+        Yields
+        ------
+        df : pd.DataFrame
+            At least one, which may be empty. The index continues from the
+            previous DataFrame.
+        """
+        budget = self.max_memory * 1024. ** 2 / 4
+        buffers = new_buffers(self.columns)
+        size, start = 0, 0
+        for page, chunk in self._chunks():
+            for c in self.columns:
+                buffers[c].extend(chunk[c])
+            size += deep_size(chunk)
+            if size >= budget:
+                df = self._frame(buffers, start)
+                start += len(df)
+                size = 0
+                yield df
+        if size > 0 or start == 0:
+            yield self._frame(buffers, start)
+
+
+    def _frame(self, buffers, start):
+        """DataFrame of the buffers with the index starting at start."""
+        df = buffers_to_frame(buffers, self.columns)
+        df['Overall_rank'] = df['Overall_rank'].astype(str)
+        df.index = pd.RangeIndex(start, start + len(df))
+        return df
+
+
+    def _stream(self):
+        """Write the spill to the CSV file, or the store, a few pages at a
+        time so no more than self.max_memory is held. A pickle can't be
+        written like this so it is skipped.
+        """
+        print(self.dname+': does not fit in '+str(self.max_memory)+\
+              ' MB, writing it a few pages at a time')
+        if self.store is not None:
+            write_leaderboard_chunks(self._frames, self.store, self.dname)
+        else:
+            fname = self.path+'/'+self.dname+'.csv'
+            with open(fname, 'w') as f:
+                for df in self._frames():
+                    df.to_csv(path_or_buf=f, header=df.index.start == 0)
+            print(self.dname+': no pickle is written with max_memory, '+\
+                  'read '+fname)
+        self.pagestate.save()
+
+
+    async def _close(self):
+        """async function that closes the connection pool and the parse
+        processes if they belong to this download."""
+        if self._own_pool:
+            await self.pool.close()
+        if self._own_executor and self._executor is not None:
+            executor = self._executor
+            self._executor = None
+            await asyncio.get_event_loop().run_in_executor(
+                    None, executor.shutdown)
+
+
+    def refresh(self):
+        """Update saved data with the leaderboard pages which changed since
+        it was downloaded. See fetch_changes().
+        
+        Returns
+        -------
+        changelog : pd.DataFrame
+            User_id, Change ('added' or 'changed'), the changed Columns and
+            the time of the refresh.
+            
+        Example
+        -------
+        c = cfa.Cfopendata(2018, 1, 0, 'Data/', download=False)
+        changelog = c.refresh()
+        """
+        aioloop = asyncio.get_event_loop()
+        return aioloop.run_until_complete(self.fetch_changes())
+
+
+    async def fetch_changes(self):
+        """async function that updates saved data with the leaderboard pages
+        which changed since it was downloaded.
+        
+        Pages are probed with conditional requests (If-None-Match and
+        If-Modified-Since) where the server sent validators, pages which
+        changed recently first. A page whose response is the same as last
+        time is skipped. The rows of the changed pages replace the saved
+        rows of the same athletes, new athletes are added and the data is
+        saved again. The changed rows are appended to dname_changelog.csv.
+        
+        Returns
+        -------
+        changelog : pd.DataFrame
+            User_id, Change ('added' or 'changed'), the changed Columns and
+            the time of the refresh.
+            
+        Example
+        -------
+        c = cfa.Cfopendata(2018, 1, 0, 'Data/', download=False)
+        changelog = await c.fetch_changes()
+        """
+        aioloop = asyncio.get_event_loop()
+        print('Refreshing '+str(self.dname))
+        with self.memory.phase('load'):
+            self.data = await aioloop.run_in_executor(None, self._load)
+        self._refreshing = True
+        try:
+            with self.memory.phase('plan'):
+                npages = await aioloop.run_in_executor(None,
+                                                       self._get_npages)
+                pages = self._plan(npages, self.dname+'_refresh')
+                pages = self.pagestate.priority(pages)
+            with self.memory.phase('download'):
+                await self._fetch(pages)
+        finally:
+            self._refreshing = False
+        print(self.dname+': settled on a '+self.limit.summary())
+        with self.memory.phase('write'):
+            try:
+                changelog = await aioloop.run_in_executor(
+                        None, self._write_changes)
+            finally:
+                await self._close()
+        print(self.dname+': '+self.memory.summary())
+        return changelog
+
+
+    def _write_changes(self):
+        """Merge the changed pages into the data and save it.
+        
+        Returns
+        -------
+        changelog : pd.DataFrame
+            Changed and added rows.
+        """
+        print(self.dname+': '+self.metrics.describe())
+        self.metrics.save(self.path+'/'+self.dname+'_metrics.json')
+        changelog = self._merge_changes()
+        self._save()
+        
+        # Pages which failed are probed again by the next refresh
+        if len(self.failed) > 0:
+            print('Could not refresh '+str(len(self.failed))+' of '+\
+                  str(self.npages)+' pages of '+self.dname+':')
+            for p in sorted(self.failed):
+                print('page '+str(p)+': '+self.failed[p])
+        self.manifest.remove()
+        self.spill.remove()
+        if len(os.listdir(self.path2)) == 0:
+            os.rmdir(self.path2)
+        return changelog
+
+
+    def _load(self):
+        """Read the saved data. A download which did not fit in max_memory
+        only has the CSV file.
+        
+        Returns
+        -------
+        cfopendata : pd.Dataframe
+            Crossfit open data.
+        """
+        if self.store is not None:
+            return read_leaderboard(self.store, self.dname)
+        fname = self.path+'/'+self.dname
+        if os.path.isfile(fname):
+            return pd.read_pickle(fname)
+        if os.path.isfile(fname+'.csv'):
+            return pd.read_csv(fname+'.csv', index_col=0, dtype=object)
+        raise OSError(fname+' does not exist. Download the data before '+\
+                      'refreshing it')
+
+
+    def _merge_changes(self):
+        """Replace the saved rows of the athletes on the changed pages.
+        
+        Returns
+        -------
+        changelog : pd.DataFrame
+            Changed and added rows.
+        """
+        changelog = pd.DataFrame(columns=['User_id', 'Change', 'Columns',
+                                          'Refreshed'])
+        if len(self.spill.keys()) == 0:
+            print(self.dname+': no pages changed')
+            return changelog
+        new = self.spill.read(self.columns)
+        new['User_id'] = new['User_id'].astype(str)
+        new = new.drop_duplicates('User_id', keep='last').set_index('User_id')
+        old = self.data.astype(object)
+        old['User_id'] = old['User_id'].astype(str)
+        old = old.drop_duplicates('User_id', keep='last').set_index('User_id')
+        
+        # Compare values as they are written out so that e.g. 5, '5' and
+        # 5.0 are the same
+        common = new.index.intersection(old.index)
+        cols = [c for c in self.columns if c != 'User_id']
+        diff = normalize_values(old.loc[common, cols]) != \
+               normalize_values(new.loc[common, cols])
+        changed = common[diff.any(axis=1).values]
+        added = new.index.difference(old.index)
+        
+        old.loc[changed, cols] = new.loc[changed, cols].values
+        old = pd.concat([old, new.loc[added, cols]])
+        self.data = old.reset_index()[self.columns]
+        # Athletes moved pages so sort by 'Overall_rank'
+        ranks = self.data['Overall_rank'].astype(int)
+        self.data = self.data.iloc[ranks.argsort(kind='stable')]
+        
+        refreshed = time.strftime('%Y-%m-%dT%H:%M:%S')
+        rows = [[u, 'changed', ','.join(diff.columns[diff.loc[u].values]),
+                 refreshed] for u in changed]
+        rows += [[u, 'added', '', refreshed] for u in added]
+        changelog = pd.DataFrame(rows, columns=changelog.columns)
+        fname = self.path+'/'+self.dname+'_changelog.csv'
+        changelog.to_csv(path_or_buf=fname, mode='a', index=False,
+                         header=not os.path.isfile(fname))
+        print(self.dname+': '+str(len(changed))+' athletes changed, '+\
+              str(len(added))+' added')
+        return changelog
+
 
     def _div_to_name(self):
         """Division number to a string.
@@ -220,193 +786,361 @@ class Cfopendata(object):
         npages : int
            Number of pages.
         """
-        response = requests.get(self.basepath,
-                                params={"division": self.division,
-                                        "scaled": self.scaled,
-                                        "sort": "0",
-                                        "fittest": "1",
-                                        "fittest1": "0",
-                                        "occupation": "0",
-                                        "competition": "1",
-                                        "page": 1},
-                                        headers=self.headers).json()
+        params = self._params(1)
+        payload = None
+        # A refresh needs the current number of pages
+        if self.cache is not None and not self._refreshing:
+            payload = self.cache.get(self.basepath, params)
+        if payload is None:
+            # The first page is retried like the others
+            for attempt in range(self.retry.retries + 1):
+                self.ratelimiter.wait(self.basepath)
+                start_time = time.time()
+                try:
+                    response = requests.get(self.basepath, params=params,
+                                            headers=self.headers,
+                                            timeout=self.retry.timeout)
+                except (requests.ConnectionError, requests.Timeout):
+                    self.metrics.request(time.time() - start_time, None)
+                    if attempt == self.retry.retries:
+                        raise
+                    self.metrics.retry()
+                    time.sleep(self.retry.delay(attempt))
+                    continue
+                self.metrics.request(time.time() - start_time,
+                                     response.status_code,
+                                     len(response.content))
+                if response.status_code == 429:
+                    self.ratelimiter.throttled(self.basepath,
+                                               self.retry.retry_after(response))
+                elif response.status_code < 500 and \
+                     response.status_code != 408:
+                    break
+                if attempt < self.retry.retries:
+                    self.metrics.retry()
+                    time.sleep(self.retry.delay(attempt))
+            response.raise_for_status()
+            payload = response.content
+            if self.cache is not None:
+                self.cache.put(self.basepath, payload, params)
+        response = json.loads(payload)
         if self.year == 2018:
             return  response['pagination']['totalPages']
         else:
             return response['totalpages']
         
 
-    def _ailoop(self):
+    async def _fetch_pages(self, pages):
+        """async function that downloads pages in batches and saves each
+        batch.
+        
+        Batches grow with the concurrency limit so they never hold back the
+        number of pages in flight.
+        
+        Parameters
+        ----------
+        pages : list
+            Page numbers.
+        """
+        while len(pages) > 0:
+            nbatch = max(self.batchpages, 2 * self.limit.limit)
+            self.pages = pages[:nbatch]
+            pages = pages[nbatch:]
+            print('getting '+self.dname+' pages '+str(self.pages[0])+'-'+\
+                  str(self.pages[-1])+' of '+str(self.npages))
+            
+            start_time = time.time()
+            self.pool.new_batch()
+            await self._loop_pages()
+            print("that took " +\
+                  str(round((time.time() - start_time) / 60.0, 2)) +\
+                  " minutes ("+self.pool.summary()+", in flight limit: "+\
+                  str(self.limit.limit)+")")
+
+            # Save data after each batch
+            self._save_df()
+
+
+    def _params(self, page):
+        """Request parameters of a leaderboard page.
+        
+        Parameters
+        ----------
+        page : int
+            Page number.
+        
+        Returns
+        -------
+        params : dict
+            Request parameters.
+        """
+        return {"division": self.division,
+                "scaled": self.scaled,
+                "sort": "0",
+                "fittest": "1",
+                "fittest1": "0",
+                "occupation": "0",
+                "competition": "1",
+                "page": page}
+
+
+    def _ailoop(self, aicoro):
         """Create a concurrent loop.
         
         See https://www.blog.pythonlibrar\y.org/2016/07/26/python-3-an-intro\
         -to-asyncio/
+        
+        Parameters
+        ----------
+        aicoro : coroutine
+            Coroutine to run.
         """
         aioloop = asyncio.get_event_loop()
-        aifuture = asyncio.ensure_future(self._loop_pages())
+        aifuture = asyncio.ensure_future(aicoro)
         aioloop.run_until_complete(aifuture)
         
 
     async def _loop_pages(self):
-        """async function that creates semaphores and does http requests
-        by a segmented number of pages.
+        """async function that downloads the batch pages and parses each one
+        as soon as it arrives.
+        
+        Downloads put their response on a bounded queue and consumers parse
+        them off the event loop, so the network and parsing overlap. There
+        is a consumer for each of self.workers. When parsing falls behind
+        the queue fills up and downloads wait for it. The number of requests
+        in flight is set by self.limit. An error in a download or a
+        consumer cancels the others and is raised.
         
         Returns
         -------
-        Calls ._download_page()
-        Calls ._get_data()
+        Calls ._produce()
+        Calls ._consume()
         """
+        queue = asyncio.Queue(maxsize=self.limit.limit)
+        self.done = []
+        nconsumers = self.workers or 1
+        consumers = [asyncio.ensure_future(self._consume(queue))
+                     for i in range(nconsumers)]
         async_list = []
-        sem = asyncio.Semaphore(self.batchpages) # create asyncio.locks.Semaph\
-        #ore object
-        async with ClientSession() as session:
-            for p in range(self.startpage, self.startpage+self.batchpages):
-                self.p = p
-                self.params={"division": self.division,
-                             "scaled": self.scaled,
-                             "sort": "0",
-                             "fittest": "1",
-                             "fittest1": "0",
-                             "occupation": "0",
-                             "competition": "1",
-                             "page": self.p}
-                task = asyncio.ensure_future(self._download_page(sem, session))            
-                async_list.append(task)
-                results = await asyncio.gather(*async_list)
-
-        # Loop through the batch pages    
-        for page in results:
-            self._get_data(page)     
-
-
-    async def _download_page(self, sem, session):
-        """ async function that checks semaphore unlocked before calling the
-        get function.
+        for p in self.pages:
+            task = asyncio.ensure_future(self._produce(queue, p))
+            async_list.append(task)
+
+        async def produce():
+            await asyncio.gather(*async_list)
+            # Tell the consumers there are no more pages
+            for i in range(nconsumers):
+                await queue.put(None)
+
+        # A consumer which fails would leave the producers waiting on a
+        # full queue. Stop everything on the first error instead
+        tasks = [asyncio.ensure_future(produce())] + consumers
+        try:
+            done, pending = await asyncio.wait(
+                    tasks, return_when=asyncio.FIRST_EXCEPTION)
+        finally:
+            await cancel_tasks(tasks + async_list)
+        failed = [t for t in done if not t.cancelled() and
+                  t.exception() is not None]
+        if len(failed) > 0:
+            raise failed[0].exception()
+
+
+    async def _produce(self, queue, page):
+        """async function that gets a page from the cache or downloads it and
+        puts it on the queue.
         
         Parameters
         ----------
-        sem : int
-            Semaphore.
-        session : aiohttp.client.ClientSession  
+        queue : asyncio.Queue
+            Pages waiting to be parsed.
+        page : int
+            Page number.
+        """
+        params = self._params(page)
+        payload = None
+        # Cached pages don't count towards the concurrency limit. A refresh,
+        # and pages fetched again for missing ranks, always ask the server
+        if self.cache is not None and not self._refreshing and \
+           not self._refetching:
+            try:
+                payload = self.cache.get(self.basepath, params)
+            except Cachemiss as e:
+                self.failed[page] = str(e)
+                return
+        fresh = payload is None
+        if fresh:
+            payload = await self._download_page(self.limit, params)
+            if payload is None:
+                return
+        if self.archive is not None and len(payload) > 0 and \
+           (fresh or page not in self.archive):
+            self.archive.append(page, payload)
+        # Pages which did not change are not parsed again. An empty body is
+        # a 304 Not Modified
+        if self._refreshing and (len(payload) == 0 or
+                                 self.pagestate.unchanged(page, payload)):
+            self.pagestate.update(page)
+            return
+        await queue.put((page, payload, fresh))
+        self.metrics.queued(queue.qsize())
+
+
+    async def _consume(self, queue):
+        """async function that parses the pages on the queue in a worker
+        thread, or in self._executor, and keeps them in self.chunks. Pages
+        which can't be parsed go to the dead-letter queue self.failed.
+        
+        Parameters
+        ----------
+        queue : asyncio.Queue
+            Pages waiting to be parsed. None marks the end.
+        """
+        aioloop = asyncio.get_event_loop()
+        while True:
+            item = await queue.get()
+            if item is None:
+                break
+            page, payload, fresh = item
+            start_time = time.time()
+            buffers, error = await aioloop.run_in_executor(
+                    self._executor, _parse_page, payload, self.year,
+                    self.wodscompleted, self.columns)
+            if error is not None:
+                self.failed[page] = error
+                continue
+            self.metrics.parsed(time.time() - start_time,
+                                len(buffers['User_id']))
+            self.chunks[page] = buffers
+            self.users.add(page, buffers['User_id'], buffers['Overall_rank'])
+            if self.max_memory is not None:
+                self._chunk_bytes += deep_size(buffers)
+            # Only cache responses which could be parsed
+            if fresh and self.cache is not None:
+                self.cache.put(self.basepath, payload, self._params(page))
+            self.pagestate.update(page, payload)
+            self.done.append(page)
+            # Spill the pages early when they take half of the budget
+            if self.max_memory is not None and \
+               self._chunk_bytes > self.max_memory * 1024. ** 2 / 2:
+                self._save_df()
+
+
+    async def _download_page(self, limit, params):
+        """ async function that waits for the concurrency limit before calling
+        the get function and reports the latency and status back to it.
+        Failed requests are retried with a jittered exponential backoff.
+        
+        Parameters
+        ----------
+        limit : Adaptivelimit
+            Concurrency limit.
+        params : dict
+            Request parameters.
         
         Returns
         -------
         Calls ._get_page
+        None if every attempt failed. The page and error are added to
+        self.failed.
         """
-        async with sem:
-            return await self._get_page(session)
+        for attempt in range(self.retry.retries + 1):
+            # Requests wait for the rate limiter first so they are served
+            # in priority order, not in the order they got a slot
+            await self.ratelimiter.acquire(self.basepath, self.priority)
+            await limit.acquire()
+            try:
+                start_time = time.time()
+                error = None
+                try:
+                    out = await self._get_page(params)
+                except self.retry.exceptions as e:
+                    error = e
+                latency = time.time() - start_time
+            except BaseException:
+                # Cancelled, or an error which is not retried. Give the slot
+                # back so a shared limit doesn't lose it
+                await limit.cancel()
+                raise
+            if error is None:
+                # An empty body is a 304 Not Modified
+                status = 304 if len(out) == 0 else 200
+                await limit.release(latency, status)
+                self.metrics.request(latency, status, len(out))
+                return out
+            await limit.release(latency, self.retry.status(error))
+            self.metrics.request(latency, self.retry.status(error))
+            if self.retry.status(error) == 429:
+                self.ratelimiter.throttled(self.basepath,
+                                           self.retry.retry_after(error))
+            if not self.retry.retryable(error):
+                break
+            if attempt < self.retry.retries:
+                self.metrics.retry()
+                await asyncio.sleep(self.retry.delay(attempt))
+        self.failed[params['page']] = self.retry.describe(error)
+        return None
 
         
-    async def _get_page(self, session):
-        """ async function that makes HTTP GET requests.
+    async def _get_page(self, params):
+        """ async function that makes HTTP GET requests through self.pool.
     
 
         Parameters
         ----------
-        session : aiohttp.client.ClientSession 
+        params : dict
+            Request parameters.
         
         Returns
         -------        
-        out : JSON response object.
+        payload : bytes
+            Response body. Empty if a refresh was told the page is not
+            modified.
         """
-        async with session.get(self.basepath, params=self.params,
-                               headers=self.headers) as response: 
-            out = await response.json()
-            return out
+        headers = self.headers
+        if self._refreshing:
+            headers = dict(self.headers,
+                           **self.pagestate.conditional(params['page']))
+        response = await self.pool.get(self.basepath, params=params,
+                                       headers=headers,
+                                       timeout=self.retry.timeout)
+        if response.status == 304:
+            return b''
+        self.pagestate.validators(params['page'], response.headers)
+        return response.body
 
         
-    def _get_data(self, response):
-        """Get data from response.
+    def _save_df(self):
+        """Append the pages of the batch to the spill file.
         
-        Parameters
-        ----------
-        response : dict
-            Response.
-
         Returns
         -------
-        data : pd.Dateframe
-            Append data to self.data.
+        spill : Spill
+            Appends a record for each page, records the pages in the
+            manifest and makes self.chunks and self.done empty
         """
-        wr = [None] * self.wodscompleted
-        ws = [None] * self.wodscompleted
-        
-        if self.year == 2018:
-            athletes = response['leaderboardRows']
-            nathletes = len(athletes)
-            
-             # Loop over athletes in the page
-            for i in range(nathletes):
-                athlete = athletes[i]
-                _id = athlete['entrant']['competitorId']
-                name = athlete['entrant']['competitorName']
-                height = athlete['entrant']['height']
-                weight = athlete['entrant']['weight']
-                age = athlete['entrant']['age']
-                ri = athlete['entrant']['regionId']
-                rn = athlete['entrant']['regionName']
-                ai = athlete['entrant']['affiliateId']
-                _or = athlete['overallRank']
-                _os = athlete['overallScore']
-                row = [_id, name, height, weight, age, ri, rn, ai, _or, _os]
-                
-                # Loop over workouts
-                for j in range(self.wodscompleted):
-                    wr[j] = athlete['scores'][j]['rank']
-                    row.append(wr[j])
-                    ws[j] = athlete['scores'][j]['scoreDisplay']
-                    row.append(ws[j])
-                row = [row]
-                df = pd.DataFrame(row, columns=self.columns)
-                self.data = self.data.append(df)
-        else:
-            athletes = response['athletes']
-            nathletes = len(athletes)
-            
-            # Loop over athletes in the page
-            for i in range(nathletes):
-                athlete = athletes[i]
-                _id = athlete['userid']
-                name = athlete['name']
-                height = athlete['height']
-                weight = athlete['weight']
-                age = athlete['age']
-                ri = athlete['regionid']
-                rn = athlete['region']
-                ai = athlete['affiliateid']
-                _or = athlete['overallrank']
-                _os = athlete['overallscore']
-                row = [_id, name, height, weight, age, ri, rn, ai, _or, _os]
-                
-                # Loop over workouts
-                for j in range(self.wodscompleted):
-                    wr[j] = athlete['scores'][j]['workoutrank']
-                    row.append(wr[j])
-                    ws[j] = athlete['scores'][j]['scoredisplay']
-                    row.append(ws[j])
-                row = [row]
-                df = pd.DataFrame(row, columns=self.columns)
-                self.data = self.data.append(df)
+        if len(self.done) == 0:
+            return self
+        for p in sorted(self.done):
+            self.spill.append(p, self.chunks.pop(p))
+        self.manifest.add(self.done, os.path.basename(self.spill.fname))
+        self.done = []
+        self._chunk_bytes = 0
+        return self
 
-            
-    def _save_df(self, ii, empty_df):
-        """Save pandas.DataFrame.
-        
-        Parameters
-        ----------
-        ii : int
-            Batchpages counter.
-        empty_df : pd.DataFrame.
-            Empty pandas DataFrame with coloumns already added.
 
-        Returns
-        -------
-        data : pd.Dateframe
-            Saves file and make self.data empty
-        """
-        self.data_tmp = self.data.reset_index(drop=True)
-        self.dname_tmp = self._div_to_name()+'_'+self._scaled_to_name()+'_'+\
-            str(self.year)+'_raw_'+str(ii).zfill(4)
-        self.data_tmp.to_pickle(self.path2+'/'+self.dname_tmp)
-        self.data = empty_df
-        return self
\ No newline at end of file
+def _parse_page(payload, year, wodscompleted, columns):
+    """Parse a page and catch the errors of a bad page.
+    
+    Returns
+    -------
+    buffers : dict or None
+        Column buffers of the page.
+    error : str or None
+        Why the page could not be parsed.
+    """
+    try:
+        return parse_payload(payload, year, wodscompleted, columns), None
+    except (ValueError, KeyError, IndexError, TypeError) as e:
+        return None, 'Could not parse the page: '+type(e).__name__+': '+\
+                     str(e)
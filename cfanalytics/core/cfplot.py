@@ -15,17 +15,25 @@ import math
 import os
 
 
+from .storage import read_leaderboard, read_affiliates
+from .spatial import Gymindex
+from .names import Nameindex, normalize_name
+
+
 class Cfplot(object):
     """An object to plot downloaded CrossFit open data.
     """
     
-    def __init__(self, path):
+    def __init__(self, path, store=None):
         """Plot Crossfit open data object.
         
         Parameters
         ----------
         path : string
             File path.
+        store : str, optional
+            Directory of a Parquet store with the cleaned data. Each plot then
+            only reads the columns and rows it needs.
             
         Returns
         -------
@@ -33,7 +41,10 @@ class Cfplot(object):
             Creates Crossfit plot.
         """
         self.path = path
-        self.df = pd.read_pickle(self.path)
+        self.store = store
+        self._df = None
+        if self.store is None:
+            self._df = pd.read_pickle(self.path)
         self.year = int(str(self.path[-4:]))
         if int(self.year) < 2018:
             raise ValueError('This is only tested on 2018')
@@ -45,6 +56,42 @@ class Cfplot(object):
             os.makedirs(self.plotdir)        
         self.fname = self.path.split('/')[-1]        
 
+
+    @property
+    def df(self):
+        """The data. From a store the whole leaderboard is read the first
+        time it is needed, unless a plot already read the columns and rows it
+        needs.
+
+        Returns
+        -------
+        df : pd.DataFrame
+        """
+        if self._df is None:
+            self._df = read_leaderboard(self.store, self.fname)
+        return self._df
+
+
+    def _load(self, columns, filters):
+        """Read the columns and rows a plot needs from the store. Without a
+        store the whole file was already read.
+
+        Parameters
+        ----------
+        columns : list
+            Columns to read.
+        filters : list
+            Tuples of (column, op, value) of the rows to read.
+
+        Returns
+        -------
+        self.df : pd.DataFrame
+        """
+        if self.store is not None:
+            self._df = read_leaderboard(self.store, self.fname,
+                                        columns=columns, filters=filters)
+        return self
+
         
     def regionplot(self, column=None, how=None):
         """Create a plot showing a map of the world with data averaged in
@@ -126,6 +173,8 @@ class Cfplot(object):
             
         #Obtain region names
         self._region_names()
+        self._load(['Region_id', self.column],
+                   [('Region_id', 'in', list(self.reg_dict.keys()))])
                 
         # Create xr.DataArray to store the data
         da = xr.DataArray(np.full((len(self.reg_dict.keys()), len(self.df)),
@@ -886,7 +935,8 @@ class Cfplot(object):
         return self
     
     
-    def cityplot(self, city=None, state=None, column=None, how=None):
+    def cityplot(self, city=None, state=None, column=None, how=None,
+                 near=None, radius=25.0):
         """Create a plot showing a map of the city with data for each gym.
         
         Parameters
@@ -903,6 +953,11 @@ class Cfplot(object):
         how : string
             Name of method to analyze the data.
             P0 : 5th percentile.
+        near : tuple, optional
+            (latitude, longitude). Plot the gyms within radius of this point
+            instead of the gyms of a city.
+        radius : float
+            Distance in km from near.
             
         Returns
         -------
@@ -913,9 +968,14 @@ class Cfplot(object):
         -------
         cfa.Cfplot('Men_Rx_2018').cityplot(city='Miami', column='Overall_rank',
         ...                                how='P0')
+        cfa.Cfplot('Men_Rx_2018').cityplot(near=(25.76, -80.19), radius=25)
         """
+        if city is None and near is None:
+            raise ValueError('Must enter city or near.')           
+        self.near = near
+        self.radius = radius
         if city is None:
-            raise ValueError('Must enter city.')           
+            city = str(radius)+' km of '+str(near[0])+', '+str(near[1])
         self.city = city
 
         self.state = state
@@ -934,18 +994,24 @@ class Cfplot(object):
             raise ValueError('Column should be a rank column.')
             
         # Get cities where gyms are located
-        self._get_city_gyms()        
+        if self.near is not None:
+            self._get_near_gyms()
+        else:
+            self._get_city_gyms()        
+        self._load(['Affiliate_id', 'Name', self.column],
+                   [('Affiliate_id', 'in',
+                     list(self.df_gyms['Affiliate_id'].values))])
         
         # Create xr.DataArray to store the ranks
         da = xr.DataArray(np.full((len(self.df_gyms), 2000),
                                   np.nan, dtype=np.double),
-            coords=[self.df_gyms['Affiliate_name'].values,
+            coords=[self.df_gyms['Affiliate_id'].values,
                     np.arange(2000)],
             dims=['gyms','athletes'])
-        # Fill with data for each gym
-        for i, gym_id in enumerate(self.df_gyms['Affiliate_name'].values):
+        # Fill with data for each gym. Names can repeat so gyms are ids
+        for i, gym_id in enumerate(self.df_gyms['Affiliate_id'].values):
             row = self.df_gyms[
-                    self.df_gyms['Affiliate_name'] == gym_id]
+                    self.df_gyms['Affiliate_id'] == gym_id]
             aid = row['Affiliate_id'].values
             df = self.df.query('Affiliate_id =='+str(aid))
             da.loc[gym_id, 0:len(df)-1] = df[self.column].values
@@ -953,22 +1019,23 @@ class Cfplot(object):
         da = da.dropna('gyms', how='all')
         # Update self.df_gyms with only these gyms
         self.df_gyms = self.df_gyms.loc[
-                self.df_gyms['Affiliate_name'].isin(da.coords['gyms'].values)]       
+                self.df_gyms['Affiliate_id'].isin(da.coords['gyms'].values)]       
 
         # Some gyms don't have latitude and longitude. Drop these
-        i = np.where(self.df_gyms['Latitude'].values == '')
-        da.loc[self.df_gyms['Affiliate_name'].values[i], :] = np.nan
+        i = np.where(self.df_gyms['Latitude'].isnull().values |
+                     (self.df_gyms['Latitude'].values == ''))
+        da.loc[self.df_gyms['Affiliate_id'].values[i], :] = np.nan
         da = da.dropna('gyms', how='all')
         # Update self.df_gyms with only these gyms
         self.df_gyms = self.df_gyms.loc[
-                self.df_gyms['Affiliate_name'].isin(da.coords['gyms'].values)]
+                self.df_gyms['Affiliate_id'].isin(da.coords['gyms'].values)]
 
         # Create a data array for athelete names
         mol_ext = list()
         _da = da.copy(deep=True).astype(str)
-        for i, gym_id in enumerate(self.df_gyms['Affiliate_name'].values):
+        for i, gym_id in enumerate(self.df_gyms['Affiliate_id'].values):
             row = self.df_gyms[
-                    self.df_gyms['Affiliate_name'] == gym_id]
+                    self.df_gyms['Affiliate_id'] == gym_id]
             aid = row['Affiliate_id'].values[0]
             mol_ext.append(str(aid))
             df = self.df.query('Affiliate_id =='+str(aid))
@@ -994,12 +1061,15 @@ class Cfplot(object):
         _da6 = da[:,0].copy(deep=True).drop('athletes')
         # Create a data array for lon
         _da7 = _da6.copy(deep=True)
+        # Create a data array for gym names
+        _da8 = _da3.copy(deep=True)
         for index, row in self.df_gyms.iterrows():
-            _da3.loc[row['Affiliate_name']] = row['Address']
-            _da4.loc[row['Affiliate_name']] = row['Website']
-            _da5.loc[row['Affiliate_name']] = row['Phone']           
-            _da6.loc[row['Affiliate_name']] = row['Latitude']
-            _da7.loc[row['Affiliate_name']] = row['Longitude']
+            _da3.loc[row['Affiliate_id']] = row['Address']
+            _da4.loc[row['Affiliate_id']] = row['Website']
+            _da5.loc[row['Affiliate_id']] = row['Phone']           
+            _da6.loc[row['Affiliate_id']] = row['Latitude']
+            _da7.loc[row['Affiliate_id']] = row['Longitude']
+            _da8.loc[row['Affiliate_id']] = row['Affiliate_name']
             
         # Print out extent of city map
         #print(_da7.min(), _da7.max(), _da6.min(), _da6.max())
@@ -1013,7 +1083,8 @@ class Cfplot(object):
         ds = xr.Dataset({self.how:da[:,0].drop('athletes'), 
                           'athlete_names':_da[:,0].drop('athletes'),
                           'address':_da3, 'website':_da4, 'phone':_da5,
-                          'latitude':_da6, 'longitude':_da7})
+                          'latitude':_da6, 'longitude':_da7,
+                          'gym_names':_da8})
 
         # Data analysis method        
         if self.how[0] == 'P':
@@ -1044,10 +1115,20 @@ class Cfplot(object):
         self.df_gyms : pd.Dataframe
             Gyms in the city and other info.
         """
-        if not os.path.isfile(self._dir+'Affiliate_list'):
-            raise OSError('Affiliate_list must be in the same directory as the\
-                          open data: '+self._dir)
-        df_affiliate = pd.read_pickle(self._dir+'Affiliate_list')
+        # Look the city up in the name index saved next to the
+        # Affiliate_list. It ignores case and accents and finds misspelled
+        # cities, see Nameindex
+        index = Nameindex(self._dir)
+        if not os.path.isfile(index.fname):
+            # Affiliate lists saved before the index existed
+            index.build(self._affiliates()).save()
+        city, aids = index.find(self.city, 'City')
+        if city is None:
+            raise ValueError('city: '+self.city+' is not in Affiliate_list')
+        if normalize_name(city) != normalize_name(self.city):
+            print('city: '+self.city+' is not in Affiliate_list, using '+city)
+        if self.state is not None:
+            aids = sorted(set(aids) & set(index.get(self.state, 'State')))
         
         # What is the maximum number of gyms in a city
         #_df = df_affiliate['City']
@@ -1055,15 +1136,10 @@ class Cfplot(object):
         #                           return_counts=True)
         #print(unique[np.argmax(counts)])
         
-        # Obtain city column
-        cities = df_affiliate.loc[:,'City'].values
-        
-        # Check if self.city is in cities
-        if not self.city in cities:
-            raise ValueError('city: '+self.city+' is not in Affiliate_list')
-        
         # Get gyms in the city
-        df_gyms = df_affiliate.loc[df_affiliate['City'] == self.city]
+        df_affiliate = self._affiliates([('Affiliate_id', 'in', aids)])
+        df_gyms = df_affiliate.loc[
+                df_affiliate['Affiliate_id'].astype(int).isin(aids)]
 
         # Old method... remove eventually...
         # The city could be located in multiple countries
@@ -1076,14 +1152,59 @@ class Cfplot(object):
         #if len(unique) > 1:
         #    ix = np.argmax(counts)
         #    df_gyms = df_gyms.loc[df_affiliate['Country'] == unique[ix]]
-            
-        if self.state is not None:
-            df_gyms = df_gyms.loc[df_gyms['State'] == self.state]
 
         self.df_gyms = df_gyms
         return self
 
 
+    def _affiliates(self, filters=None):
+        """Read the Affiliate_list. Only the rows of the filters are read
+        from a store.
+
+        Parameters
+        ----------
+        filters : list, optional
+            Tuples of (column, op, value) of the rows to read.
+
+        Returns
+        -------
+        df_affiliate : pd.Dataframe
+            Affiliate data.
+        """
+        if self.store is not None:
+            return read_affiliates(self.store, filters=filters)
+        if not os.path.isfile(self._dir+'Affiliate_list'):
+            raise OSError('Affiliate_list must be in the same directory '+\
+                          'as the open data: '+self._dir)
+        return pd.read_pickle(self._dir+'Affiliate_list')
+
+
+    def _get_near_gyms(self):
+        """Return a Dataframe of the gyms within self.radius km of
+        self.near, nearest first. They are found with the spatial index
+        saved next to the Affiliate_list, see Gymindex.
+
+        Returns
+        -------
+        self.df_gyms : pd.Dataframe
+            Gyms near the point and other info.
+        """
+        index = Gymindex(self._dir)
+        if not os.path.isfile(index.fname):
+            # Affiliate lists saved before the index existed
+            index.build(self._affiliates()).save()
+        aids, km = index.within(self.near[0], self.near[1], self.radius)
+        if len(aids) == 0:
+            raise ValueError('There are no gyms within '+str(self.radius)+\
+                             ' km of '+str(self.near))
+        df_affiliate = self._affiliates([('Affiliate_id', 'in',
+                                          list(aids))])
+        df_affiliate = df_affiliate.set_index(
+                df_affiliate['Affiliate_id'].astype(int), drop=False)
+        self.df_gyms = df_affiliate.loc[aids].reset_index(drop=True)
+        return self
+
+
     def _show_city_data(self, ds):
         """Print the data.
         
@@ -1107,7 +1228,7 @@ class Cfplot(object):
             print('rank, name, gym, '+self.how)
         for i in range(0, len(ds_sorted.coords['gyms'])):
             print(i+1,',',ds_sorted['athlete_names'].values[i],',',
-                  ds_sorted.coords['gyms'].values[i],',',
+                  ds_sorted['gym_names'].values[i],',',
                   ds_sorted[self.how].values[i])
         self.ds_sorted = ds_sorted
         print('')
@@ -1116,7 +1237,7 @@ class Cfplot(object):
         print('---- | ---- | --- | ---------------')
         for i in range(0, len(ds_sorted.coords['gyms'])):
             print(str(i+1)+' | '+ds_sorted['athlete_names'].values[i]+' | '+\
-                  ds_sorted.coords['gyms'].values[i]+' | '+\
+                  ds_sorted['gym_names'].values[i]+' | '+\
                   str(ds_sorted[self.how].values[i]))      
         return self
 
@@ -1157,7 +1278,7 @@ class Cfplot(object):
             # Create label
             self.regcount = i
             self._rank() # Add self.rank
-            _label = self.rank+' '+ds['gyms'].values[i]+': '+\
+            _label = self.rank+' '+ds['gym_names'].values[i]+': '+\
             ds['athlete_names'].values[i]+' ('+str(ds[self.how].values[i])+')'
             x, y = sm.grid.transform(ds['longitude'].values[i],
                                      ds['latitude'].values[i])
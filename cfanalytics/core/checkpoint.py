@@ -0,0 +1,271 @@
+import hashlib
+import json
+import os
+import time
+
+
+class Manifest(object):
+    """A record of which pages of a download are finished and the file their
+    rows are saved in.
+    """
+
+    def __init__(self, path, dname, npages):
+        """Page checkpoint manifest object.
+
+        An existing manifest for dname in path is loaded so a restarted
+        download only has to get the missing pages. The manifest is discarded
+        if the number of pages has changed since it was written.
+
+        Parameters
+        ----------
+        path : str
+            Directory of the temporary files.
+        dname : str
+            Name of the download e.g. 'Men_Rx_2018_raw'.
+        npages : int
+            Number of pages of the download.
+
+        Example
+        -------
+        manifest = Manifest('Data/ind_files', 'Men_Rx_2018_raw', 4291)
+        manifest.missing()
+        """
+        self.path = path
+        self.dname = dname
+        self.npages = npages
+        self.fname = os.path.join(self.path, self.dname+'_manifest.json')
+        self.pages = {}
+        if os.path.isfile(self.fname):
+            self._load()
+
+
+    def _load(self):
+        """Load the pages of a previous run.
+
+        Returns
+        -------
+        self.pages : dict
+            Page number and file name of finished pages.
+        """
+        with open(self.fname) as f:
+            manifest = json.load(f)
+        if manifest['npages'] != self.npages:
+            print('Number of pages changed from '+str(manifest['npages'])+\
+                  ' to '+str(self.npages)+'. Discarding '+self.fname)
+            return self
+        for page, file_ in manifest['pages'].items():
+            # Only trust pages whose file still exists
+            if os.path.isfile(os.path.join(self.path, file_)):
+                self.pages[int(page)] = file_
+        return self
+
+
+    def missing(self):
+        """Pages which are not finished.
+
+        Returns
+        -------
+        pages : list
+            Page numbers in ascending order.
+        """
+        return [p for p in range(1, self.npages+1) if p not in self.pages]
+
+
+    def add(self, pages, file_):
+        """Mark pages as finished and save the manifest.
+
+        Parameters
+        ----------
+        pages : list
+            Page numbers.
+        file_ : str
+            Name of the file in self.path the rows of the pages are saved in.
+        """
+        for p in pages:
+            self.pages[p] = file_
+        self.save()
+
+
+    def files(self):
+        """Files of the finished pages.
+
+        Returns
+        -------
+        files : list
+            File paths in page order.
+        """
+        files = []
+        for p in sorted(self.pages):
+            if self.pages[p] not in files:
+                files.append(self.pages[p])
+        return [os.path.join(self.path, f) for f in files]
+
+
+    def save(self):
+        """Write the manifest.
+
+        The manifest is written to a temporary file first so a crash while
+        saving never leaves a corrupt manifest behind.
+        """
+        manifest = {'dname': self.dname,
+                    'npages': self.npages,
+                    'pages': {str(p): f for p, f in self.pages.items()}}
+        tmp = self.fname+'.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(manifest, f)
+        os.replace(tmp, self.fname)
+
+
+    def remove(self):
+        """Remove the manifest and the files of the finished pages."""
+        for file_ in self.files():
+            if os.path.isfile(file_):
+                os.remove(file_)
+        if os.path.isfile(self.fname):
+            os.remove(self.fname)
+        self.pages = {}
+
+
+class Pagestate(object):
+    """A record of the content of each leaderboard page, used to only
+    re-fetch pages which changed.
+    """
+
+    def __init__(self, path, dname):
+        """Page state object.
+
+        For each page the sha256 of its last response, the ETag and
+        Last-Modified validators the server sent and a score of how often it
+        changed recently are kept in path/dname_pages.json.
+
+        Parameters
+        ----------
+        path : str
+            Directory of the data.
+        dname : str
+            Name of the download e.g. 'Men_Rx_2018_raw'.
+
+        Example
+        -------
+        state = Pagestate('Data/', 'Men_Rx_2018_raw')
+        state.priority(range(1, 4292))
+        """
+        self.path = path
+        self.dname = dname
+        self.fname = os.path.join(self.path, self.dname+'_pages.json')
+        self.pages = {}
+        self._pending = {}
+        if os.path.isfile(self.fname):
+            with open(self.fname) as f:
+                self.pages = {int(p): s for p, s in json.load(f).items()}
+
+
+    def conditional(self, page):
+        """Headers of a conditional request for a page.
+
+        Parameters
+        ----------
+        page : int
+            Page number.
+
+        Returns
+        -------
+        headers : dict
+            If-None-Match and If-Modified-Since if the server sent
+            validators for the page.
+        """
+        state = self.pages.get(page, {})
+        headers = {}
+        if state.get('etag') is not None:
+            headers['If-None-Match'] = state['etag']
+        if state.get('modified') is not None:
+            headers['If-Modified-Since'] = state['modified']
+        return headers
+
+
+    def validators(self, page, headers):
+        """Remember the validators of a response until the page is parsed.
+
+        Parameters
+        ----------
+        page : int
+            Page number.
+        headers : dict
+            Response headers.
+        """
+        self._pending[page] = {'etag': headers.get('ETag'),
+                               'modified': headers.get('Last-Modified')}
+
+
+    def unchanged(self, page, payload):
+        """Check if a response is the same as the last one of the page.
+
+        Parameters
+        ----------
+        page : int
+            Page number.
+        payload : bytes
+            Response body.
+
+        Returns
+        -------
+        unchanged : bool
+        """
+        digest = hashlib.sha256(payload).hexdigest()
+        return self.pages.get(page, {}).get('hash') == digest
+
+
+    def update(self, page, payload=None):
+        """Record that a page was checked.
+
+        Parameters
+        ----------
+        page : int
+            Page number.
+        payload : bytes, optional
+            Response body. None if the page did not change.
+
+        Returns
+        -------
+        changed : bool
+            The page is different from the last time it was seen.
+        """
+        state = self.pages.setdefault(page, {'hash': None, 'etag': None,
+                                             'modified': None,
+                                             'changes': 0.0})
+        changed = False
+        if payload is not None:
+            digest = hashlib.sha256(payload).hexdigest()
+            changed = state['hash'] is not None and digest != state['hash']
+            state['hash'] = digest
+            state.update(self._pending.pop(page, {}))
+        # Recent changes count more
+        state['changes'] = 0.5 * state['changes'] + float(changed)
+        state['checked'] = time.time()
+        return changed
+
+
+    def priority(self, pages):
+        """Order pages so the ones most likely to have changed come first:
+        pages never seen, then by how often they changed recently.
+
+        Parameters
+        ----------
+        pages : list
+            Page numbers.
+
+        Returns
+        -------
+        pages : list
+        """
+        return sorted(pages, key=lambda p: (p in self.pages,
+                                            -self.pages.get(p, {}).get(
+                                                    'changes', 0.0), p))
+
+
+    def save(self):
+        """Write the page state."""
+        tmp = self.fname+'.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({str(p): s for p, s in self.pages.items()}, f)
+        os.replace(tmp, self.fname)
@@ -6,19 +6,24 @@ import time
 
 
 from .utils import open_wods
+from .storage import read_leaderboard, write_leaderboard
 
 
 class Clean(object):
     """An object to clean (post-process) downloaded CrossFit open data.
     """
     
-    def __init__(self, path):
+    def __init__(self, path, store=None):
         """Clean Crossfit open data object.
         
         Pareameters
         ----------
         path : string
             File path.
+        store : str, optional
+            Directory of a Parquet store to read the raw data from and save
+            the cleaned data in. path is then only used for the name of the
+            data.
             
         Returns
         -------
@@ -30,9 +35,13 @@ class Clean(object):
         cfa.Clean('Data/Men_Rx_2018_raw')
         """
         self.path = path
+        self.store = store
         
         # Open file
-        self.df = pd.read_pickle(self.path)
+        if self.store is not None:
+            self.df = read_leaderboard(self.store, self.path)
+        else:
+            self.df = pd.read_pickle(self.path)
         
         # Get year from the file name
         self.year = int(str(self.path[-8:-4]))         
@@ -169,8 +178,11 @@ class Clean(object):
        
         # Save data. Remove the '_raw' from the file
         self.dname = self.path[0:-4]
-        self.cleandata.to_pickle(self.dname)
-        self.cleandata.to_csv(path_or_buf=self.dname+'.csv')         
+        if self.store is not None:
+            write_leaderboard(self.cleandata, self.store, self.dname)
+        else:
+            self.cleandata.to_pickle(self.dname)
+            self.cleandata.to_csv(path_or_buf=self.dname+'.csv')         
         
 
     def _rm_all_0s(self):
@@ -0,0 +1,178 @@
+import asyncio # Asynchronous I/O
+import collections
+
+
+async def cancel_tasks(tasks):
+    """async function that cancels the tasks which are not done, e.g. after
+    an error or when the download is cancelled, and waits for them to
+    finish so they give back their concurrency slots.
+
+    Parameters
+    ----------
+    tasks : list
+        asyncio tasks.
+    """
+    pending = [t for t in tasks if not t.done()]
+    for task in pending:
+        task.cancel()
+    await asyncio.gather(*pending, return_exceptions=True)
+
+
+class Adaptivelimit(object):
+    """An in-flight request limit which adapts to the server.
+    """
+
+    def __init__(self, initial=10, minimum=1, maximum=100, tolerance=2.0,
+                 backoff=0.5):
+        """Adaptive concurrency limit object.
+
+        Used in place of an asyncio.Semaphore. Every limit requests that
+        complete make up a round. After a round without errors the limit
+        grows: it doubles until the first sign of congestion (slow start)
+        and then increases by one. If the smoothed latency has risen to more
+        than tolerance times the lowest latency seen the limit shrinks by
+        one. A 429, 5xx or timeout multiplies the limit by backoff. Errors of
+        requests which were already in flight at the last back off are not
+        counted again.
+
+        Parameters
+        ----------
+        initial : int
+            Starting limit.
+        minimum : int
+            Lowest limit.
+        maximum : int
+            Highest limit.
+        tolerance : float
+            Latency increase allowed before the limit shrinks.
+        backoff : float
+            Factor the limit is multiplied by on errors.
+
+        Example
+        -------
+        limit = Adaptivelimit(initial=5, maximum=50)
+        cfa.Cfopendata(2018, 1, 0, 'Data/', limit=limit)
+        limit.settled
+        """
+        self.limit = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.tolerance = tolerance
+        self.backoff = backoff
+        self.inflight = 0
+        self.history = collections.deque(maxlen=200)
+        self.nbackoffs = 0
+        self._slow_start = True
+        self._latency = None # Smoothed latency
+        self._baseline = None # Lowest smoothed latency
+        self._since_change = 0
+        self._stale = 0 # Requests started before the last back off
+        self._cond = None
+
+
+    def _condition(self):
+        """The condition is created lazily so it belongs to the running loop.
+        """
+        if self._cond is None:
+            self._cond = asyncio.Condition()
+        return self._cond
+
+
+    async def acquire(self):
+        """Wait until a request can be made."""
+        cond = self._condition()
+        async with cond:
+            await cond.wait_for(lambda: self.inflight < self.limit)
+            self.inflight += 1
+
+
+    async def release(self, latency, status=200):
+        """Record a finished request and adapt the limit.
+
+        Parameters
+        ----------
+        latency : float
+            Seconds the request took.
+        status : int or None
+            HTTP status code. None if the request timed out.
+        """
+        self.inflight -= 1
+        stale = self._stale > 0
+        if stale:
+            self._stale -= 1
+        if status is None or status == 429 or status >= 500:
+            # Errors of requests made before the last back off were already
+            # accounted for
+            if not stale:
+                self.limit = max(self.minimum, int(self.limit * self.backoff))
+                self.nbackoffs += 1
+                self._slow_start = False
+                self._stale = self.inflight
+                self._since_change = 0
+        else:
+            if self._latency is None:
+                self._latency = latency
+            else:
+                self._latency = 0.8 * self._latency + 0.2 * latency
+            if self._baseline is None or self._latency < self._baseline:
+                self._baseline = self._latency
+            self._since_change += 1
+            if self._since_change >= self.limit:
+                self._adapt()
+        self.history.append(self.limit)
+        await self._wake()
+
+
+    async def cancel(self):
+        """Give back the slot of a request which did not finish, e.g. it was
+        cancelled, without counting it towards the limit."""
+        self.inflight -= 1
+        if self._stale > 0:
+            self._stale -= 1
+        await self._wake()
+
+
+    async def _wake(self):
+        """Only wake as many waiting requests as can start."""
+        cond = self._condition()
+        async with cond:
+            cond.notify(max(0, self.limit - self.inflight))
+
+
+    def _adapt(self):
+        """Grow or shrink the limit at the end of a round."""
+        if self._latency <= self.tolerance * self._baseline:
+            if self._slow_start:
+                self.limit = min(self.maximum, self.limit * 2)
+            else:
+                self.limit = min(self.maximum, self.limit + 1)
+        else:
+            self._slow_start = False
+            self.limit = max(self.minimum, self.limit - 1)
+        self._since_change = 0
+        return self
+
+
+    @property
+    def settled(self):
+        """The concurrency the limit settled on: the median of the most
+        recent limits.
+
+        Returns
+        -------
+        settled : int
+        """
+        if len(self.history) == 0:
+            return self.limit
+        return sorted(self.history)[len(self.history) // 2]
+
+
+    def summary(self):
+        """Summary of the limit.
+
+        Returns
+        -------
+        out : str
+        """
+        return 'concurrency: '+str(self.settled)+' (backed off '+\
+               str(self.nbackoffs)+' times)'
@@ -0,0 +1,169 @@
+class Userindex(object):
+    """A hash index of the athletes of a leaderboard download, kept up to
+    date as pages arrive, to find the athletes who moved between pages while
+    it was being downloaded.
+    """
+
+    def __init__(self):
+        """User_id index object.
+
+        Ranks change during the Open, so athletes slide across page
+        boundaries while a leaderboard is downloaded. They show up on two
+        pages, or on none. The index keeps the page of each User_id. An
+        athlete on several pages is kept on the page fetched last, which has
+        the freshest copy. A page fetched again replaces its athletes. Ranks
+        missing between two pages flag both pages to be fetched again.
+
+        Example
+        -------
+        users = Userindex()
+        users.add(1, buffers['User_id'], buffers['Overall_rank'])
+        users.gaps()
+        """
+        self._pages = {} # Page to (fetch number, User_ids, ranks)
+        self._where = {} # User_id to page, for athletes on one page
+        self._dups = {} # User_id to pages, for athletes on several pages
+        self._seq = 0
+
+
+    def add(self, page, users, ranks):
+        """Add the athletes of a page. A page added again replaces the
+        athletes it had before.
+
+        Parameters
+        ----------
+        page : int
+            Page number.
+        users : list
+            User_id of each row.
+        ranks : list
+            Overall_rank of each row.
+        """
+        if page in self._pages:
+            self._remove(page)
+        self._seq += 1
+        self._pages[page] = (self._seq, list(users), list(ranks))
+        for u in users:
+            if u in self._dups:
+                self._dups[u].add(page)
+            elif u in self._where and self._where[u] != page:
+                self._dups[u] = set([self._where.pop(u), page])
+            else:
+                self._where[u] = page
+        return self
+
+
+    def _remove(self, page):
+        """Remove the athletes of a page."""
+        seq, users, ranks = self._pages.pop(page)
+        for u in users:
+            if u in self._dups:
+                pages = self._dups[u]
+                pages.discard(page)
+                if len(pages) == 1:
+                    self._where[u] = pages.pop()
+                    del self._dups[u]
+            elif self._where.get(u) == page:
+                del self._where[u]
+
+
+    def __len__(self):
+        return len(self._where) + len(self._dups)
+
+
+    def duplicates(self):
+        """Number of athletes on more than one page.
+
+        Returns
+        -------
+        n : int
+        """
+        return len(self._dups)
+
+
+    def owner(self, user):
+        """Page of the copy of an athlete which is kept.
+
+        Parameters
+        ----------
+        user : str
+            User_id.
+
+        Returns
+        -------
+        page : int or None
+            The page fetched last of the pages with the athlete.
+        """
+        if user in self._dups:
+            return max(self._dups[user], key=lambda p: self._pages[p][0])
+        return self._where.get(user)
+
+
+    def keep(self, page, users):
+        """Rows of a page which are the kept copy of their athlete.
+
+        Parameters
+        ----------
+        page : int
+            Page number.
+        users : list
+            User_id of each row.
+
+        Returns
+        -------
+        keep : list
+            A bool for each row.
+        """
+        seen = set()
+        out = []
+        for u in users:
+            keep = u not in seen and (u not in self._dups or
+                                      self.owner(u) == page)
+            seen.add(u)
+            out.append(keep)
+        return out
+
+
+    def gaps(self):
+        """Pages on either side of missing ranks.
+
+        Athletes who tie share a rank and the next rank skips ahead by the
+        number of athletes tied, e.g. 1, 2, 2, 4. Any other jump means
+        athletes are missing. Rows which are not the kept copy of their
+        athlete and ranks which are not numbers are ignored, as are gaps
+        where whole pages are missing.
+
+        Returns
+        -------
+        pages : list
+            Pages to fetch again, in ascending order.
+        """
+        rows = []
+        for page, (seq, users, ranks) in self._pages.items():
+            for u, r, keep in zip(users, ranks, self.keep(page, users)):
+                try:
+                    r = int(r)
+                except (TypeError, ValueError):
+                    continue
+                if keep:
+                    rows.append((r, page))
+        rows.sort()
+        pages = set()
+        expected = 1
+        last = 0 # Page of the last row of the previous rank
+        i = 0
+        while i < len(rows):
+            r = rows[i][0]
+            j = i
+            while j < len(rows) and rows[j][0] == r:
+                j += 1
+            # Pages which are missing altogether are not gaps
+            if r > expected and rows[i][1] - last <= 1:
+                pages.add(rows[i][1])
+                if last > 0:
+                    pages.add(last)
+            # The rank after a tie skips the tied athletes
+            expected = r + j - i
+            last = rows[j-1][1]
+            i = j
+        return sorted(pages)
@@ -0,0 +1,114 @@
+import contextlib
+import os
+import sys
+import threading
+
+
+def current_rss():
+    """Resident set size of the process.
+
+    Returns
+    -------
+    rss : float
+        MB. The peak so far where the current size can't be read, and 0 on
+        Windows.
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE') / 1024. ** 2
+    except (OSError, ValueError, IndexError):
+        try:
+            import resource # Unix only
+        except ImportError:
+            return 0.0
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Kilobytes on Linux, bytes on macOS
+        if sys.platform == 'darwin':
+            return peak / 1024. ** 2
+        return peak / 1024.
+
+
+def deep_size(buffers):
+    """Approximate memory used by column buffers.
+
+    Parameters
+    ----------
+    buffers : dict
+        Column buffers.
+
+    Returns
+    -------
+    size : int
+        Bytes.
+    """
+    size = 0
+    for values in buffers.values():
+        size += sys.getsizeof(values)
+        for v in values:
+            size += sys.getsizeof(v)
+    return size
+
+
+class Memorymonitor(object):
+    """Peak memory of each phase of a download.
+    """
+
+    def __init__(self, interval=0.05):
+        """Memory monitor object.
+
+        A background thread samples the resident set size while a phase
+        runs.
+
+        Parameters
+        ----------
+        interval : float
+            Seconds between samples.
+
+        Example
+        -------
+        monitor = Memorymonitor()
+        with monitor.phase('download'):
+            ...
+        monitor.summary()
+        """
+        self.interval = interval
+        self.peaks = {}
+
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """Sample the memory while the block runs.
+
+        Parameters
+        ----------
+        name : str
+            Name of the phase.
+        """
+        stop = threading.Event()
+        peak = [current_rss()]
+
+        def sample():
+            while not stop.wait(self.interval):
+                peak[0] = max(peak[0], current_rss())
+
+        thread = threading.Thread(target=sample, daemon=True)
+        thread.start()
+        try:
+            yield self
+        finally:
+            stop.set()
+            thread.join()
+            peak[0] = max(peak[0], current_rss())
+            self.peaks[name] = max(self.peaks.get(name, 0.0), peak[0])
+
+
+    def summary(self):
+        """Summary of the peaks.
+
+        Returns
+        -------
+        out : str
+        """
+        return 'peak RSS: '+', '.join(name+' '+str(int(round(peak)))+' MB'
+                                      for name, peak in self.peaks.items())
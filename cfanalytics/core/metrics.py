@@ -0,0 +1,218 @@
+import bisect
+import json
+import threading
+import time
+
+
+# Upper bounds in seconds of the histogram buckets. The last bucket is
+# everything slower
+_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+            30.0]
+
+
+class _Histogram(object):
+    """Counts of values in fixed buckets."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.max = 0.0
+        self.n = 0
+
+
+    def add(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.max = max(self.max, value)
+        self.n += 1
+
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q quantile."""
+        if self.n == 0:
+            return None
+        rank = q * self.n
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+
+    def summary(self):
+        return {'count': self.n,
+                'mean': self.total / max(1, self.n),
+                'max': self.max,
+                'p50': self.quantile(0.5),
+                'p95': self.quantile(0.95),
+                'p99': self.quantile(0.99),
+                'buckets': dict(zip([str(b) for b in self.buckets] + ['inf'],
+                                    self.counts))}
+
+
+class Downloadmetrics(object):
+    """Counters and histograms of the requests and parsing of a download.
+    """
+
+    def __init__(self, callback=None, buckets=None):
+        """Download metrics object.
+
+        Records the latency, status and size of every request, the retries,
+        the depth of the queue of pages waiting to be parsed and the parse
+        time of every page.
+
+        Parameters
+        ----------
+        callback : function, optional
+            Called with a dict for every event, e.g. to forward them to a
+            monitoring system. The dict has 'event' ('request', 'retry',
+            'parse' or 'queue') and the values of the event.
+        buckets : list, optional
+            Upper bounds in seconds of the histogram buckets.
+
+        Example
+        -------
+        metrics = Downloadmetrics()
+        cfa.Cfopendata(2018, 1, 0, 'Data/', metrics=metrics)
+        metrics.summary()
+        """
+        if buckets is None:
+            buckets = _BUCKETS
+        self.callback = callback
+        self.start_time = time.time()
+        self.latency = _Histogram(buckets)
+        self.parse_time = _Histogram(buckets)
+        self.status = {}
+        self.bytes = 0
+        self.retries = 0
+        self.pages = 0
+        self.rows = 0
+        self.max_queue = 0
+        self._queue_total = 0
+        self._queue_n = 0
+        self._lock = threading.Lock()
+
+
+    def _emit(self, event, **values):
+        if self.callback is not None:
+            values['event'] = event
+            self.callback(values)
+
+
+    def request(self, latency, status, nbytes=0):
+        """Record a finished request.
+
+        Parameters
+        ----------
+        latency : float
+            Seconds the request took.
+        status : int or None
+            HTTP status. None for timeouts and connection errors.
+        nbytes : int
+            Size of the response body.
+        """
+        key = 'error' if status is None else str(status)
+        with self._lock:
+            self.latency.add(latency)
+            self.status[key] = self.status.get(key, 0) + 1
+            self.bytes += nbytes
+        self._emit('request', latency=latency, status=status, bytes=nbytes)
+
+
+    def retry(self):
+        """Record a retried request."""
+        with self._lock:
+            self.retries += 1
+        self._emit('retry')
+
+
+    def parsed(self, seconds, rows):
+        """Record a parsed page.
+
+        Parameters
+        ----------
+        seconds : float
+            Seconds the page took to parse.
+        rows : int
+            Rows of the page.
+        """
+        with self._lock:
+            self.parse_time.add(seconds)
+            self.pages += 1
+            self.rows += rows
+        self._emit('parse', seconds=seconds, rows=rows)
+
+
+    def queued(self, depth):
+        """Record the number of pages waiting to be parsed.
+
+        Parameters
+        ----------
+        depth : int
+        """
+        with self._lock:
+            self.max_queue = max(self.max_queue, depth)
+            self._queue_total += depth
+            self._queue_n += 1
+        self._emit('queue', depth=depth)
+
+
+    def summary(self):
+        """Summary of the metrics.
+
+        Returns
+        -------
+        summary : dict
+            Can be written as JSON.
+        """
+        seconds = time.time() - self.start_time
+        with self._lock:
+            return {'seconds': seconds,
+                    'requests': self.latency.n,
+                    'status': dict(self.status),
+                    'bytes': self.bytes,
+                    'retries': self.retries,
+                    'pages': self.pages,
+                    'rows': self.rows,
+                    'pages_per_second': self.pages / max(seconds, 1e-9),
+                    'latency': self.latency.summary(),
+                    'parse_time': self.parse_time.summary(),
+                    'queue_depth': {'mean': self._queue_total / \
+                                            max(1, self._queue_n),
+                                    'max': self.max_queue}}
+
+
+    def save(self, fname):
+        """Write the summary to a JSON file.
+
+        Parameters
+        ----------
+        fname : str
+            File name.
+        """
+        with open(fname, 'w') as f:
+            json.dump(self.summary(), f, indent=1)
+
+
+    def describe(self):
+        """One line summary.
+
+        Returns
+        -------
+        out : str
+        """
+        s = self.summary()
+        out = str(s['requests'])+' requests ('+\
+              ', '.join(k+': '+str(v) for k, v in sorted(s['status'].items()))+\
+              '), '+str(round(s['bytes'] / 1024. ** 2, 1))+' MB, '+\
+              str(s['retries'])+' retries, '+\
+              str(round(s['pages_per_second'], 1))+' pages/s'
+        if s['latency']['count'] > 0:
+            out += ', latency p50 '+str(round(s['latency']['p50'], 3))+\
+                   ' s p95 '+str(round(s['latency']['p95'], 3))+' s'
+        if s['parse_time']['count'] > 0:
+            out += ', parse mean '+\
+                   str(round(s['parse_time']['mean'] * 1000, 1))+' ms'
+        return out
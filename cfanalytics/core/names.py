@@ -0,0 +1,233 @@
+import json
+import os
+import re
+import unicodedata
+
+import numpy as np
+
+
+# Columns of the affiliate list which are indexed
+FIELDS = ['City', 'State', 'Country', 'Affiliate_name']
+
+
+def normalize_name(name):
+    """Key of a name: lower case, without accents and punctuation.
+
+    Parameters
+    ----------
+    name : str
+
+    Returns
+    -------
+    key : str
+        e.g. 'São Paulo ' gives 'sao paulo'.
+    """
+    if name is None or name != name:
+        return ''
+    name = unicodedata.normalize('NFKD', str(name))
+    name = ''.join(c for c in name if not unicodedata.combining(c))
+    return ' '.join(re.sub(r'[\W_]+', ' ', name.casefold()).split())
+
+
+def _trigrams(key):
+    """Trigrams of a key. The start of the key is padded so short keys and
+    the first letters count."""
+    padded = '  '+key+' '
+    return set(padded[i:i+3] for i in range(len(padded) - 2))
+
+
+class Nameindex(object):
+    """A lookup of affiliate ids by City, State, Country and Affiliate_name,
+    which ignores case and accents and finds misspelled names.
+    """
+
+    def __init__(self, path, dname='Affiliate_list'):
+        """Name index object.
+
+        For each field the normalized key of every name (see
+        normalize_name()) maps to the ids of the affiliates with it, so an
+        exact lookup is a dict lookup. A trigram index of the keys scores
+        the keys which share trigrams with a misspelled name. The index is
+        saved to path/dname_names.json.
+
+        Parameters
+        ----------
+        path : str
+            Directory of the affiliate list.
+        dname : str
+            Name of the affiliate list.
+
+        Example
+        -------
+        index = Nameindex('Data/').build(df)
+        index.save()
+        Nameindex('Data/').get('miami', 'City')
+        Nameindex('Data/').fuzzy('Maimi', 'City')
+        """
+        self.path = path
+        self.dname = dname
+        self.fname = os.path.join(self.path, self.dname+'_names.json')
+        self.fields = {}
+        self._reset()
+        if os.path.isfile(self.fname):
+            with open(self.fname) as f:
+                self.fields = json.load(f)
+
+
+    def build(self, df):
+        """Build the index of an affiliate list.
+
+        Parameters
+        ----------
+        df : pd.DataFrame
+            Affiliate list with Affiliate_id and the FIELDS columns.
+
+        Returns
+        -------
+        self : Nameindex
+        """
+        aids = [int(aid) for aid in df['Affiliate_id'].values]
+        self.fields = {}
+        for field in FIELDS:
+            keys = {} # Key to its position in the lists
+            names, ids, sizes, trigrams = [], [], [], {}
+            for aid, name in zip(aids, df[field].values):
+                key = normalize_name(name)
+                if key == '':
+                    continue
+                if key not in keys:
+                    keys[key] = len(names)
+                    names.append(str(name).strip())
+                    ids.append([])
+                    key_trigrams = _trigrams(key)
+                    sizes.append(len(key_trigrams))
+                    for t in key_trigrams:
+                        trigrams.setdefault(t, []).append(keys[key])
+                ids[keys[key]].append(aid)
+            self.fields[field] = {'keys': list(keys), 'names': names,
+                                  'ids': ids, 'sizes': sizes,
+                                  'trigrams': trigrams}
+        self._reset()
+        return self
+
+
+    def _reset(self):
+        """Forget the lookups made from self.fields when they were needed."""
+        self._keys = {} # Position of each key of a field
+        self._sizes = {} # Number of trigrams of each key of a field
+        self._postings = {} # Positions of the keys with a trigram
+
+
+    def save(self):
+        """Write the index to self.fname."""
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+        with open(self.fname+'.tmp', 'w') as f:
+            json.dump(self.fields, f)
+        os.replace(self.fname+'.tmp', self.fname)
+
+
+    def _positions(self, field):
+        """Dict of the keys of a field to their position, made once."""
+        if field not in self._keys:
+            self._keys[field] = {k: i for i, k in
+                                 enumerate(self.fields[field]['keys'])}
+        return self._keys[field]
+
+
+    def get(self, name, field='City'):
+        """Ids of the affiliates with a name, ignoring case, accents and
+        punctuation.
+
+        Parameters
+        ----------
+        name : str
+        field : str
+            'City', 'State', 'Country' or 'Affiliate_name'.
+
+        Returns
+        -------
+        aids : list
+            Affiliate ids. Empty if no affiliate has the name.
+        """
+        i = self._positions(field).get(normalize_name(name))
+        if i is None:
+            return []
+        return list(self.fields[field]['ids'][i])
+
+
+    def fuzzy(self, name, field='City', cutoff=0.3, limit=5):
+        """Names most like a name, e.g. misspelled.
+
+        The score is the share of the trigrams of the two keys which they
+        have in common (Jaccard similarity), 1 for the same key.
+
+        Parameters
+        ----------
+        name : str
+        field : str
+            'City', 'State', 'Country' or 'Affiliate_name'.
+        cutoff : float
+            Lowest score to return.
+        limit : int
+            Most names to return.
+
+        Returns
+        -------
+        matches : list
+            Tuples of name, score and affiliate ids, best first.
+        """
+        index = self.fields[field]
+        query = _trigrams(normalize_name(name))
+        postings = [self._posting(field, t) for t in query]
+        postings = [p for p in postings if len(p) > 0]
+        if len(postings) == 0:
+            return []
+        # Trigrams each key shares with the name
+        shared = np.bincount(np.concatenate(postings),
+                             minlength=len(index['keys']))
+        if field not in self._sizes:
+            self._sizes[field] = np.array(index['sizes'])
+        scores = shared / (len(query) + self._sizes[field] - shared)
+        ix = np.nonzero(scores >= cutoff)[0]
+        ix = ix[np.argsort(-scores[ix], kind='stable')[:limit]]
+        return [(index['names'][i], float(scores[i]), list(index['ids'][i]))
+                for i in ix]
+
+
+    def _posting(self, field, trigram):
+        """Positions of the keys of a field with a trigram, as an array."""
+        if (field, trigram) not in self._postings:
+            self._postings[(field, trigram)] = np.array(
+                    self.fields[field]['trigrams'].get(trigram, []),
+                    dtype=np.int64)
+        return self._postings[(field, trigram)]
+
+
+    def find(self, name, field='City', cutoff=0.4):
+        """Ids of the affiliates with a name, or with the name most like it
+        if no affiliate has it.
+
+        Parameters
+        ----------
+        name : str
+        field : str
+            'City', 'State', 'Country' or 'Affiliate_name'.
+        cutoff : float
+            Lowest score of a fuzzy match, see fuzzy().
+
+        Returns
+        -------
+        match : str or None
+            Name which was found.
+        aids : list
+            Affiliate ids.
+        """
+        aids = self.get(name, field)
+        if len(aids) > 0:
+            i = self._positions(field)[normalize_name(name)]
+            return self.fields[field]['names'][i], aids
+        matches = self.fuzzy(name, field, cutoff=cutoff, limit=1)
+        if len(matches) == 0:
+            return None, []
+        return matches[0][0], matches[0][2]
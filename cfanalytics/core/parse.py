@@ -0,0 +1,256 @@
+import pandas as pd
+import numpy as np
+
+
+import codecs
+import json
+
+
+# Keys of the leaderboard JSON for each response schema. The 2018 API nests
+# the athlete information in 'entrant', 2017 keeps it at the top level.
+_SCHEMAS = {2017: {'rows': 'athletes',
+                   'entrant': None,
+                   'athlete': ['userid', 'name', 'height', 'weight', 'age',
+                               'regionid', 'region', 'affiliateid'],
+                   'overall': ['overallrank', 'overallscore'],
+                   'score': ['workoutrank', 'scoredisplay']},
+            2018: {'rows': 'leaderboardRows',
+                   'entrant': 'entrant',
+                   'athlete': ['competitorId', 'competitorName', 'height',
+                               'weight', 'age', 'regionId', 'regionName',
+                               'affiliateId'],
+                   'overall': ['overallRank', 'overallScore'],
+                   'score': ['rank', 'scoreDisplay']}}
+
+# Keys of the getAffiliateInfo JSON after the Affiliate_id column
+_AFFILIATE_KEYS = ['name', 'address', 'city', 'state', 'zip', 'country',
+                   'website', 'phone']
+
+# Columns of a getAllAffiliates.php row
+_LOCATION_KEYS = ['Latitude', 'Longitude', 'Affiliate_name', 'Affiliate_id']
+
+
+def leaderboard_schema(year):
+    """Keys of the leaderboard response for a given year.
+
+    Parameters
+    ----------
+    year : int
+        Year of the Open e.g. 2018.
+
+    Returns
+    -------
+    schema : dict
+        Response keys.
+    """
+    if year == 2018:
+        return _SCHEMAS[2018]
+    else:
+        return _SCHEMAS[2017]
+
+
+def new_buffers(columns):
+    """Create empty column buffers.
+
+    Parameters
+    ----------
+    columns : list
+        Column names.
+
+    Returns
+    -------
+    buffers : dict
+        A list for each column.
+    """
+    return {c: [] for c in columns}
+
+
+def parse_leaderboard(response, year, wodscompleted, buffers):
+    """Append the athletes of a leaderboard page to column buffers.
+
+    Parameters
+    ----------
+    response : dict
+        Leaderboard page response.
+    year : int
+        Year of the Open e.g. 2018.
+    wodscompleted : int
+        Number of workouts in the Open.
+    buffers : dict
+        Column buffers from new_buffers(). Columns must be in the order
+        of Cfopendata.columns.
+
+    Returns
+    -------
+    nathletes : int
+        Number of athletes added.
+    """
+    schema = leaderboard_schema(year)
+    entrant_key = schema['entrant']
+    appends = [buf.append for buf in buffers.values()]
+    athlete_cols = list(zip(appends[0:8], schema['athlete']))
+    overall_cols = list(zip(appends[8:10], schema['overall']))
+    rank_key, score_key = schema['score']
+    score_cols = [(appends[10+2*j], appends[11+2*j], j)
+                  for j in range(wodscompleted)]
+
+    athletes = response[schema['rows']]
+    for athlete in athletes:
+        if entrant_key is None:
+            entrant = athlete
+        else:
+            entrant = athlete[entrant_key]
+        for append, key in athlete_cols:
+            append(entrant[key])
+        for append, key in overall_cols:
+            append(athlete[key])
+        scores = athlete['scores']
+        for append_rank, append_score, j in score_cols:
+            append_rank(scores[j][rank_key])
+            append_score(scores[j][score_key])
+    return len(athletes)
+
+
+def parse_affiliate(aid, response, buffers):
+    """Append an affiliate to column buffers.
+
+    Parameters
+    ----------
+    aid : int
+        Affiliate id the response was requested with.
+    response : dict
+        getAffiliateInfo response.
+    buffers : dict
+        Column buffers from new_buffers(). Columns must be in the order
+        of Affiliatelist.columns.
+
+    Returns
+    -------
+    naffiliates : int
+        1 if the affiliate was added, 0 for an unused id.
+    """
+    if response['name'] is None:
+        return 0
+    appends = [buf.append for buf in buffers.values()]
+    appends[0](aid)
+    for append, key in zip(appends[1:], _AFFILIATE_KEYS):
+        append(response[key])
+    return 1
+
+
+def parse_all_affiliates(chunks):
+    """Decode a getAllAffiliates.php response body a row at a time into
+    columns.
+
+    The body is one JSON list of [latitude, longitude, name, Affiliate id]
+    rows. Each row is decoded as soon as its chunk arrives, so the whole
+    body and its nested lists are never held at once.
+
+    Parameters
+    ----------
+    chunks : iterable
+        Response body as bytes, in one or more chunks.
+
+    Returns
+    -------
+    columns : dict
+        Affiliate_id (int), Latitude and Longitude (float, NaN if missing)
+        and Affiliate_name arrays.
+    """
+    decode = codecs.getincrementaldecoder('utf-8')().decode
+    decoder = json.JSONDecoder()
+    buffers = new_buffers(_LOCATION_KEYS)
+    appends = [buf.append for buf in buffers.values()]
+    text = ''
+    started = False # Past the opening bracket of the list
+    ended = False
+    for chunk in chunks:
+        text += decode(chunk)
+        pos = 0
+        while pos < len(text) and not ended:
+            c = text[pos]
+            if c.isspace() or (started and c == ','):
+                pos += 1
+            elif not started and c == '[':
+                started = True
+                pos += 1
+            elif started and c == ']':
+                ended = True
+                pos += 1
+            elif started and c == '[':
+                try:
+                    row, pos = decoder.raw_decode(text, pos)
+                except ValueError:
+                    # The row goes on in the next chunk
+                    break
+                for append, v in zip(appends, row):
+                    append(v)
+            else:
+                raise ValueError('getAllAffiliates.php response is not a '+\
+                                 'list of rows: '+text[pos:pos+50])
+        text = text[pos:]
+    text += decode(b'', final=True)
+    if not ended or text.strip() != '':
+        raise ValueError('getAllAffiliates.php response is incomplete: '+\
+                         text[:50])
+    return {'Affiliate_id': np.asarray(buffers['Affiliate_id']
+                                       ).astype(np.int64),
+            'Latitude': pd.to_numeric(pd.Series(buffers['Latitude'],
+                                                dtype=object),
+                                      errors='coerce').values.astype(
+                                              np.float64),
+            'Longitude': pd.to_numeric(pd.Series(buffers['Longitude'],
+                                                 dtype=object),
+                                       errors='coerce').values.astype(
+                                               np.float64),
+            'Affiliate_name': np.array(buffers['Affiliate_name'],
+                                       dtype=object)}
+
+
+def parse_payload(payload, year, wodscompleted, columns):
+    """Decode a leaderboard response body into column buffers of its own.
+
+    A module level function so it can run in a process pool: the body goes
+    to the worker and only the columnar chunk comes back.
+
+    Parameters
+    ----------
+    payload : bytes
+        Leaderboard page response body.
+    year : int
+        Year of the Open e.g. 2018.
+    wodscompleted : int
+        Number of workouts in the Open.
+    columns : list
+        Column names.
+
+    Returns
+    -------
+    buffers : dict
+        Column buffers of the page.
+    """
+    buffers = new_buffers(columns)
+    parse_leaderboard(json.loads(payload), year, wodscompleted, buffers)
+    return buffers
+
+
+def buffers_to_frame(buffers, columns):
+    """Create a DataFrame from column buffers and empty the buffers.
+
+    Parameters
+    ----------
+    buffers : dict
+        Column buffers.
+    columns : list
+        Column names.
+
+    Returns
+    -------
+    df : pd.DataFrame
+        Data in the buffers.
+    """
+    df = pd.DataFrame({c: buffers[c] for c in columns}, columns=columns,
+                      dtype=object)
+    for c in columns:
+        buffers[c] = []
+    return df
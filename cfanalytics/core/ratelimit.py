@@ -0,0 +1,320 @@
+import asyncio # Asynchronous I/O
+
+
+import collections
+import heapq
+import itertools
+import threading
+import time
+from urllib.parse import urlsplit
+
+
+class _Bucket(object):
+    """Token bucket of one host."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.cap = rate # Rate set by the user
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.time()
+        self.paused_until = 0.0
+        self.waiting = [] # Heap of [priority, sequence, asyncio.Event]
+        self.granted = 0
+        self.throttled = 0
+        self.waited = 0.0
+        self.max_wait = 0.0
+        self.recent = collections.deque() # Times of the recent grants
+        self.changed = 0.0 # Time the rate last changed
+
+
+    def wait_time(self, now):
+        """Seconds until a token is free. Tokens may be negative when they
+        were reserved ahead by blocking calls."""
+        if now < self.paused_until:
+            return self.paused_until - now
+        if self.rate is None:
+            return 0.0
+        self.tokens = min(self.burst, self.tokens + \
+                          (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+    def take(self, now, waited, increase):
+        # Tokens are only counted while there is a rate, so no debt builds
+        # up before the first 429
+        if self.rate is not None:
+            self.tokens -= 1
+        self.granted += 1
+        self.waited += waited
+        self.max_wait = max(self.max_wait, waited)
+        self.recent.append(now)
+        while self.recent and self.recent[0] < now - 1:
+            self.recent.popleft()
+        # A rate lowered by a 429 creeps back up every second without one,
+        # but only while the requests come close to it
+        if self.throttled > 0 and self.rate is not None and \
+           now - self.changed > 1 and self.observed() >= 0.8 * self.rate:
+            self.rate = self.rate * increase
+            if self.cap is not None:
+                self.rate = min(self.cap, self.rate)
+            self.changed = now
+
+
+    def observed(self):
+        """Requests granted in the last second."""
+        return float(len(self.recent))
+
+
+class Ratelimiter(object):
+    """A token bucket per host shared by every download in the process.
+    """
+
+    def __init__(self, rates=None, burst=None, slowdown=0.9, increase=1.1):
+        """Rate limiter object.
+
+        Every HTTP request of cfanalytics.core waits for a token of its host.
+        Waiting requests are served in priority order (lowest first) and in
+        arrival order within a priority. Hosts without a rate are not
+        limited until the server throttles: a 429 pauses the host for its
+        Retry-After and sets its rate just under the rate that tripped it.
+        The rate then grows by increase every second without a 429 while
+        the requests come close to it, up to the rate set for the host, so
+        it settles just under the server limit.
+
+        Parameters
+        ----------
+        rates : dict, optional
+            Requests per second of each host e.g. {'games.crossfit.com': 20}.
+        burst : float, optional
+            Tokens a bucket holds. By default one second of requests.
+        slowdown : float
+            Factor the rate is multiplied by after a 429.
+        increase : float
+            Factor the rate is multiplied by every second without a 429.
+
+        Example
+        -------
+        limiter = cfa.get_ratelimiter()
+        limiter.set_rate('games.crossfit.com', 20)
+        cfa.Bulkdownload([2018], range(1, 20), [0, 1], 'Data/')
+        limiter.metrics()
+        """
+        self.burst = burst
+        self.slowdown = slowdown
+        self.increase = increase
+        self._buckets = {}
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        for host, rate in (rates or {}).items():
+            self.set_rate(host, rate)
+
+
+    def _host(self, url):
+        return urlsplit(url).netloc or url
+
+
+    def _bucket(self, host):
+        if host not in self._buckets:
+            self._buckets[host] = _Bucket(None, 1.0)
+        return self._buckets[host]
+
+
+    def set_rate(self, host, rate):
+        """Set the requests per second of a host.
+
+        Parameters
+        ----------
+        host : str
+            Host name or URL.
+        rate : float or None
+            Requests per second. None for no limit.
+        """
+        with self._lock:
+            bucket = self._bucket(self._host(host))
+            bucket.rate = rate
+            bucket.cap = rate
+            if rate is not None:
+                bucket.burst = self.burst or max(1.0, float(rate))
+                bucket.tokens = max(-bucket.burst,
+                                    min(bucket.tokens, bucket.burst))
+        return self
+
+
+    async def acquire(self, url, priority=0):
+        """Wait for a token of the host of url.
+
+        Parameters
+        ----------
+        url : str
+            URL of the request.
+        priority : int
+            Lower is served first.
+        """
+        bucket = self._bucket(self._host(url))
+        start_time = time.time()
+        entry = [priority, next(self._seq), asyncio.Event()]
+        heapq.heappush(bucket.waiting, entry)
+        try:
+            while True:
+                if bucket.waiting[0] is entry:
+                    with self._lock:
+                        now = time.time()
+                        wait = bucket.wait_time(now)
+                        if wait <= 0:
+                            bucket.take(now, now - start_time,
+                                        self.increase)
+                    if wait <= 0:
+                        heapq.heappop(bucket.waiting)
+                        self._wake(bucket)
+                        return
+                    await asyncio.sleep(wait)
+                else:
+                    entry[2].clear()
+                    await entry[2].wait()
+        except asyncio.CancelledError:
+            if entry in bucket.waiting:
+                bucket.waiting.remove(entry)
+                heapq.heapify(bucket.waiting)
+                self._wake(bucket)
+            raise
+
+
+    def _wake(self, bucket):
+        """Let the next waiting request of a bucket check for a token."""
+        if len(bucket.waiting) > 0:
+            bucket.waiting[0][2].set()
+
+
+    def wait(self, url):
+        """Blocking version of acquire for requests made outside the event
+        loop. The token is reserved straight away, ahead of waiting
+        asynchronous requests.
+
+        Parameters
+        ----------
+        url : str
+            URL of the request.
+        """
+        bucket = self._bucket(self._host(url))
+        with self._lock:
+            now = time.time()
+            wait = bucket.wait_time(now)
+            bucket.take(now, max(0.0, wait), self.increase)
+        if wait > 0:
+            time.sleep(wait)
+
+
+    def throttled(self, url, retry_after=None):
+        """Record a 429 from the host of url: pause the host and slow it
+        down.
+
+        Parameters
+        ----------
+        url : str
+            URL of the request.
+        retry_after : float, optional
+            Seconds the server asked to wait. By default 1.
+        """
+        if retry_after is None:
+            retry_after = 1.0
+        with self._lock:
+            bucket = self._bucket(self._host(url))
+            bucket.throttled += 1
+            now = time.time()
+            if bucket.paused_until > now:
+                # Already handled a 429 of this burst
+                return self
+            bucket.paused_until = now + retry_after
+            # Tokens only build up again once the pause is over
+            bucket.updated = bucket.paused_until
+            # The rate which tripped the server is at most the one observed
+            rate = bucket.observed()
+            if bucket.rate is not None:
+                rate = min(bucket.rate, rate)
+            bucket.rate = max(1.0, rate * self.slowdown)
+            bucket.burst = self.burst or max(1.0, bucket.rate)
+            bucket.tokens = 0.0
+            bucket.changed = now
+        return self
+
+
+    def limited(self, url):
+        """Check if the host of url has a rate or was throttled.
+
+        Returns
+        -------
+        limited : bool
+        """
+        bucket = self._buckets.get(self._host(url))
+        return bucket is not None and (bucket.rate is not None or
+                                       bucket.throttled > 0)
+
+
+    def metrics(self):
+        """Metrics of each host.
+
+        Returns
+        -------
+        metrics : dict
+            For each host: rate, observed (requests granted in the last
+            second), granted, throttled (429s), waiting, mean_wait and
+            max_wait (seconds).
+        """
+        out = {}
+        for host, bucket in self._buckets.items():
+            out[host] = {'rate': bucket.rate,
+                         'observed': bucket.observed(),
+                         'granted': bucket.granted,
+                         'throttled': bucket.throttled,
+                         'waiting': len(bucket.waiting),
+                         'mean_wait': bucket.waited / max(1, bucket.granted),
+                         'max_wait': bucket.max_wait}
+        return out
+
+
+    def summary(self, url):
+        """Summary of the host of url.
+
+        Returns
+        -------
+        out : str
+        """
+        host = self._host(url)
+        m = self.metrics().get(host)
+        if m is None:
+            return host+': no requests'
+        rate = 'unlimited'
+        if m['rate'] is not None:
+            rate = str(round(m['rate'], 1))+' requests/s'
+        return host+': '+rate+', '+str(m['granted'])+' requests, '+\
+               str(m['throttled'])+' throttled, waited '+\
+               str(round(m['mean_wait'], 3))+' s on average'
+
+
+# Shared by every download in the process
+_ratelimiter = Ratelimiter()
+
+
+def get_ratelimiter():
+    """The rate limiter shared by the process.
+
+    Returns
+    -------
+    ratelimiter : Ratelimiter
+    """
+    return _ratelimiter
+
+
+def set_ratelimiter(ratelimiter):
+    """Replace the rate limiter shared by the process.
+
+    Parameters
+    ----------
+    ratelimiter : Ratelimiter
+    """
+    global _ratelimiter
+    _ratelimiter = ratelimiter
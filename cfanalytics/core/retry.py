@@ -0,0 +1,133 @@
+import asyncio # Asynchronous I/O
+from aiohttp import ClientError, ClientResponseError
+
+
+import random
+
+
+class Retrypolicy(object):
+    """How failed page requests are timed out and retried.
+    """
+
+    # Errors which are worth another attempt
+    exceptions = (ClientError, asyncio.TimeoutError, ValueError)
+
+    def __init__(self, retries=3, timeout=30, base_delay=0.5, max_delay=30,
+                 requeues=2):
+        """Retry policy object.
+
+        A request is retried up to retries times with a jittered exponential
+        backoff. Pages which still fail go to a dead-letter queue and are
+        tried again, requeues times, once all other pages are downloaded.
+
+        Parameters
+        ----------
+        retries : int
+            Number of retries of a request.
+        timeout : float
+            Seconds before a request times out.
+        base_delay : float
+            Seconds to wait before the first retry.
+        max_delay : float
+            Most seconds to wait before a retry.
+        requeues : int
+            Number of times the dead-letter queue is retried.
+
+        Example
+        -------
+        cfa.Cfopendata(2018, 1, 0, 'Data/', retry=Retrypolicy(retries=5))
+        """
+        self.retries = retries
+        self.timeout = timeout
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.requeues = requeues
+
+
+    def delay(self, attempt):
+        """Seconds to wait before the next attempt ("full jitter" backoff).
+
+        Parameters
+        ----------
+        attempt : int
+            Number of attempts which failed so far (starts at 0).
+
+        Returns
+        -------
+        delay : float
+        """
+        return random.uniform(0, min(self.max_delay,
+                                     self.base_delay * 2 ** attempt))
+
+
+    def status(self, error):
+        """HTTP status of an error.
+
+        Parameters
+        ----------
+        error : Exception
+
+        Returns
+        -------
+        status : int or None
+            None if the request did not get a response.
+        """
+        if isinstance(error, ClientResponseError):
+            return error.status
+        return None
+
+
+    def describe(self, error):
+        """Short description of an error for the failed pages report.
+
+        Parameters
+        ----------
+        error : Exception
+
+        Returns
+        -------
+        out : str
+        """
+        if isinstance(error, ClientResponseError):
+            return 'HTTP '+str(error.status)+' '+str(error.message)
+        return type(error).__name__+': '+str(error)
+
+
+    def retry_after(self, error):
+        """Seconds the server asked to wait in a Retry-After header.
+
+        Parameters
+        ----------
+        error : Exception
+
+        Returns
+        -------
+        seconds : float or None
+        """
+        headers = getattr(error, 'headers', None)
+        if headers is None or headers.get('Retry-After') is None:
+            return None
+        try:
+            return float(headers.get('Retry-After'))
+        except ValueError:
+            # An HTTP date
+            return None
+
+
+    def retryable(self, error):
+        """Check if a request is worth retrying straight away. Client errors
+        such as 404 are not, the page goes to the dead-letter queue instead.
+
+        Parameters
+        ----------
+        error : Exception
+
+        Returns
+        -------
+        retryable : bool
+        """
+        status = self.status(error)
+        if status is None or status in (408, 429) or status >= 500:
+            return True
+        # e.g. a 200 without a JSON body
+        return status < 400
@@ -0,0 +1,303 @@
+import asyncio # Asynchronous I/O
+from aiohttp import (ClientSession, TCPConnector, TraceConfig, ClientTimeout,
+                     ClientResponseError, ClientConnectionError, RequestInfo)
+from multidict import CIMultiDict, CIMultiDictProxy
+from yarl import URL
+
+
+import collections
+
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+
+# A response of Connectionpool.get or Http2pool.get
+Response = collections.namedtuple('Response', ['status', 'headers', 'body'])
+
+
+class Connectionpool(object):
+    """A HTTP session and connection pool which lives for a whole download.
+    """
+
+    def __init__(self, limit=100, limit_per_host=100, ttl_dns_cache=300,
+                 keepalive_timeout=60):
+        """Connection pool object.
+
+        The aiohttp.ClientSession is created the first time it is needed so
+        it is bound to the event loop doing the download. Connections are
+        kept alive and reused by every batch of pages.
+
+        Parameters
+        ----------
+        limit : int
+            Maximum number of open connections.
+        limit_per_host : int
+            Maximum number of open connections to the same host.
+        ttl_dns_cache : int
+            Seconds to cache DNS lookups.
+        keepalive_timeout : int
+            Seconds to keep an idle connection open.
+
+        Example
+        -------
+        pool = Connectionpool(limit=50, limit_per_host=50)
+        cfa.Cfopendata(2018, 1, 0, 'Data/', pool=pool)
+        """
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.ttl_dns_cache = ttl_dns_cache
+        self.keepalive_timeout = keepalive_timeout
+        self.session = None
+        self.batches = []
+        self.new_batch()
+
+
+    def new_batch(self):
+        """Start counting requests and connections for a new batch.
+
+        Returns
+        -------
+        self.counters : dict
+            Counters of the new batch.
+        """
+        self.counters = {'requests': 0, 'new_connections': 0,
+                         'reused_connections': 0, 'dns_cache_hits': 0}
+        self.batches.append(self.counters)
+        return self.counters
+
+
+    def get_session(self):
+        """Return the shared session, creating it if needed.
+
+        Must be called from a coroutine running in the download event loop.
+
+        Returns
+        -------
+        session : aiohttp.ClientSession
+        """
+        if self.session is None or self.session.closed:
+            connector = TCPConnector(limit=self.limit,
+                                     limit_per_host=self.limit_per_host,
+                                     ttl_dns_cache=self.ttl_dns_cache,
+                                     keepalive_timeout=self.keepalive_timeout)
+            self.session = ClientSession(connector=connector,
+                                         trace_configs=[self._trace_config()])
+        return self.session
+
+
+    def _trace_config(self):
+        """Hook the connection counters into the aiohttp request tracing.
+
+        Returns
+        -------
+        trace_config : aiohttp.TraceConfig
+        """
+        def count(key):
+            async def _count(session, ctx, params):
+                self.counters[key] += 1
+            return _count
+        trace_config = TraceConfig()
+        trace_config.on_request_start.append(count('requests'))
+        trace_config.on_connection_create_end.append(count('new_connections'))
+        trace_config.on_connection_reuseconn.append(
+            count('reused_connections'))
+        trace_config.on_dns_cache_hit.append(count('dns_cache_hits'))
+        return trace_config
+
+
+    def summary(self):
+        """Summary of the counters of the current batch.
+
+        Returns
+        -------
+        out : str
+        """
+        return 'requests: '+str(self.counters['requests'])+\
+               ', new connections: '+str(self.counters['new_connections'])+\
+               ', reused connections: '+\
+               str(self.counters['reused_connections'])
+
+
+    async def get(self, url, params=None, headers=None, timeout=None):
+        """async function that makes a HTTP GET request.
+
+        Parameters
+        ----------
+        url : str
+        params : dict, optional
+            Query parameters.
+        headers : dict, optional
+            Request headers.
+        timeout : float, optional
+            Seconds before the request times out. By default 5 minutes.
+
+        Returns
+        -------
+        response : Response
+            Status, headers and body.
+
+        Raises
+        ------
+        aiohttp.ClientResponseError
+            For a status of 400 or more.
+        """
+        kwargs = {}
+        if timeout is not None:
+            kwargs['timeout'] = ClientTimeout(total=timeout)
+        session = self.get_session()
+        async with session.get(url, params=params, headers=headers,
+                               **kwargs) as response:
+            response.raise_for_status()
+            body = await response.read()
+        return Response(response.status, response.headers, body)
+
+
+    async def close(self):
+        """Close the session and all its connections."""
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+        self.session = None
+
+
+class Http2pool(object):
+    """A HTTP/2 connection which multiplexes the requests of a whole
+    download. Needs httpx and h2.
+    """
+
+    def __init__(self, connections=1, prior_knowledge=False, timeout=300):
+        """HTTP/2 connection pool object.
+
+        Used in place of Connectionpool. Every request in flight is a stream
+        of the same connection instead of a connection of its own, so a
+        high concurrency needs no extra connections or TLS handshakes.
+        HTTP/2 is agreed with https servers when the connection is made.
+        Servers which only speak HTTP/1.1 are still served, over
+        connections connections.
+
+        Parameters
+        ----------
+        connections : int
+            Maximum number of open connections.
+        prior_knowledge : bool
+            Talk HTTP/2 straight away without TLS (h2c), e.g. to a local
+            mock server.
+        timeout : float
+            Seconds before a request times out, unless the request sets it.
+
+        Example
+        -------
+        pool = Http2pool()
+        cfa.Cfopendata(2018, 1, 0, 'Data/', pool=pool)
+        """
+        if httpx is None:
+            raise ImportError('httpx and h2 are needed for HTTP/2. '+\
+                              'pip install httpx[http2]')
+        self.connections = connections
+        self.prior_knowledge = prior_knowledge
+        self.timeout = timeout
+        self.session = None
+        self.batches = []
+        self.new_batch()
+
+
+    def new_batch(self):
+        """Start counting requests for a new batch.
+
+        Returns
+        -------
+        self.counters : dict
+            Counters of the new batch.
+        """
+        self.counters = {'requests': 0, 'http2_requests': 0}
+        self.batches.append(self.counters)
+        return self.counters
+
+
+    def get_session(self):
+        """Return the shared client, creating it if needed.
+
+        Returns
+        -------
+        session : httpx.AsyncClient
+        """
+        if self.session is None or self.session.is_closed:
+            limits = httpx.Limits(max_connections=self.connections,
+                                  max_keepalive_connections=self.connections)
+            self.session = httpx.AsyncClient(http1=not self.prior_knowledge,
+                                             http2=True, limits=limits,
+                                             timeout=self.timeout)
+        return self.session
+
+
+    async def get(self, url, params=None, headers=None, timeout=None):
+        """async function that makes a HTTP GET request.
+
+        Errors are raised as the aiohttp errors Connectionpool raises, so
+        the retry policy treats both the same.
+
+        Parameters
+        ----------
+        url : str
+        params : dict, optional
+            Query parameters.
+        headers : dict, optional
+            Request headers.
+        timeout : float, optional
+            Seconds before the request times out. By default self.timeout.
+
+        Returns
+        -------
+        response : Response
+            Status, headers and body.
+
+        Raises
+        ------
+        aiohttp.ClientResponseError
+            For a status of 400 or more.
+        """
+        client = self.get_session()
+        kwargs = {}
+        if timeout is not None:
+            kwargs['timeout'] = timeout
+        self.counters['requests'] += 1
+        try:
+            response = await client.get(url, params=params, headers=headers,
+                                        **kwargs)
+        except httpx.TimeoutException as e:
+            raise asyncio.TimeoutError(str(e))
+        except httpx.TransportError as e:
+            raise ClientConnectionError(type(e).__name__+': '+str(e))
+        if response.http_version == 'HTTP/2':
+            self.counters['http2_requests'] += 1
+        if response.status_code >= 400:
+            request_url = URL(str(response.request.url))
+            info = RequestInfo(request_url, 'GET',
+                               CIMultiDictProxy(CIMultiDict(headers or {})),
+                               request_url)
+            raise ClientResponseError(info, (), status=response.status_code,
+                                      message=response.reason_phrase,
+                                      headers=CIMultiDictProxy(CIMultiDict(
+                                              response.headers.items())))
+        return Response(response.status_code, response.headers,
+                        response.content)
+
+
+    def summary(self):
+        """Summary of the counters of the current batch.
+
+        Returns
+        -------
+        out : str
+        """
+        return 'requests: '+str(self.counters['requests'])+\
+               ', over HTTP/2: '+str(self.counters['http2_requests'])
+
+
+    async def close(self):
+        """Close the client and all its connections."""
+        if self.session is not None and not self.session.is_closed:
+            await self.session.aclose()
+        self.session = None
@@ -0,0 +1,292 @@
+import pandas as pd
+import numpy as np
+
+
+import heapq
+import os
+
+
+# Mean radius of the Earth in km
+_EARTH_RADIUS = 6371.0088
+
+
+def _unit_vectors(lats, lons):
+    """Points on the unit sphere of latitudes and longitudes in degrees.
+
+    Parameters
+    ----------
+    lats : array
+    lons : array
+
+    Returns
+    -------
+    points : np.ndarray
+        x, y and z of each point.
+    """
+    lats = np.radians(np.asarray(lats, dtype=np.float64))
+    lons = np.radians(np.asarray(lons, dtype=np.float64))
+    return np.column_stack([np.cos(lats) * np.cos(lons),
+                            np.cos(lats) * np.sin(lons),
+                            np.sin(lats)])
+
+
+def _chord(km):
+    """Straight line distance through the unit sphere of a great circle
+    distance."""
+    return 2 * np.sin(np.minimum(km / (2 * _EARTH_RADIUS), np.pi / 2))
+
+
+def _km(chord):
+    """Great circle (haversine) distance of a chord of the unit sphere."""
+    return 2 * _EARTH_RADIUS * np.arcsin(np.minimum(chord / 2, 1.0))
+
+
+class Gymindex(object):
+    """A KD-tree of the affiliate coordinates to find the gyms near a point.
+    """
+
+    # Points in a leaf of the tree
+    leafsize = 32
+
+    def __init__(self, path, dname='Affiliate_list'):
+        """Gym spatial index object.
+
+        The coordinates are points on the unit sphere, where the straight
+        line (chord) distance between two points orders them the same as
+        their great circle distance. A KD-tree of the points is built once
+        and saved to path/dname_spatial.npz, and a query only visits the
+        parts of the tree near the point. Distances are haversine distances
+        in km. Affiliates without a location are not in the index.
+
+        Parameters
+        ----------
+        path : str
+            Directory of the affiliate list.
+        dname : str
+            Name of the affiliate list.
+
+        Example
+        -------
+        index = Gymindex('Data/').build(df)
+        index.save()
+        aids, km = Gymindex('Data/').within(25.76, -80.19, 25)
+        aids, km = Gymindex('Data/').nearest(25.76, -80.19, k=5)
+        """
+        self.path = path
+        self.dname = dname
+        self.fname = os.path.join(self.path, self.dname+'_spatial.npz')
+        self._set({'aids': np.zeros(0, dtype=np.int64),
+                   'points': np.zeros((0, 3)),
+                   'start': np.zeros(0, dtype=np.int64),
+                   'end': np.zeros(0, dtype=np.int64),
+                   'low': np.zeros((0, 3)), 'high': np.zeros((0, 3)),
+                   'left': np.zeros(0, dtype=np.int64),
+                   'right': np.zeros(0, dtype=np.int64)})
+        if os.path.isfile(self.fname):
+            with np.load(self.fname) as f:
+                self._set({k: f[k] for k in f.files})
+
+
+    def _set(self, arrays):
+        """Use the arrays of a tree. The nodes are also kept as lists, which
+        are faster to walk than arrays."""
+        self.arrays = arrays
+        self.aids = arrays['aids']
+        self.points = arrays['points']
+        self._start = arrays['start'].tolist()
+        self._end = arrays['end'].tolist()
+        self._low = arrays['low'].tolist()
+        self._high = arrays['high'].tolist()
+        self._left = arrays['left'].tolist()
+        self._right = arrays['right'].tolist()
+
+
+    def __len__(self):
+        return len(self.aids)
+
+
+    def build(self, df):
+        """Build the tree of an affiliate list.
+
+        Parameters
+        ----------
+        df : pd.DataFrame
+            Affiliate list with Affiliate_id, Latitude and Longitude.
+
+        Returns
+        -------
+        self : Gymindex
+        """
+        lats = pd.to_numeric(df['Latitude'],
+                             errors='coerce').values.astype(np.float64)
+        lons = pd.to_numeric(df['Longitude'],
+                             errors='coerce').values.astype(np.float64)
+        located = ~(np.isnan(lats) | np.isnan(lons))
+        points = _unit_vectors(lats[located], lons[located])
+        order = np.arange(len(points))
+        nodes = []
+
+        def split(lo, hi):
+            # Nodes are numbered in the order they are made
+            node = len(nodes)
+            box = points[order[lo:hi]]
+            nodes.append([lo, hi, box.min(axis=0), box.max(axis=0), -1, -1])
+            if hi - lo > self.leafsize:
+                # Split the widest side at the median
+                dim = np.argmax(nodes[node][3] - nodes[node][2])
+                mid = (lo + hi) // 2
+                part = np.argpartition(box[:,dim], mid - lo)
+                order[lo:hi] = order[lo:hi][part]
+                nodes[node][4] = split(lo, mid)
+                nodes[node][5] = split(mid, hi)
+            return node
+
+        if len(points) > 0:
+            split(0, len(points))
+        aids = df['Affiliate_id'].values[located].astype(np.int64)
+        self._set({'aids': aids[order],
+                   'points': points[order],
+                   'start': np.array([n[0] for n in nodes], dtype=np.int64),
+                   'end': np.array([n[1] for n in nodes], dtype=np.int64),
+                   'low': np.array([n[2] for n in nodes]).reshape(-1, 3),
+                   'high': np.array([n[3] for n in nodes]).reshape(-1, 3),
+                   'left': np.array([n[4] for n in nodes], dtype=np.int64),
+                   'right': np.array([n[5] for n in nodes],
+                                     dtype=np.int64)})
+        return self
+
+
+    def save(self):
+        """Write the tree to self.fname."""
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+        with open(self.fname+'.tmp', 'wb') as f:
+            np.savez(f, **self.arrays)
+        os.replace(self.fname+'.tmp', self.fname)
+
+
+    def _box(self, node, q):
+        """Squared distance from a point to the bounding box of a node."""
+        d = 0.0
+        for low, high, x in zip(self._low[node], self._high[node], q):
+            if x < low:
+                d += (low - x) ** 2
+            elif x > high:
+                d += (x - high) ** 2
+        return d
+
+
+    def _far(self, node, q):
+        """Squared distance from a point to the far corner of the bounding
+        box of a node."""
+        d = 0.0
+        for low, high, x in zip(self._low[node], self._high[node], q):
+            d += max(x - low, high - x) ** 2
+        return d
+
+
+    def _query(self, lat, lon):
+        """Point of a query, as an array and as a list."""
+        q = _unit_vectors([lat], [lon])[0]
+        return q, q.tolist()
+
+
+    def within(self, lat, lon, radius=25.0):
+        """Gyms within a distance of a point.
+
+        Parameters
+        ----------
+        lat : float
+            Latitude in degrees.
+        lon : float
+            Longitude in degrees.
+        radius : float
+            Distance in km.
+
+        Returns
+        -------
+        aids : np.ndarray
+            Affiliate ids, nearest first.
+        km : np.ndarray
+            Distance of each affiliate in km.
+        """
+        q, ql = self._query(lat, lon)
+        r2 = _chord(radius) ** 2
+        # The points of a node are a slice of self.points. Collect the
+        # slices of the leaves near the point, and of the nodes which are
+        # inside the radius altogether, then check their points at once
+        ranges = []
+        stack = [0] if len(self) > 0 else []
+        while len(stack) > 0:
+            node = stack.pop()
+            if self._box(node, ql) > r2:
+                continue
+            if self._left[node] < 0 or self._far(node, ql) <= r2:
+                ranges.append(np.arange(self._start[node], self._end[node]))
+                continue
+            stack.append(self._left[node])
+            stack.append(self._right[node])
+        if len(ranges) == 0:
+            return self._result([])
+        ix = np.concatenate(ranges)
+        d2 = ((self.points[ix] - q) ** 2).sum(axis=1)
+        keep = d2 <= r2
+        return self._result([(ix[keep], d2[keep])])
+
+
+    def nearest(self, lat, lon, k=1):
+        """The k gyms nearest a point.
+
+        Parameters
+        ----------
+        lat : float
+            Latitude in degrees.
+        lon : float
+            Longitude in degrees.
+        k : int
+            Number of gyms.
+
+        Returns
+        -------
+        aids : np.ndarray
+            Affiliate ids, nearest first.
+        km : np.ndarray
+            Distance of each affiliate in km.
+        """
+        q, ql = self._query(lat, lon)
+        best_ix = np.zeros(0, dtype=np.int64)
+        best_d2 = np.zeros(0)
+        kth = np.inf # Squared distance of the k-th nearest so far
+        heap = [(0.0, 0)] if len(self) > 0 and k > 0 else []
+        # Visit the nodes nearest the point first
+        while len(heap) > 0:
+            d, node = heapq.heappop(heap)
+            if d > kth:
+                break
+            if self._left[node] >= 0:
+                for child in (self._left[node], self._right[node]):
+                    d = self._box(child, ql)
+                    if d <= kth:
+                        heapq.heappush(heap, (d, child))
+                continue
+            start = self._start[node]
+            d2 = ((self.points[start:self._end[node]] - q) ** 2).sum(axis=1)
+            best_ix = np.concatenate([best_ix, np.arange(start, start +
+                                                         len(d2))])
+            best_d2 = np.concatenate([best_d2, d2])
+            if len(best_d2) > k:
+                keep = np.argpartition(best_d2, k - 1)[:k]
+                best_ix, best_d2 = best_ix[keep], best_d2[keep]
+            if len(best_d2) == k:
+                kth = best_d2.max()
+        return self._result([(best_ix, best_d2)])
+
+
+    def _result(self, found):
+        """Affiliate ids and km of the points found, nearest first."""
+        if len(found) == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+        ix = np.concatenate([f[0] for f in found])
+        d2 = np.concatenate([f[1] for f in found])
+        order = np.argsort(d2, kind='stable')
+        return self.aids[ix[order]], _km(np.sqrt(d2[order]))
@@ -0,0 +1,223 @@
+import os
+import pickle
+import struct
+
+
+from .parse import new_buffers, buffers_to_frame
+
+
+# Header of each record: key and length of its body
+_HEADER = struct.Struct('<qq')
+
+
+class Recordfile(object):
+    """An append-only file of records, each a key and a body, with an index
+    of the last record of each key.
+    """
+
+    # Extension of the file
+    suffix = '.records'
+
+    def __init__(self, path, dname):
+        """Record file object.
+
+        A record cut short by a crash is dropped when the file is opened.
+
+        Parameters
+        ----------
+        path : str
+            Directory of the file.
+        dname : str
+            Name of the download e.g. 'Men_Rx_2018_raw'.
+        """
+        self.path = path
+        self.dname = dname
+        self.fname = os.path.join(self.path, self.dname+self.suffix)
+        self._index = {}
+        if os.path.isfile(self.fname):
+            self._scan()
+
+
+    def _scan(self):
+        """Index the records in the file and drop an incomplete last record.
+
+        Returns
+        -------
+        self._index : dict
+            Key with offset and length of its last record.
+        """
+        size = os.path.getsize(self.fname)
+        offset = 0
+        with open(self.fname, 'rb') as f:
+            while offset + _HEADER.size <= size:
+                f.seek(offset)
+                key, length = _HEADER.unpack(f.read(_HEADER.size))
+                if offset + _HEADER.size + length > size:
+                    break
+                self._index[key] = (offset + _HEADER.size, length)
+                offset += _HEADER.size + length
+        if offset < size:
+            with open(self.fname, 'r+b') as f:
+                f.truncate(offset)
+        return self
+
+
+    def _write(self, key, payload):
+        """Append a record.
+
+        Parameters
+        ----------
+        key : int
+            Key of the record.
+        payload : bytes
+            Body of the record.
+        """
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+        with open(self.fname, 'ab') as f:
+            offset = f.tell()
+            f.write(_HEADER.pack(key, len(payload)))
+            f.write(payload)
+        self._index[key] = (offset + _HEADER.size, len(payload))
+
+
+    def keys(self):
+        """Keys in the file.
+
+        Returns
+        -------
+        keys : list
+            Keys in ascending order.
+        """
+        return sorted(self._index)
+
+
+    def __contains__(self, key):
+        return key in self._index
+
+
+    def size(self, key=None):
+        """Bytes of the record of a key.
+
+        Parameters
+        ----------
+        key : int, optional
+            Key of the record. By default the total of all keys.
+
+        Returns
+        -------
+        size : int
+        """
+        if key is None:
+            return sum(length for offset, length in self._index.values())
+        return self._index[key][1]
+
+
+    def _records(self, keys=None):
+        """Iterate over the bodies of the records in key order.
+
+        Parameters
+        ----------
+        keys : list, optional
+            Keys to read. By default all keys.
+
+        Yields
+        ------
+        key : int
+        payload : bytes
+        """
+        if keys is None:
+            keys = self.keys()
+        if len(keys) == 0:
+            return
+        with open(self.fname, 'rb') as f:
+            for key in keys:
+                offset, length = self._index[key]
+                f.seek(offset)
+                yield key, f.read(length)
+
+
+    def remove(self):
+        """Remove the file."""
+        if os.path.isfile(self.fname):
+            os.remove(self.fname)
+        self._index = {}
+
+
+class Spill(Recordfile):
+    """An append-only file of columnar chunks, e.g. one per leaderboard
+    page, which is read back in key order.
+    """
+
+    # Extension of the file
+    suffix = '.spill'
+
+    def __init__(self, path, dname):
+        """Spill file object.
+
+        Each record is a key (e.g. the page number) and the column buffers
+        of that key. Records are appended as they are finished, in any order.
+        Reading them back sorts the records by key, not the rows, so the data
+        comes out in page order without a sort. A record cut short by a
+        crash is dropped when the file is opened.
+
+        Parameters
+        ----------
+        path : str
+            Directory of the file.
+        dname : str
+            Name of the download e.g. 'Men_Rx_2018_raw'.
+
+        Example
+        -------
+        spill = Spill('Data/ind_files', 'Men_Rx_2018_raw')
+        spill.append(2, buffers)
+        df = spill.read(columns)
+        """
+        super(Spill, self).__init__(path, dname)
+
+
+    def append(self, key, buffers):
+        """Append the column buffers of a key.
+
+        Parameters
+        ----------
+        key : int
+            Key of the record e.g. a page number.
+        buffers : dict
+            Column buffers.
+        """
+        self._write(key, pickle.dumps(buffers,
+                                      protocol=pickle.HIGHEST_PROTOCOL))
+
+
+    def chunks(self):
+        """Iterate over the column buffers in key order. Only the last record
+        of a key is used.
+
+        Yields
+        ------
+        key : int
+        buffers : dict
+        """
+        for key, payload in self._records():
+            yield key, pickle.loads(payload)
+
+
+    def read(self, columns):
+        """Read the whole file into a DataFrame in key order.
+
+        Parameters
+        ----------
+        columns : list
+            Column names.
+
+        Returns
+        -------
+        df : pd.DataFrame
+        """
+        buffers = new_buffers(columns)
+        for key, chunk in self.chunks():
+            for c in columns:
+                buffers[c].extend(chunk[c])
+        return buffers_to_frame(buffers, columns)
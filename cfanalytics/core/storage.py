@@ -0,0 +1,362 @@
+import numpy as np
+import pandas as pd
+
+
+import os
+
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+
+_OPS = ['==', '!=', '<', '<=', '>', '>=', 'in']
+
+
+def _check_pyarrow():
+    if pa is None:
+        raise ImportError('pyarrow is needed for Parquet storage. '+\
+                          'pip install pyarrow')
+
+
+def parse_dname(dname):
+    """Split a data name into its partition keys.
+
+    Parameters
+    ----------
+    dname : str
+        Name of the data e.g. 'Men_45-49_Rx_2018_raw' or 'Women_Sc_2017'.
+
+    Returns
+    -------
+    keys : dict
+        stage ('raw' or 'clean'), year, division and scaled.
+    """
+    parts = os.path.basename(dname).split('_')
+    stage = 'clean'
+    if parts[-1] == 'raw':
+        stage = 'raw'
+        parts = parts[:-1]
+    return {'stage': stage,
+            'year': int(parts[-1]),
+            'division': '_'.join(parts[:-2]),
+            'scaled': parts[-2]}
+
+
+def _kind(values):
+    """Kind of the values of an object column.
+
+    Parameters
+    ----------
+    values : pd.Series
+
+    Returns
+    -------
+    kind : str
+        'empty' (only '' and missing), 'str', 'int', 'float' (numbers with
+        '' or missing) or 'mixed'.
+    """
+    present = values.dropna()
+    numbers = [v for v in present if not isinstance(v, str)]
+    strings = set(v for v in present if isinstance(v, str))
+    if len(numbers) == 0:
+        if strings <= set(['']):
+            return 'empty'
+        return 'str'
+    if not all(isinstance(v, (int, float, np.integer, np.floating))
+               for v in numbers) or not strings <= set(['']):
+        return 'mixed'
+    if len(strings) == 0 and len(present) == len(values) and \
+       all(isinstance(v, (int, np.integer)) for v in numbers):
+        return 'int'
+    return 'float'
+
+
+def _union(kinds):
+    """Kind of a column made of parts of the given kinds.
+
+    Parameters
+    ----------
+    kinds : set
+        Kinds of the parts, see _kind.
+
+    Returns
+    -------
+    kind : str
+    """
+    kinds = set(kinds) - set(['empty'])
+    if len(kinds) == 0:
+        return 'empty'
+    if len(kinds) == 1:
+        return kinds.pop()
+    if kinds <= set(['int', 'float']):
+        return 'float'
+    return 'mixed'
+
+
+def _apply_kinds(df, kinds):
+    """Convert the object columns of a DataFrame to their kind.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+    kinds : dict
+        Kind of each object column, see _kind.
+
+    Returns
+    -------
+    df : pd.DataFrame
+    """
+    df = df.copy()
+    for c, kind in kinds.items():
+        if kind in ['int', 'float']:
+            df[c] = pd.to_numeric(df[c].replace('', np.nan))
+            if kind == 'float':
+                df[c] = df[c].astype(float)
+        elif kind == 'mixed':
+            df[c] = df[c].map(lambda v: v if pd.isnull(v) else str(v))
+    return df
+
+
+def _arrow_safe(df):
+    """Give every object column a single type so it can be stored in Arrow.
+
+    Object columns of numbers (with '' for missing) become numeric with NaN
+    for missing. Other mixed columns, e.g. scores which are a mix of
+    pd.Timedelta and int, are stored as strings.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+
+    Returns
+    -------
+    df : pd.DataFrame
+    """
+    kinds = {c: _kind(df[c]) for c in df.columns if df[c].dtype == object}
+    return _apply_kinds(df, kinds)
+
+
+def _write(df, fname):
+    """Write a DataFrame to a Parquet file, replacing it atomically."""
+    _check_pyarrow()
+    if not os.path.isdir(os.path.dirname(fname)):
+        os.makedirs(os.path.dirname(fname))
+    table = pa.Table.from_pandas(_arrow_safe(df), preserve_index=False)
+    pq.write_table(table, fname+'.tmp', compression='zstd')
+    os.replace(fname+'.tmp', fname)
+
+
+def _expression(filters):
+    """Convert filters to a pyarrow expression.
+
+    Parameters
+    ----------
+    filters : list
+        Tuples of (column, op, value). op is one of '==', '!=', '<', '<=',
+        '>', '>=' or 'in'.
+
+    Returns
+    -------
+    expr : pyarrow.dataset.Expression
+    """
+    expr = None
+    for column, op, value in filters:
+        if op not in _OPS:
+            raise ValueError('op must be one of '+str(_OPS))
+        field = ds.field(column)
+        if op == '==':
+            e = field == value
+        elif op == '!=':
+            e = field != value
+        elif op == '<':
+            e = field < value
+        elif op == '<=':
+            e = field <= value
+        elif op == '>':
+            e = field > value
+        elif op == '>=':
+            e = field >= value
+        else:
+            e = field.isin(list(value))
+        if expr is None:
+            expr = e
+        else:
+            expr = expr & e
+    return expr
+
+
+def leaderboard_path(store, dname):
+    """File of a leaderboard partition.
+
+    Parameters
+    ----------
+    store : str
+        Directory of the store.
+    dname : str
+        Name of the data e.g. 'Men_Rx_2018_raw'.
+
+    Returns
+    -------
+    fname : str
+    """
+    keys = parse_dname(dname)
+    return os.path.join(store, 'leaderboards', 'stage='+keys['stage'],
+                        'year='+str(keys['year']),
+                        'division='+keys['division'],
+                        'scaled='+keys['scaled'], 'part-0.parquet')
+
+
+def write_leaderboard(df, store, dname):
+    """Save a raw or cleaned leaderboard in its partition of the store.
+
+    The store is a Parquet dataset partitioned by stage, year, division and
+    scaled e.g. store/leaderboards/stage=raw/year=2018/division=Men/scaled=Rx
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        Leaderboard.
+    store : str
+        Directory of the store.
+    dname : str
+        Name of the data e.g. 'Men_Rx_2018_raw'.
+
+    Example
+    -------
+    write_leaderboard(df, 'Data/store', 'Men_Rx_2018_raw')
+    """
+    _write(df, leaderboard_path(store, dname))
+
+
+def write_leaderboard_chunks(frames, store, dname):
+    """Save a leaderboard one chunk at a time, so it never has to be in
+    memory at once.
+
+    The chunks are read twice: once to find the type of each column and
+    once to write them.
+
+    Parameters
+    ----------
+    frames : function
+        Returns an iterator of DataFrames, the chunks of the leaderboard in
+        order. At least one chunk, which may be empty.
+    store : str
+        Directory of the store.
+    dname : str
+        Name of the data e.g. 'Men_Rx_2018_raw'.
+
+    Example
+    -------
+    write_leaderboard_chunks(lambda: iter(chunks), 'Data/store',
+    ...                      'Men_Rx_2018_raw')
+    """
+    _check_pyarrow()
+    kinds = {}
+    for df in frames():
+        for c in df.columns:
+            if df[c].dtype == object:
+                kinds.setdefault(c, set()).add(_kind(df[c]))
+    kinds = {c: _union(k) for c, k in kinds.items()}
+
+    fname = leaderboard_path(store, dname)
+    if not os.path.isdir(os.path.dirname(fname)):
+        os.makedirs(os.path.dirname(fname))
+    writer = None
+    try:
+        for df in frames():
+            df = _apply_kinds(df, kinds)
+            if writer is None:
+                table = pa.Table.from_pandas(df, preserve_index=False)
+                writer = pq.ParquetWriter(fname+'.tmp', table.schema,
+                                          compression='zstd')
+            else:
+                # e.g. a chunk of None is cast to the type of the first
+                table = pa.Table.from_pandas(df, schema=writer.schema,
+                                             preserve_index=False)
+            writer.write_table(table)
+    finally:
+        if writer is not None:
+            writer.close()
+    os.replace(fname+'.tmp', fname)
+
+
+def read_leaderboard(store, dname, columns=None, filters=None):
+    """Read a leaderboard from the store.
+
+    Only the partition of dname, the columns and the rows matching filters
+    are read from disk.
+
+    Parameters
+    ----------
+    store : str
+        Directory of the store.
+    dname : str
+        Name of the data e.g. 'Men_Rx_2018'.
+    columns : list, optional
+        Columns to read. By default all columns.
+    filters : list, optional
+        Tuples of (column, op, value) e.g. [('Region_id', 'in', [5, 6])].
+
+    Returns
+    -------
+    df : pd.DataFrame
+        Leaderboard.
+
+    Example
+    -------
+    read_leaderboard('Data/store', 'Men_Rx_2018',
+    ...              columns=['Region_id', '18.3_rank'])
+    """
+    _check_pyarrow()
+    keys = parse_dname(dname)
+    dataset = ds.dataset(os.path.join(store, 'leaderboards'),
+                         format='parquet', partitioning='hive')
+    if columns is None:
+        columns = [c for c in dataset.schema.names if c not in keys]
+    filters = [(k, '==', v) for k, v in keys.items()] + list(filters or [])
+    table = dataset.to_table(columns=list(columns),
+                             filter=_expression(filters))
+    return table.to_pandas()
+
+
+def write_affiliates(df, store):
+    """Save the affiliate list in the store.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        Affiliate list.
+    store : str
+        Directory of the store.
+    """
+    _write(df, os.path.join(store, 'affiliates', 'part-0.parquet'))
+
+
+def read_affiliates(store, columns=None, filters=None):
+    """Read the affiliate list from the store.
+
+    Parameters
+    ----------
+    store : str
+        Directory of the store.
+    columns : list, optional
+        Columns to read. By default all columns.
+    filters : list, optional
+        Tuples of (column, op, value) e.g. [('City', '==', 'Miami')].
+
+    Returns
+    -------
+    df : pd.DataFrame
+        Affiliate list.
+    """
+    _check_pyarrow()
+    dataset = ds.dataset(os.path.join(store, 'affiliates'),
+                         format='parquet')
+    expr = None
+    if filters is not None:
+        expr = _expression(filters)
+    return dataset.to_table(columns=columns, filter=expr).to_pandas()
@@ -71,4 +71,24 @@ def open_wods(year):
     ds['scorel'] = scorel
     ds['dfcheader'] = dfcheader    
     ds['wodscompleted'] = wodscompleted
-    return ds
\ No newline at end of file
+    return ds
+
+
+def normalize_values(df):
+    """Values of a DataFrame as the strings they are saved as.
+    
+    Parameters
+    ----------
+    df : pd.DataFrame
+    
+    Returns
+    -------
+    df : pd.DataFrame
+    """
+    def norm(v):
+        if v is None or v == '' or (isinstance(v, float) and v != v):
+            return ''
+        if isinstance(v, float) and v.is_integer():
+            return str(int(v))
+        return str(v)
+    return df.apply(lambda col: col.map(norm))
@@ -0,0 +1,391 @@
+"""A local stand-in for the CrossFit Games and affiliate map APIs.
+
+Serves synthetic leaderboard pages for 2017 and 2018 and affiliate responses
+with configurable latency, error rate and rate limit, so downloads can be
+tested and benchmarked without the network. Speaks HTTP/1.1, or HTTP/2
+without TLS (h2c) if h2 is installed.
+"""
+import asyncio # Asynchronous I/O
+from aiohttp import web
+
+
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from urllib.parse import urlsplit, parse_qsl
+
+
+_LEADERBOARD = re.compile('/competitions/api/v1/competitions/open/'+\
+                          '([0-9]+)/leaderboards$')
+
+
+from .synthetic import leaderboard_page, affiliate_info, all_affiliates
+
+
+def _all_tasks(loop):
+    """Tasks of a loop. asyncio.all_tasks is new in Python 3.7."""
+    if hasattr(asyncio, 'all_tasks'):
+        return asyncio.all_tasks(loop)
+    return asyncio.Task.all_tasks(loop)
+
+
+class Mockserver(object):
+    """A mock CrossFit API server running in a background thread.
+
+    Leaderboard responses carry an ETag and a matching If-None-Match gets a
+    304 Not Modified.
+    """
+
+    def __init__(self, npages=10, nrows=50, lastaid=250, latency=0.0,
+                 jitter=0.0, error_rate=0.0, rate_limit=None, seed=None,
+                 http2=False):
+        """Mock server object.
+
+        Parameters
+        ----------
+        npages : int
+            Number of pages of each leaderboard.
+        nrows : int
+            Athletes per leaderboard page.
+        lastaid : int
+            Last affiliate id.
+        latency : float
+            Seconds before each response.
+        jitter : float
+            Up to this many seconds are added to the latency at random.
+        error_rate : float
+            Fraction of requests answered with a 503.
+        rate_limit : float, optional
+            Requests per second allowed. Requests over it get a 429 with a
+            Retry-After header.
+        seed : int, optional
+            Seed of the errors and jitter.
+        http2 : bool
+            Speak HTTP/2 without TLS instead of HTTP/1.1, for
+            Http2pool(prior_knowledge=True). Needs h2.
+
+        Example
+        -------
+        with Mockserver(npages=100, latency=0.05) as server:
+            cfa.Cfopendata(2018, 1, 0, 'Data/', url=server.url)
+        """
+        self.npages = npages
+        self.nrows = nrows
+        self.lastaid = lastaid
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.random = random.Random(seed)
+        self.requests = 0
+        self.errors = 0
+        self.throttled = 0
+        self._tokens = rate_limit
+        self._refilled = time.time()
+        self._pages = {}
+        self._edits = {}
+        self.not_modified = 0
+        self.http2 = http2
+        self._connections = set()
+        self._writers = set()
+        self._loop = None
+        self._thread = None
+
+
+    @property
+    def connections(self):
+        """Number of connections opened by clients."""
+        return len(self._connections)
+
+
+    @property
+    def url(self):
+        """URL to pass to Cfopendata, Bulkdownload and Affiliatelist."""
+        return 'http://127.0.0.1:'+str(self.port)
+
+
+    def start(self):
+        """Start serving on a free port.
+
+        Returns
+        -------
+        self : Mockserver
+        """
+        started = threading.Event()
+        self._thread = threading.Thread(target=self._serve, args=(started,),
+                                        daemon=True)
+        self._thread.start()
+        started.wait()
+        return self
+
+
+    def stop(self):
+        """Stop serving."""
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop = None
+
+
+    def __enter__(self):
+        return self.start()
+
+
+    def __exit__(self, *args):
+        self.stop()
+
+
+    def _serve(self, started):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        if self.http2:
+            server = self._loop.run_until_complete(asyncio.start_server(
+                    self._h2_connection, '127.0.0.1', 0))
+            self.port = server.sockets[0].getsockname()[1]
+            started.set()
+            self._loop.run_forever()
+            server.close()
+            # Drop the connections which are still open and let them finish
+            for writer in list(self._writers):
+                writer.transport.abort()
+            self._loop.run_until_complete(asyncio.gather(
+                    *_all_tasks(self._loop), return_exceptions=True))
+        else:
+            app = web.Application()
+            app.router.add_get('/{path:.*}', self._aiohttp)
+            runner = web.AppRunner(app)
+            self._loop.run_until_complete(runner.setup())
+            site = web.TCPSite(runner, '127.0.0.1', 0)
+            self._loop.run_until_complete(site.start())
+            self.port = site._server.sockets[0].getsockname()[1]
+            started.set()
+            self._loop.run_forever()
+            self._loop.run_until_complete(runner.cleanup())
+        self._loop.close()
+
+
+    async def _aiohttp(self, request):
+        self._connections.add(id(request.transport))
+        status, headers, body = await self._route(
+                request.path, dict(request.query),
+                {k.lower(): v for k, v in request.headers.items()})
+        return web.Response(status=status, headers=headers, body=body)
+
+
+    async def _http1(self, data, reader, writer):
+        """Answer a HTTP/1.1 request, e.g. of requests, and close the
+        connection."""
+        while b'\r\n\r\n' not in data:
+            more = await reader.read(65536)
+            if len(more) == 0:
+                writer.close()
+                return
+            data += more
+        lines = data.split(b'\r\n\r\n')[0].decode('latin-1').split('\r\n')
+        url = urlsplit(lines[0].split(' ')[1])
+        request = dict((k.strip().lower(), v.strip()) for k, v in
+                       (line.split(':', 1) for line in lines[1:]))
+        status, headers, body = await self._route(
+                url.path, dict(parse_qsl(url.query)), request)
+        head = 'HTTP/1.1 '+str(status)+' \r\n'+\
+               ''.join(k+': '+v+'\r\n' for k, v in headers.items())+\
+               'Content-Length: '+str(len(body))+'\r\n'+\
+               'Connection: close\r\n\r\n'
+        writer.write(head.encode('latin-1') + body)
+        await writer.drain()
+        writer.close()
+
+
+    async def _h2_connection(self, reader, writer):
+        """Serve a HTTP/2 connection. Each stream is answered in a task of
+        its own, so the requests are multiplexed. Clients which don't start
+        with the HTTP/2 preface get a HTTP/1.1 answer."""
+        self._writers.add(writer)
+        try:
+            data = await reader.read(65536)
+            if not data.startswith(b'PRI * HTTP/2.0'):
+                return await self._http1(data, reader, writer)
+            await self._h2_streams(data, reader, writer)
+        finally:
+            self._writers.discard(writer)
+
+
+    async def _h2_streams(self, data, reader, writer):
+        """Answer the streams of a HTTP/2 connection."""
+        import h2.config
+        import h2.connection
+        import h2.events
+        import h2.exceptions
+
+        self._connections.add(id(writer))
+        conn = h2.connection.H2Connection(config=h2.config.H2Configuration(
+                client_side=False, header_encoding='utf-8'))
+        conn.initiate_connection()
+        writer.write(conn.data_to_send())
+        # Notified when the client opens the flow control window
+        window = asyncio.Condition()
+
+        async def respond(event):
+            request = dict(event.headers)
+            url = urlsplit(request[':path'])
+            status, headers, body = await self._route(
+                    url.path, dict(parse_qsl(url.query)),
+                    {k: v for k, v in request.items()
+                     if not k.startswith(':')})
+            sid = event.stream_id
+            try:
+                headers = [(':status', str(status))] + \
+                          [(k.lower(), v) for k, v in headers.items()] + \
+                          [('content-length', str(len(body)))]
+                conn.send_headers(sid, headers, end_stream=len(body) == 0)
+                writer.write(conn.data_to_send())
+                while len(body) > 0:
+                    n = min(conn.local_flow_control_window(sid),
+                            conn.max_outbound_frame_size, len(body))
+                    if n <= 0:
+                        async with window:
+                            await window.wait()
+                        continue
+                    conn.send_data(sid, body[:n], end_stream=n == len(body))
+                    body = body[n:]
+                    writer.write(conn.data_to_send())
+            except h2.exceptions.StreamClosedError:
+                return
+
+        tasks = set()
+        try:
+            while len(data) > 0:
+                for event in conn.receive_data(data):
+                    if isinstance(event, h2.events.RequestReceived):
+                        task = asyncio.ensure_future(respond(event))
+                        tasks.add(task)
+                        task.add_done_callback(tasks.discard)
+                    elif isinstance(event, h2.events.WindowUpdated):
+                        async with window:
+                            window.notify_all()
+                writer.write(conn.data_to_send())
+                data = await reader.read(65536)
+        except (ConnectionError, h2.exceptions.ProtocolError):
+            pass
+        finally:
+            for task in tasks:
+                task.cancel()
+            writer.close()
+
+
+    async def _route(self, path, query, headers):
+        """Answer a request.
+
+        Parameters
+        ----------
+        path : str
+        query : dict
+            Query parameters.
+        headers : dict
+            Request headers, with lower case names.
+
+        Returns
+        -------
+        status : int
+        headers : dict
+        body : bytes
+        """
+        match = _LEADERBOARD.match(path)
+        if match is not None:
+            return await self._leaderboard(int(match.group(1)),
+                                           int(query.get('page', 1)), headers)
+        if path == '/getAffiliateInfo':
+            aid = int(query['aid'])
+            return await self._respond(
+                    lambda: json.dumps(affiliate_info(aid)).encode('utf-8'))
+        if path == '/getAllAffiliates.php':
+            return await self._respond(
+                    lambda: json.dumps(all_affiliates(self.lastaid)
+                                       ).encode('utf-8'))
+        return 404, {}, b''
+
+
+    def edit(self, year, page, edit):
+        """Change a leaderboard page, as scores do during the Open.
+
+        Parameters
+        ----------
+        year : int
+            Year of the Open.
+        page : int
+            Page number.
+        edit : function
+            Called with the page response (dict) and changes it in place.
+        """
+        self._edits.setdefault((year, page), []).append(edit)
+        self._pages.pop((year, page), None)
+
+
+    def _allow(self):
+        """Take a token from the rate limit bucket.
+
+        Returns
+        -------
+        allowed : bool
+        """
+        if self.rate_limit is None:
+            return True
+        now = time.time()
+        self._tokens = min(self.rate_limit, self._tokens + \
+                           (now - self._refilled) * self.rate_limit)
+        self._refilled = now
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+
+    async def _respond(self, body, headers=None):
+        """Answer a request with body, an error or a rate limit response.
+
+        Parameters
+        ----------
+        body : function
+            Returns the body of the response.
+        headers : dict, optional
+            Request headers of a leaderboard, which gets an ETag.
+        """
+        self.requests += 1
+        if not self._allow():
+            self.throttled += 1
+            return 429, {'Retry-After': '1'}, b''
+        delay = self.latency + self.random.uniform(0, self.jitter)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if self.random.random() < self.error_rate:
+            self.errors += 1
+            return 503, {}, b''
+        payload = body()
+        json_type = {'Content-Type': 'application/json'}
+        if headers is None:
+            return 200, json_type, payload
+        etag = '"'+hashlib.md5(payload).hexdigest()+'"'
+        if headers.get('if-none-match') == etag:
+            self.not_modified += 1
+            return 304, {'ETag': etag}, b''
+        return 200, dict(json_type, ETag=etag), payload
+
+
+    async def _leaderboard(self, year, page, headers):
+        if page < 1 or page > self.npages:
+            return 404, {}, b''
+
+        def body():
+            # Pages are the same for every division so only encode them once
+            key = (year, page)
+            if key not in self._pages:
+                response = leaderboard_page(year, page, self.npages,
+                                            self.nrows)
+                for edit in self._edits.get(key, []):
+                    edit(response)
+                self._pages[key] = json.dumps(response).encode('utf-8')
+            return self._pages[key]
+        return await self._respond(body, headers)
@@ -0,0 +1,129 @@
+"""Synthetic CrossFit API responses for tests and benchmarks.
+"""
+
+
+def leaderboard_page(year, page, npages=10, nrows=50):
+    """Create a leaderboard page in the response schema of the year.
+
+    Parameters
+    ----------
+    year : int
+        Year of the Open (2017 or 2018).
+    page : int
+        Page number (starts at 1).
+    npages : int
+        Total number of pages.
+    nrows : int
+        Number of athletes on the page.
+
+    Returns
+    -------
+    response : dict
+        Leaderboard page response.
+    """
+    if year == 2018:
+        wodscompleted = 6
+    else:
+        wodscompleted = 5
+    rows = []
+    for i in range(nrows):
+        rank = (page - 1) * nrows + i + 1
+        uid = 100000 + rank
+        height = str(150 + rank % 50)+' cm'
+        weight = str(120 + rank % 100)+' lb'
+        age = 18 + rank % 30
+        region = 5 + rank % 18
+        affiliate = rank % 2000
+        if year == 2018:
+            scores = [{'rank': str(rank), 'scoreDisplay': str(rank % 300)+\
+                       ' reps'} for j in range(wodscompleted)]
+            rows.append({'entrant': {'competitorId': str(uid),
+                                     'competitorName': 'Athlete '+str(uid),
+                                     'height': height,
+                                     'weight': weight,
+                                     'age': age,
+                                     'regionId': str(region),
+                                     'regionName': 'Region '+str(region),
+                                     'affiliateId': str(affiliate)},
+                         'overallRank': str(rank),
+                         'overallScore': str(rank * wodscompleted),
+                         'scores': scores})
+        else:
+            scores = [{'workoutrank': str(rank), 'scoredisplay': \
+                       str(rank % 300)+' reps'} for j in range(wodscompleted)]
+            rows.append({'userid': str(uid),
+                         'name': 'Athlete '+str(uid),
+                         'height': height,
+                         'weight': weight,
+                         'age': age,
+                         'regionid': region,
+                         'region': 'Region '+str(region),
+                         'affiliateid': str(affiliate),
+                         'overallrank': str(rank),
+                         'overallscore': str(rank * wodscompleted),
+                         'scores': scores})
+    if year == 2018:
+        return {'pagination': {'totalPages': npages, 'currentPage': page},
+                'leaderboardRows': rows}
+    else:
+        return {'totalpages': npages, 'currentpage': page, 'athletes': rows}
+
+
+def affiliate_info(aid):
+    """Create a getAffiliateInfo response.
+
+    Every tenth affiliate id is unused and has no name, as for closed
+    affiliates.
+
+    Parameters
+    ----------
+    aid : int
+        Affiliate id.
+
+    Returns
+    -------
+    response : dict
+        Affiliate information.
+    """
+    keys = ['name', 'address', 'city', 'state', 'zip', 'country', 'website',
+            'phone']
+    if aid % 10 == 0:
+        return {k: None for k in keys}
+    cities = [('Miami', 'FL', 'United States'),
+              ('Boston', 'MA', 'United States'),
+              ('London', '', 'United Kingdom'),
+              ('Sydney', 'NSW', 'Australia')]
+    city, state, country = cities[aid % len(cities)]
+    return {'name': 'CrossFit '+str(aid),
+            'address': str(aid)+' Main St',
+            'city': city,
+            'state': state,
+            'zip': str(10000 + aid % 90000),
+            'country': country,
+            'website': 'http://crossfit'+str(aid)+'.com',
+            'phone': '555-'+str(aid).zfill(4)}
+
+
+def all_affiliates(lastaid, firstaid=3):
+    """Create a getAllAffiliates.php response: latitude, longitude, name and
+    affiliate id of each affiliate. Every seventh affiliate has no location.
+
+    Parameters
+    ----------
+    lastaid : int
+        Last affiliate id.
+    firstaid : int
+        First affiliate id.
+
+    Returns
+    -------
+    response : list
+    """
+    out = []
+    for aid in range(firstaid, lastaid + 1):
+        if aid % 10 == 0 or aid % 7 == 0:
+            continue
+        out.append([round(-40 + (aid * 7.31) % 100, 4),
+                    round(-180 + (aid * 13.7) % 360, 4),
+                    'CrossFit '+str(aid), aid])
+    return out
@@ -1,7 +1,19 @@
+import asyncio
+import json
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
 import pytest
 import requests # HTTP library
 
 from . import TestCase
+from .mockserver import Mockserver
+from .synthetic import affiliate_info, all_affiliates
+from cfanalytics.core.affiliatelist import Affiliatelist
+from cfanalytics.core.retry import Retrypolicy
+from cfanalytics.core.cache import Responsecache
 
 
 class TestAffiliatelist(TestCase):    
@@ -17,4 +29,84 @@ class TestAffiliatelist(TestCase):
         expected = 40.3604
         response = requests.get(self.basepath+'/getAllAffiliates.php').json()
         actual = response[0][0]
-        assert expected == actual
\ No newline at end of file
+        assert expected == actual
+
+    def test_refresh(self):
+        asyncio.set_event_loop(asyncio.new_event_loop())
+        path = tempfile.mkdtemp()
+        with Mockserver(lastaid=150) as server:
+            Affiliatelist(path, url=server.url, lastaid=150)
+        saved = pd.read_pickle(path+'/Affiliate_list')
+        saved.loc[saved['Affiliate_id'] == 11, 'Affiliate_name'] = 'Old'
+        saved = saved[saved['Affiliate_id'] != 12]
+        saved.to_pickle(path+'/Affiliate_list')
+        with Mockserver(lastaid=180) as server:
+            a = Affiliatelist(path, url=server.url, download=False)
+            changelog = a.refresh()
+            # The changed, missing and new ids and getAllAffiliates.php
+            assert server.requests == 2 + 30 + 1
+        assert list(changelog.loc[changelog['Change'] == 'changed',
+                                  'Affiliate_id']) == [11]
+        assert changelog['Columns'][0] == 'Affiliate_name'
+        assert (changelog['Change'] == 'added').sum() == 28
+        saved = pd.read_pickle(path+'/Affiliate_list')
+        assert len(saved) == len(a.data) == 160
+        assert list(saved['Affiliate_id']) == sorted(saved['Affiliate_id'])
+        assert saved.loc[saved['Affiliate_id'] == 11,
+                         'Affiliate_name'].values[0] == 'CrossFit 11'
+        assert os.path.isfile(path+'/Affiliate_list_changelog.csv')
+
+
+    def test_out_of_order(self):
+        asyncio.set_event_loop(asyncio.new_event_loop())
+        retry = Retrypolicy(retries=5, base_delay=0.01)
+        # Jitter and retries bring the responses back in any order
+        with Mockserver(lastaid=250, jitter=0.02, error_rate=0.1,
+                        seed=1) as server:
+            path = tempfile.mkdtemp()
+            a = Affiliatelist(path, url=server.url, retry=retry,
+                              lastaid=250)
+            assert server.errors > 0
+        assert len(a.failed) == 0
+        assert list(a.data['Affiliate_id']) == \
+               [aid for aid in range(3, 251) if aid % 10 != 0]
+        assert (a.data['Affiliate_name'] == 'CrossFit '+\
+                a.data['Affiliate_id'].astype(str)).all()
+        # The indexes of the gyms are saved with them
+        assert os.path.isfile(path+'/Affiliate_list_spatial.npz')
+        assert os.path.isfile(path+'/Affiliate_list_names.json')
+
+
+    def test_offline_missing(self):
+        asyncio.set_event_loop(asyncio.new_event_loop())
+        path = tempfile.mkdtemp()
+        url = 'http://127.0.0.1:1'
+        cache = Responsecache(path+'/cache', offline=True)
+        cache.put(url+'/getAllAffiliates.php',
+                  json.dumps(all_affiliates(20)).encode())
+        for aid in range(3, 21):
+            if aid != 7:
+                cache.put(url+'/getAffiliateInfo',
+                          json.dumps(affiliate_info(aid)).encode(),
+                          {'aid': aid})
+        # A body which is not JSON
+        cache.put(url+'/getAffiliateInfo', b'<html>', {'aid': 8})
+        a = Affiliatelist(path, url=url, cache=cache, lastaid=20,
+                          retry=Retrypolicy(requeues=0))
+        # The ids which are not cached fail on their own
+        assert sorted(a.failed) == [7, 8]
+        assert 9 in list(a.data['Affiliate_id'])
+
+
+    def test_changed_aids(self):
+        a = Affiliatelist(tempfile.mkdtemp(), lastaid=6, download=False)
+        saved = pd.DataFrame({'Affiliate_id': [3, 4, 5],
+                              'Affiliate_name': ['A', 'B', 'C'],
+                              'Latitude': [1.0, np.nan, 2.0],
+                              'Longitude': [1.0, np.nan, 2.0]})
+        response = {'Affiliate_id': np.array([3, 4, 5]),
+                    'Affiliate_name': np.array(['A', 'B', 'C'], dtype=object),
+                    'Latitude': np.array([1.0, np.nan, 2.5]),
+                    'Longitude': np.array([1.0, np.nan, 2.0])}
+        # A location missing both times is not a change
+        assert a._changed_aids(saved, response) == [5]
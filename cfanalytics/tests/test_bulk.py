@@ -0,0 +1,28 @@
+import asyncio
+import tempfile
+from unittest import mock
+
+import pytest
+
+from . import TestCase
+from .mockserver import Mockserver
+from cfanalytics.core.bulk import Bulkdownload
+from cfanalytics.core.concurrency import Adaptivelimit
+
+
+class TestBulkdownload(TestCase):
+    def setUp(self):
+        asyncio.set_event_loop(asyncio.new_event_loop())
+
+
+    def test_failure(self):
+        limit = Adaptivelimit(initial=30)
+        with Mockserver(npages=20, nrows=10) as server:
+            b = Bulkdownload([2018], [1, 2], [0], tempfile.mkdtemp(),
+                             limit=limit, url=server.url, download=False)
+            with mock.patch('cfanalytics.core.cfopendata._parse_page',
+                            side_effect=RuntimeError('worker died')):
+                with pytest.raises(RuntimeError):
+                    asyncio.get_event_loop().run_until_complete(b.fetch())
+        # Every download stopped and gave its slots back
+        assert limit.inflight == 0
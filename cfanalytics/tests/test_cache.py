@@ -0,0 +1,51 @@
+import os
+import tempfile
+import time
+
+import pytest
+
+from . import TestCase
+from cfanalytics.core.cache import Responsecache, Cachemiss
+
+
+class TestResponsecache(TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.url = 'https://map.crossfit.com/getAffiliateInfo'
+
+
+    def test_get_put(self):
+        cache = Responsecache(self.path)
+        assert cache.get(self.url, {'aid': 3}) is None
+        cache.put(self.url, b'{"name": null}', {'aid': 3})
+        # Reopen the cache from disk
+        cache = Responsecache(self.path)
+        assert cache.get(self.url, {'aid': 3}) == b'{"name": null}'
+        assert cache.get(self.url, {'aid': 4}) is None
+
+
+    def test_ttl(self):
+        cache = Responsecache(self.path, ttl=60)
+        cache.put(self.url, b'{}', {'aid': 3})
+        fname = cache._fname(cache.key(self.url, {'aid': 3}))
+        os.utime(fname, (time.time(), time.time() - 120))
+        assert cache.get(self.url, {'aid': 3}) is None
+
+
+    def test_lru_eviction(self):
+        cache = Responsecache(self.path)
+        cache.put(self.url, b'x' * 1000, {'aid': 3})
+        cache.max_size = 2 * cache.size
+        time.sleep(0.01)
+        cache.put(self.url, b'y' * 1000, {'aid': 4})
+        time.sleep(0.01)
+        cache.get(self.url, {'aid': 3})
+        cache.put(self.url, b'z' * 1000, {'aid': 5})
+        assert cache.get(self.url, {'aid': 4}) is None
+        assert cache.get(self.url, {'aid': 3}) is not None
+
+
+    def test_offline(self):
+        cache = Responsecache(self.path, offline=True)
+        with pytest.raises(Cachemiss):
+            cache.get(self.url, {'aid': 3})
@@ -0,0 +1,27 @@
+import os
+import tempfile
+
+from . import TestCase
+from cfanalytics.core.checkpoint import Manifest
+
+
+class TestManifest(TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.dname = 'Men_Rx_2018_raw'
+
+
+    def test_resume(self):
+        manifest = Manifest(self.path, self.dname, 5)
+        for file_ in ['p1', 'p3']:
+            open(os.path.join(self.path, file_), 'w').close()
+        manifest.add([1, 2], 'p1')
+        manifest.add([3], 'p3')
+        manifest.add([4], 'p4') # File never written
+        manifest = Manifest(self.path, self.dname, 5)
+        assert manifest.missing() == [4, 5]
+        assert manifest.files() == [os.path.join(self.path, 'p1'),
+                                    os.path.join(self.path, 'p3')]
+        # The leaderboard grew so start again
+        manifest = Manifest(self.path, self.dname, 6)
+        assert manifest.missing() == [1, 2, 3, 4, 5, 6]
@@ -0,0 +1,44 @@
+import asyncio
+
+from . import TestCase
+from cfanalytics.core.concurrency import Adaptivelimit
+
+
+class TestAdaptivelimit(TestCase):
+    def setUp(self):
+        asyncio.set_event_loop(asyncio.new_event_loop())
+
+
+    async def _round(self, limit, latency, status=200):
+        n = limit.limit
+        for i in range(n):
+            await limit.acquire()
+        for i in range(n):
+            await limit.release(latency, status)
+
+
+    async def _adapt(self):
+        limit = Adaptivelimit(initial=4, maximum=20)
+        # Flat latency: slow start doubles the limit each round
+        await self._round(limit, 0.1)
+        assert limit.limit == 8
+        await self._round(limit, 0.1)
+        assert limit.limit == 16
+        # Throttled: back off once per round
+        await self._round(limit, 0.1, status=429)
+        assert limit.limit == 8
+        assert limit.nbackoffs == 1
+        # Latency rising: shrink
+        await self._round(limit, 1.0)
+        assert limit.limit == 7
+        # Latency flat again: grow by one each round
+        for i in range(3):
+            await self._round(limit, 0.1)
+        n = limit.limit
+        await self._round(limit, 0.1)
+        assert limit.limit == n + 1
+        return limit
+
+
+    def test_adapt(self):
+        asyncio.get_event_loop().run_until_complete(self._adapt())
@@ -0,0 +1,52 @@
+import asyncio
+import tempfile
+
+from . import TestCase
+from .mockserver import Mockserver
+from cfanalytics.core.cfopendata import Cfopendata
+from cfanalytics.core.dedup import Userindex
+
+
+def _drop_athlete(response):
+    del response['leaderboardRows'][3]
+
+
+def _add_athlete(response):
+    # An athlete of page 1 who moved down to page 2
+    row = dict(response['leaderboardRows'][0])
+    row['entrant'] = dict(row['entrant'], competitorId='100001')
+    response['leaderboardRows'].insert(0, row)
+
+
+class TestDedup(TestCase):
+    def setUp(self):
+        asyncio.set_event_loop(asyncio.new_event_loop())
+
+
+    def test_userindex(self):
+        users = Userindex()
+        users.add(1, ['a', 'b'], ['1', '2'])
+        users.add(2, ['b', 'c'], ['2', '4'])
+        assert users.duplicates() == 1
+        assert users.owner('b') == 2
+        assert users.keep(1, ['a', 'b']) == [True, False]
+        assert users.gaps() == [2]
+        # Ties skip ranks without a gap
+        users.add(3, ['d', 'e'], ['5', '5'])
+        users.add(4, ['f'], ['7'])
+        # A page fetched again replaces its athletes
+        users.add(2, ['x', 'c'], ['3', '4'])
+        assert users.duplicates() == 0
+        assert users.gaps() == []
+        assert len(users) == 7
+
+
+    def test_download(self):
+        with Mockserver(npages=4, nrows=10) as server:
+            server.edit(2018, 2, _add_athlete)
+            server.edit(2018, 3, _drop_athlete)
+            c = Cfopendata(2018, 1, 0, tempfile.mkdtemp(), url=server.url)
+            # The pages around the gap were fetched again
+            assert server.requests > 5
+        assert len(c.data) == 39
+        assert c.data['User_id'].is_unique
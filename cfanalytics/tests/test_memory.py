@@ -0,0 +1,49 @@
+import asyncio
+import os
+import tempfile
+
+import pandas as pd
+
+from . import TestCase
+from .mockserver import Mockserver
+from cfanalytics.core.cfopendata import Cfopendata
+from cfanalytics.core.memory import Memorymonitor
+
+
+class TestMemory(TestCase):
+    def setUp(self):
+        asyncio.set_event_loop(asyncio.new_event_loop())
+        self.path = tempfile.mkdtemp()
+        self.path2 = tempfile.mkdtemp()
+
+
+    def test_monitor(self):
+        monitor = Memorymonitor(interval=0.01)
+        with monitor.phase('download'):
+            data = bytearray(20 * 1024 ** 2)
+        assert monitor.peaks['download'] >= 20
+        assert 'download' in monitor.summary()
+        del data
+
+
+    def test_max_memory(self):
+        with Mockserver(npages=12, nrows=50) as server:
+            c = Cfopendata(2018, 1, 0, self.path, url=server.url)
+            # Far less than the download so it is streamed
+            m = Cfopendata(2018, 1, 0, self.path2, url=server.url,
+                           max_memory=0.1)
+        fname = '/Men_Rx_2018_raw'
+        assert len(m.data) == 0
+        assert not os.path.isfile(self.path2+fname)
+        with open(self.path+fname+'.csv') as f:
+            expected = f.read()
+        with open(self.path2+fname+'.csv') as f:
+            assert f.read() == expected
+        assert len(pd.read_csv(self.path2+fname+'.csv')) == len(c.data)
+        assert set(m.memory.peaks) == set(['plan', 'download', 'write'])
+        # The refresh reads the CSV file as there is no pickle
+        with Mockserver(npages=12, nrows=50) as server:
+            m = Cfopendata(2018, 1, 0, self.path2, url=server.url,
+                           download=False)
+            m.refresh()
+        assert len(m.data) == len(c.data)
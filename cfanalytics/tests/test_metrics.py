@@ -0,0 +1,44 @@
+import asyncio
+import json
+import tempfile
+
+from . import TestCase
+from .mockserver import Mockserver
+from cfanalytics.core.cfopendata import Cfopendata
+from cfanalytics.core.metrics import Downloadmetrics
+
+
+class TestMetrics(TestCase):
+    def setUp(self):
+        asyncio.set_event_loop(asyncio.new_event_loop())
+        self.path = tempfile.mkdtemp()
+
+
+    def test_summary(self):
+        events = []
+        metrics = Downloadmetrics(callback=events.append)
+        for latency in [0.001, 0.02, 0.02, 0.3]:
+            metrics.request(latency, 200, 100)
+        metrics.request(30.0, None)
+        metrics.retry()
+        s = metrics.summary()
+        assert s['requests'] == 5
+        assert s['status'] == {'200': 4, 'error': 1}
+        assert s['bytes'] == 400
+        assert s['latency']['p50'] == 0.025
+        assert s['latency']['max'] == 30.0
+        assert [e['event'] for e in events] == ['request'] * 5 + ['retry']
+
+
+    def test_download(self):
+        metrics = Downloadmetrics()
+        with Mockserver(npages=4, nrows=10, error_rate=0.2, seed=1) as server:
+            c = Cfopendata(2018, 1, 0, self.path, url=server.url,
+                           metrics=metrics)
+            requests = server.requests
+        s = metrics.summary()
+        assert s['requests'] == requests
+        assert s['status'].get('503', 0) == server.errors
+        assert s['pages'] == 4 and s['rows'] == len(c.data)
+        with open(self.path+'/Men_Rx_2018_raw_metrics.json') as f:
+            assert json.load(f)['pages'] == 4
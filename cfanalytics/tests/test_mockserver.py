@@ -0,0 +1,40 @@
+import asyncio
+import tempfile
+
+import numpy as np
+
+from . import TestCase
+from .mockserver import Mockserver
+from cfanalytics.core.cfopendata import Cfopendata
+from cfanalytics.core.affiliatelist import Affiliatelist
+from cfanalytics.core.retry import Retrypolicy
+
+
+class TestMockserver(TestCase):
+    def setUp(self):
+        # Other tests may have closed the event loop of the main thread
+        asyncio.set_event_loop(asyncio.new_event_loop())
+
+
+    def test_cfopendata(self):
+        retry = Retrypolicy(retries=5, base_delay=0.01, max_delay=0.05)
+        with Mockserver(npages=12, nrows=20, error_rate=0.1,
+                        seed=1) as server:
+            c = Cfopendata(2018, 2, 0, tempfile.mkdtemp(), retry=retry,
+                           url=server.url)
+        assert len(c.data) == 240
+        assert c.data['User_id'].is_unique
+        assert list(c.data['Overall_rank'][:2]) == ['1', '2']
+        assert server.errors > 0
+
+
+    def test_affiliatelist(self):
+        with Mockserver(lastaid=60) as server:
+            a = Affiliatelist(tempfile.mkdtemp(), url=server.url, lastaid=60)
+        # Every tenth affiliate id is unused
+        assert list(a.data['Affiliate_id'][:3]) == [3, 4, 5]
+        assert len(a.data) == 58 - 6
+        miami = a.data[a.data['Affiliate_id'] == 4]
+        assert miami['City'].values[0] == 'Miami'
+        assert a.data['Latitude'].dtype == float
+        assert not np.isnan(miami['Latitude'].values[0])
@@ -0,0 +1,38 @@
+import tempfile
+
+import pandas as pd
+
+from . import TestCase
+from cfanalytics.core.names import Nameindex, normalize_name
+
+
+class TestNameindex(TestCase):
+    def setUp(self):
+        self.df = pd.DataFrame(
+                [[3, 'CrossFit Miami', 'Miami', 'FL', 'United States'],
+                 [4, 'CrossFit Paulista', 'São Paulo', 'SP', 'Brazil'],
+                 [5, 'Iron Box', 'Sao Paulo ', 'SP', 'Brazil'],
+                 [6, 'Iron Box', 'Boston', 'MA', 'United States'],
+                 [7, 'CrossFit Beantown', 'boston', '', 'United States']],
+                columns=['Affiliate_id', 'Affiliate_name', 'City', 'State',
+                         'Country'])
+        self.path = tempfile.mkdtemp()
+
+
+    def test_normalize_name(self):
+        assert normalize_name(' São  Paulo ') == 'sao paulo'
+        assert normalize_name('Saint-Étienne') == 'saint etienne'
+        assert normalize_name(None) == ''
+
+
+    def test_lookups(self):
+        Nameindex(self.path).build(self.df).save()
+        index = Nameindex(self.path)
+        assert index.get('SAO PAULO') == [4, 5]
+        assert index.get('Boston') == [6, 7]
+        # Names can repeat
+        assert index.get('iron box', 'Affiliate_name') == [5, 6]
+        assert index.get('Chicago') == []
+        assert index.fuzzy('Bostn')[0][0] == 'Boston'
+        assert index.find('Sao Pualo') == ('São Paulo', [4, 5])
+        assert index.find('Chicago') == (None, [])
@@ -0,0 +1,71 @@
+import json
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pytest
+
+from . import TestCase
+from .synthetic import leaderboard_page, all_affiliates
+from cfanalytics.core.parse import (new_buffers, parse_leaderboard,
+                                    parse_payload, buffers_to_frame,
+                                    parse_all_affiliates)
+
+
+class TestParse(TestCase):
+    def setUp(self):
+        self.columns = ['User_id', 'Name', 'Height', 'Weight', 'Age',
+                        'Region_id', 'Region_name', 'Affiliate_id',
+                        'Overall_rank', 'Overall_score']
+
+
+    def test_parse_leaderboard_2018(self):
+        columns = self.columns + ['18.'+str(i)+'_'+k for i in range(6)
+                                  for k in ['rank', 'score']]
+        buffers = new_buffers(columns)
+        parse_leaderboard(leaderboard_page(2018, 1), 2018, 6, buffers)
+        parse_leaderboard(leaderboard_page(2018, 2), 2018, 6, buffers)
+        df = buffers_to_frame(buffers, columns)
+        assert len(df) == 100
+        assert df.loc[99, 'Overall_rank'] == '100'
+        assert df.loc[0, 'Name'] == 'Athlete 100001'
+        assert buffers['User_id'] == []
+
+
+    def test_parse_leaderboard_2017(self):
+        columns = self.columns + ['17.'+str(i)+'_'+k for i in range(5)
+                                  for k in ['rank', 'score']]
+        buffers = new_buffers(columns)
+        parse_leaderboard(leaderboard_page(2017, 3), 2017, 5, buffers)
+        df = buffers_to_frame(buffers, columns)
+        assert len(df) == 50
+        assert df.loc[0, 'Overall_rank'] == '101'
+        assert df.loc[0, '17.4_score'] == '101 reps'
+
+
+    def test_parse_payload_in_process(self):
+        columns = self.columns + ['18.'+str(i)+'_'+k for i in range(6)
+                                  for k in ['rank', 'score']]
+        payload = json.dumps(leaderboard_page(2018, 2)).encode('utf-8')
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            buffers = executor.submit(parse_payload, payload, 2018, 6,
+                                      columns).result()
+        assert len(buffers['User_id']) == 50
+        assert buffers['Overall_rank'][0] == '51'
+
+
+    def test_parse_all_affiliates(self):
+        response = all_affiliates(60)
+        response.append([None, '', 'São Paulo', 61])
+        payload = json.dumps(response, ensure_ascii=False).encode('utf-8')
+        # Rows and characters split across chunks
+        chunks = [payload[i:i+7] for i in range(0, len(payload), 7)]
+        for body in [[payload], chunks]:
+            columns = parse_all_affiliates(body)
+            assert list(columns['Affiliate_id']) == [r[3] for r in response]
+            assert columns['Latitude'].dtype == np.float64
+            assert columns['Latitude'][0] == response[0][0]
+            assert np.isnan(columns['Latitude'][-1])
+            assert np.isnan(columns['Longitude'][-1])
+            assert columns['Affiliate_name'][-1] == 'São Paulo'
+        with pytest.raises(ValueError):
+            parse_all_affiliates([payload[:-5]])
@@ -0,0 +1,75 @@
+import asyncio
+import json
+import tempfile
+from unittest import mock
+
+import pytest
+
+from . import TestCase
+from .mockserver import Mockserver
+from .synthetic import leaderboard_page
+from cfanalytics.core.affiliatelist import Affiliatelist
+from cfanalytics.core.cfopendata import Cfopendata
+from cfanalytics.core.concurrency import Adaptivelimit
+
+
+class TestPipeline(TestCase):
+    def setUp(self):
+        asyncio.set_event_loop(asyncio.new_event_loop())
+
+
+    def test_consume(self):
+        c = Cfopendata(2018, 1, 0, tempfile.mkdtemp(), download=False)
+        c.failed = {}
+        c.done = []
+
+        async def run():
+            queue = asyncio.Queue(maxsize=2)
+            consumer = asyncio.ensure_future(c._consume(queue))
+            for p in [2, 1]:
+                payload = json.dumps(leaderboard_page(2018, p, 3)).encode()
+                await queue.put((p, payload, True))
+            await queue.put((3, b'{"leaderboardRows": [{}]}', True))
+            await queue.put(None)
+            await consumer
+
+        asyncio.get_event_loop().run_until_complete(run())
+        assert c.done == [2, 1]
+        assert list(c.failed) == [3]
+        assert sorted(c.chunks) == [1, 2]
+        assert len(c.chunks[2]['User_id']) == 50
+        assert c.chunks[2]['Overall_rank'][0] == leaderboard_page(2018, 2, 3)[
+            'leaderboardRows'][0]['overallRank']
+
+
+    def test_fetch_in_running_loop(self):
+        path = tempfile.mkdtemp()
+        with Mockserver(npages=3, nrows=10, lastaid=150) as server:
+            async def run():
+                # e.g. in Jupyter, where a loop is already running
+                c = Cfopendata(2018, 1, 0, path, url=server.url,
+                               download=False)
+                a = Affiliatelist(path, url=server.url, lastaid=150,
+                                  download=False)
+                return await asyncio.gather(c.fetch(), a.fetch())
+
+            aioloop = asyncio.get_event_loop()
+            leaderboard, affiliates = aioloop.run_until_complete(run())
+        assert len(leaderboard) == 30
+        assert len(affiliates) > 0
+
+
+    def test_consumer_error(self):
+        path = tempfile.mkdtemp()
+        with Mockserver(npages=40, nrows=10) as server:
+            limit = Adaptivelimit(initial=20)
+            c = Cfopendata(2018, 1, 0, path, url=server.url, limit=limit,
+                           download=False)
+            # e.g. a process pool which lost a worker
+            with mock.patch('cfanalytics.core.cfopendata._parse_page',
+                            side_effect=RuntimeError('worker died')):
+                with pytest.raises(RuntimeError):
+                    asyncio.get_event_loop().run_until_complete(
+                            asyncio.wait_for(c.fetch(), 30))
+        # The cancelled requests gave their slots back
+        assert limit.inflight == 0
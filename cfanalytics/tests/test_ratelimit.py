@@ -0,0 +1,86 @@
+import asyncio
+import time
+
+from . import TestCase
+from cfanalytics.core.ratelimit import Ratelimiter
+
+
+class TestRatelimiter(TestCase):
+    def setUp(self):
+        asyncio.set_event_loop(asyncio.new_event_loop())
+        self.url = 'https://games.crossfit.com/competitions'
+
+
+    def test_rate(self):
+        limiter = Ratelimiter({'games.crossfit.com': 50}, burst=1)
+
+        async def run():
+            await asyncio.gather(*[limiter.acquire(self.url)
+                                   for i in range(11)])
+
+        start_time = time.time()
+        asyncio.get_event_loop().run_until_complete(run())
+        # The first token is there straight away, then one every 20 ms
+        assert time.time() - start_time >= 0.19
+        assert limiter.metrics()['games.crossfit.com']['granted'] == 11
+
+
+    def test_priority(self):
+        limiter = Ratelimiter({'games.crossfit.com': 100}, burst=1)
+        order = []
+
+        async def request(priority, i):
+            await limiter.acquire(self.url, priority)
+            order.append(i)
+
+        async def run():
+            await asyncio.gather(*[request(p, i) for i, p in
+                                   enumerate([5, 5, 1, 3, 1])])
+
+        asyncio.get_event_loop().run_until_complete(run())
+        # The first request finds a token, the rest wait in priority order
+        assert order == [0, 2, 4, 3, 1]
+
+
+    def test_throttled(self):
+        limiter = Ratelimiter()
+        assert not limiter.limited(self.url)
+        for i in range(20):
+            limiter.wait(self.url)
+        observed = limiter.metrics()['games.crossfit.com']['observed']
+        limiter.throttled(self.url, retry_after=0.05)
+        m = limiter.metrics()['games.crossfit.com']
+        # Just under the rate which tripped the server
+        assert m['rate'] < observed
+        assert m['throttled'] == 1
+        assert limiter.limited(self.url)
+
+
+    def test_throttled_after_unlimited(self):
+        limiter = Ratelimiter(slowdown=0.1)
+        for i in range(3000):
+            limiter.wait(self.url)
+        limiter.throttled(self.url, retry_after=0.05)
+        # The requests granted without a rate leave no debt behind the pause
+        start_time = time.time()
+        for i in range(5):
+            limiter.wait(self.url)
+        assert time.time() - start_time < 0.5
+        assert limiter.metrics()['games.crossfit.com']['granted'] == 3005
+
+
+    def test_no_growth_without_demand(self):
+        limiter = Ratelimiter()
+        for i in range(20):
+            limiter.wait(self.url)
+        limiter.throttled(self.url, retry_after=0.0)
+        bucket = limiter._bucket('games.crossfit.com')
+        rate = bucket.rate
+        # A minute of 2 requests a second, far under the rate
+        now = time.time()
+        for i in range(120):
+            bucket.take(now + 2 + i / 2.0, 0.0, limiter.increase)
+        assert bucket.rate == rate
+        # The next 429 starts from the requests actually made
+        limiter.throttled(self.url, retry_after=0.0)
+        assert bucket.rate < rate
@@ -0,0 +1,69 @@
+import asyncio
+import os
+import tempfile
+
+import pandas as pd
+
+from . import TestCase
+from .mockserver import Mockserver
+from cfanalytics.core.cfopendata import Cfopendata
+from cfanalytics.core.checkpoint import Pagestate
+
+
+def _new_score(response):
+    response['leaderboardRows'][0]['overallScore'] = '1'
+
+
+def _new_athlete(response):
+    row = dict(response['leaderboardRows'][-1])
+    row['entrant'] = dict(row['entrant'], competitorId='999999')
+    response['leaderboardRows'].append(row)
+
+
+class TestRefresh(TestCase):
+    def setUp(self):
+        asyncio.set_event_loop(asyncio.new_event_loop())
+        self.path = tempfile.mkdtemp()
+
+
+    def test_pagestate_priority(self):
+        state = Pagestate(self.path, 'Men_Rx_2018_raw')
+        for p in [1, 2, 3]:
+            state.update(p, b'a')
+        assert state.update(3, b'b')
+        assert not state.update(2, b'a')
+        state.save()
+        state = Pagestate(self.path, 'Men_Rx_2018_raw')
+        assert state.priority([1, 2, 3, 4]) == [4, 3, 1, 2]
+
+
+    def test_refresh(self):
+        with Mockserver(npages=5, nrows=10) as server:
+            Cfopendata(2018, 1, 0, self.path, url=server.url)
+            server.edit(2018, 2, _new_score)
+            server.edit(2018, 4, _new_athlete)
+            c = Cfopendata(2018, 1, 0, self.path, url=server.url,
+                           download=False)
+            changelog = c.refresh()
+            # The unchanged pages were not sent again
+            assert server.not_modified == 3
+        assert len(c.data) == 51
+        assert list(changelog['Change']) == ['changed', 'added']
+        assert changelog['Columns'][0] == 'Overall_score'
+        saved = pd.read_pickle(self.path+'/Men_Rx_2018_raw')
+        assert saved.loc[saved['User_id'] == '100011',
+                         'Overall_score'].values[0] == '1'
+        assert os.path.isfile(self.path+'/Men_Rx_2018_raw_changelog.csv')
+
+
+    def test_reparse(self):
+        archive = self.path+'/archive'
+        with Mockserver(npages=4, nrows=10) as server:
+            c = Cfopendata(2018, 1, 0, self.path, url=server.url,
+                           archive=archive)
+            requests = server.requests
+            r = Cfopendata(2018, 1, 0, self.path, archive=archive,
+                           download=False)
+            df = r.reparse()
+            assert server.requests == requests
+        assert df.equals(c.data)
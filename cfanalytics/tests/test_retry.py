@@ -0,0 +1,52 @@
+import asyncio
+import tempfile
+from unittest import mock
+
+from aiohttp import ClientResponseError
+import pytest
+import requests # HTTP library
+
+from . import TestCase
+from cfanalytics.core.retry import Retrypolicy
+from cfanalytics.core.cfopendata import Cfopendata
+from cfanalytics.core.ratelimit import Ratelimiter
+from .mockserver import Mockserver
+
+
+class TestRetrypolicy(TestCase):
+    def setUp(self):
+        self.retry = Retrypolicy(base_delay=1, max_delay=10)
+
+
+    def test_delay(self):
+        for attempt in range(10):
+            delay = self.retry.delay(attempt)
+            assert 0 <= delay <= min(10, 2 ** attempt)
+
+
+    def test_retryable(self):
+        def error(status):
+            return ClientResponseError(None, (), status=status)
+        assert self.retry.retryable(asyncio.TimeoutError())
+        assert self.retry.retryable(error(429))
+        assert self.retry.retryable(error(503))
+        assert not self.retry.retryable(error(404))
+        assert self.retry.describe(error(404)).startswith('HTTP 404')
+
+
+    def test_npages_connection_error(self):
+        retry = Retrypolicy(retries=2, base_delay=0.01)
+        with Mockserver(npages=7) as server:
+            c = Cfopendata(2018, 1, 0, tempfile.mkdtemp(), url=server.url,
+                           retry=retry, ratelimiter=Ratelimiter(),
+                           download=False)
+            page = requests.get(c.basepath, params=c._params(1))
+            # The first attempt can't connect, the second gets through
+            with mock.patch('cfanalytics.core.cfopendata.requests.get',
+                            side_effect=[requests.ConnectionError(), page]):
+                assert c._get_npages() == 7
+            assert c.metrics.retries == 1
+            with mock.patch('cfanalytics.core.cfopendata.requests.get',
+                            side_effect=requests.Timeout()):
+                with pytest.raises(requests.Timeout):
+                    c._get_npages()
@@ -0,0 +1,64 @@
+import asyncio
+import tempfile
+
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from . import TestCase
+from .mockserver import Mockserver
+from cfanalytics.core.cfopendata import Cfopendata
+from cfanalytics.core.session import Connectionpool, Http2pool
+
+
+class TestConnectionpool(TestCase):
+    def setUp(self):
+        asyncio.set_event_loop(asyncio.new_event_loop())
+        self.npages = 20
+
+
+    async def _download(self, pool):
+        async def handler(request):
+            return web.json_response({'page': request.query['page']})
+        app = web.Application()
+        app.router.add_get('/', handler)
+        async with TestServer(app) as server:
+            for batch in range(2):
+                pool.new_batch()
+                session = pool.get_session()
+                for p in range(self.npages):
+                    async with session.get(server.make_url('/'),
+                                           params={'page': p}) as response:
+                        await response.json()
+            await pool.close()
+
+
+    def test_connection_reuse(self):
+        pool = Connectionpool(limit=1)
+        asyncio.get_event_loop().run_until_complete(self._download(pool))
+        assert len(pool.batches) == 3
+        assert pool.batches[1]['requests'] == self.npages
+        assert pool.batches[1]['new_connections'] == 1
+        # The second batch only reuses the connection of the first batch
+        assert pool.batches[2]['new_connections'] == 0
+        assert pool.batches[2]['reused_connections'] == self.npages
+
+
+class TestHttp2pool(TestCase):
+    def setUp(self):
+        pytest.importorskip('httpx')
+        pytest.importorskip('h2')
+        asyncio.set_event_loop(asyncio.new_event_loop())
+        self.path = tempfile.mkdtemp()
+
+
+    def test_multiplexing(self):
+        with Mockserver(npages=20, nrows=10, http2=True) as server:
+            pool = Http2pool(prior_knowledge=True)
+            c = Cfopendata(2018, 1, 0, self.path, url=server.url, pool=pool)
+            connections = server.connections
+        assert len(c.data) == 200
+        # Every page went over one connection
+        assert connections == 1
+        assert pool.batches[0]['http2_requests'] == pool.batches[0]['requests']
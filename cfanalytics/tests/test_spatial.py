@@ -0,0 +1,53 @@
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from . import TestCase
+from cfanalytics.core.spatial import Gymindex
+
+
+def _haversine(lat, lon, lats, lons):
+    lat, lon, lats, lons = map(np.radians, (lat, lon, lats, lons))
+    a = np.sin((lats - lat) / 2) ** 2 + \
+        np.cos(lat) * np.cos(lats) * np.sin((lons - lon) / 2) ** 2
+    return 2 * 6371.0088 * np.arcsin(np.sqrt(a))
+
+
+class TestGymindex(TestCase):
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        n = 2000
+        self.lats = np.degrees(np.arcsin(rng.uniform(-1, 1, n)))
+        self.lons = rng.uniform(-180, 180, n)
+        # A city with many gyms
+        self.lats[:500] = 25.76 + rng.normal(0, 0.2, 500)
+        self.lons[:500] = -80.19 + rng.normal(0, 0.2, 500)
+        self.df = pd.DataFrame({'Affiliate_id': np.arange(n) + 3,
+                                'Latitude': self.lats.astype(object),
+                                'Longitude': self.lons.astype(object)})
+        # Affiliates without a location
+        self.df.loc[0, 'Latitude'] = ''
+        self.df.loc[1, 'Longitude'] = np.nan
+        self.path = tempfile.mkdtemp()
+
+
+    def test_queries(self):
+        Gymindex(self.path).build(self.df).save()
+        index = Gymindex(self.path)
+        assert len(index) == len(self.df) - 2
+        for lat, lon in [(25.76, -80.19), (0.0, 179.9), (-89.9, 10.0)]:
+            km = _haversine(lat, lon, self.lats, self.lons)
+            km[:2] = np.inf
+            aids, dist = index.within(lat, lon, 25)
+            assert set(aids) == set(np.nonzero(km <= 25)[0] + 3)
+            assert np.allclose(dist, np.sort(km[km <= 25]))
+            aids, dist = index.nearest(lat, lon, k=5)
+            assert list(aids) == list(np.argsort(km)[:5] + 3)
+            assert np.allclose(dist, np.sort(km)[:5])
+
+
+    def test_empty(self):
+        index = Gymindex(self.path).build(self.df.iloc[:0])
+        assert len(index.within(0, 0, 100)[0]) == 0
+        assert len(index.nearest(0, 0, 3)[0]) == 0
@@ -0,0 +1,51 @@
+import os
+import tempfile
+
+from . import TestCase
+from cfanalytics.core.spill import Spill
+from cfanalytics.core.archive import Rawarchive
+
+
+class TestSpill(TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.columns = ['User_id', 'Overall_rank']
+
+
+    def _chunk(self, page):
+        return {'User_id': [str(100 + 2 * page), str(101 + 2 * page)],
+                'Overall_rank': [str(2 * page - 1), str(2 * page)]}
+
+
+    def test_page_order(self):
+        spill = Spill(self.path, 'Men_Rx_2018_raw')
+        for page in [3, 1, 2]:
+            spill.append(page, self._chunk(page))
+        # A page downloaded again replaces the first record
+        spill.append(1, self._chunk(1))
+        df = Spill(self.path, 'Men_Rx_2018_raw').read(self.columns)
+        assert list(df['Overall_rank']) == ['1', '2', '3', '4', '5', '6']
+
+
+    def test_truncated_record(self):
+        spill = Spill(self.path, 'Men_Rx_2018_raw')
+        spill.append(1, self._chunk(1))
+        spill.append(2, self._chunk(2))
+        size = os.path.getsize(spill.fname)
+        # Crash while writing page 2
+        with open(spill.fname, 'r+b') as f:
+            f.truncate(size - 5)
+        spill = Spill(self.path, 'Men_Rx_2018_raw')
+        assert spill.keys() == [1]
+        spill.append(2, self._chunk(2))
+        assert len(Spill(self.path, 'Men_Rx_2018_raw').read(
+                self.columns)) == 4
+
+
+    def test_archive(self):
+        archive = Rawarchive(self.path, 'Men_Rx_2018_raw')
+        for page in [2, 1]:
+            archive.append(page, b'{"page": '+str(page).encode()+b'}')
+        archive = Rawarchive(self.path, 'Men_Rx_2018_raw')
+        assert archive.page(2) == b'{"page": 2}'
+        assert [k for k, payload in archive.chunks()] == [1, 2]
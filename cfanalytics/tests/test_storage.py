@@ -0,0 +1,70 @@
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from . import TestCase
+from cfanalytics.core.cfplot import Cfplot
+from cfanalytics.core.storage import (parse_dname, leaderboard_path,
+                                      read_leaderboard, write_leaderboard,
+                                      read_affiliates, write_affiliates)
+
+pytest.importorskip('pyarrow')
+
+
+class TestStorage(TestCase):
+    def setUp(self):
+        self.store = tempfile.mkdtemp()
+        self.df = pd.DataFrame({'Name': ['A', 'B', 'C'],
+                                'Region_id': [5, 6, ''],
+                                '18.1_score': [pd.Timedelta(minutes=9), 150,
+                                               ''],
+                                'Overall_rank': [1, 2, 3]}, dtype=object)
+
+
+    def test_parse_dname(self):
+        assert parse_dname('Data/Men_45-49_Rx_2018_raw') == \
+               {'stage': 'raw', 'year': 2018, 'division': 'Men_45-49',
+                'scaled': 'Rx'}
+        assert parse_dname('Women_Sc_2017')['stage'] == 'clean'
+
+
+    def test_roundtrip(self):
+        write_leaderboard(self.df, self.store, 'Men_Rx_2018_raw')
+        write_leaderboard(self.df.iloc[:1], self.store, 'Women_Rx_2018_raw')
+        assert os.path.isfile(leaderboard_path(self.store, 'Men_Rx_2018_raw'))
+        df = read_leaderboard(self.store, 'Men_Rx_2018_raw')
+        assert len(df) == 3
+        assert list(df['Name']) == ['A', 'B', 'C']
+        # '' in a numeric column is stored as NaN
+        assert np.isnan(df['Region_id'].values[2])
+        assert df['18.1_score'].values[1] == '150'
+
+
+    def test_projection_and_filter(self):
+        write_leaderboard(self.df, self.store, 'Men_Rx_2018')
+        df = read_leaderboard(self.store, 'Men_Rx_2018',
+                              columns=['Region_id', 'Overall_rank'],
+                              filters=[('Region_id', 'in', [6])])
+        assert list(df.columns) == ['Region_id', 'Overall_rank']
+        assert list(df['Overall_rank']) == [2]
+
+
+    def test_affiliates(self):
+        write_affiliates(pd.DataFrame({'Affiliate_id': [1, 2],
+                                       'City': ['Miami', 'Boston']}),
+                         self.store)
+        df = read_affiliates(self.store, filters=[('City', '==', 'Miami')])
+        assert list(df['Affiliate_id']) == [1]
+
+
+    def test_cfplot_df(self):
+        write_leaderboard(self.df, self.store, 'Men_Rx_2018')
+        path = tempfile.mkdtemp()+'/Data/Men_Rx_2018'
+        p = Cfplot(path, store=self.store)
+        # Read from the store when it is first needed
+        assert list(p.df['Name']) == ['A', 'B', 'C']
+        p._load(['Overall_rank'], [('Overall_rank', '==', 2)])
+        assert list(p.df.columns) == ['Overall_rank']
@@ -9,4 +9,5 @@ setup(name='cfanalytics',
       url='https://github.com/raybellwaves/cfanalytics',
       packages=find_packages(),
       install_requires=['requests', 'aiohttp', 'pandas', 'numpy', 'xarray'],
+      extras_require={'parquet': ['pyarrow'], 'http2': ['httpx[http2]']},
       python_requires='>=3.6')